@@ -0,0 +1,77 @@
+"""
+Micro-benchmark: countsheet ingestion from xlsx vs CSV / gzipped CSV.
+
+The same synthetic countsheet is written as .xlsx, .csv and .csv.gz and
+read through iter_countsheet (filter + projection included). The records
+from the text files are checked against the xlsx ones; Manu Date is
+compared by quarter, since date strings in the xlsx become real dates
+when read from text.
+
+Usage:
+    python benchmarks/bench_csv.py [--rows 200000] [--data-dir DIR]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quarters import QuarterBucketer
+from sheet_readers import RECORD_FIELDS, iter_countsheet
+from synthetic import build_countsheet, build_countsheet_text
+
+
+MANU_DATE = RECORD_FIELDS.index('Manu Date')
+
+
+def read(path):
+    start = time.perf_counter()
+    records = list(iter_countsheet(path))
+    return records, time.perf_counter() - start
+
+
+def comparable(records, bucketer):
+    for record in records:
+        record = list(record)
+        record[MANU_DATE] = bucketer.quarter(record[MANU_DATE])
+        yield record
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--data-dir', default=None,
+                        help="keep the generated countsheets here between runs")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='bench_csv_')
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {}
+    for ext in ('xlsx', 'csv', 'csv.gz'):
+        path = paths[ext] = os.path.join(data_dir, f'countsheet_{args.rows}.{ext}')
+        if not os.path.exists(path):
+            print(f"  generating {path}...")
+            if ext == 'xlsx':
+                build_countsheet(path, args.rows)
+            else:
+                build_countsheet_text(path, args.rows)
+
+    print(f"{args.rows:,} countsheet rows")
+    print(f"{'format':<8} {'MB':>7} {'rows/s':>10} {'read s':>7} {'speedup':>8} {'records':>8}  same")
+    bucketer = QuarterBucketer()
+    baseline = None
+    for ext, path in paths.items():
+        records, elapsed = read(path)
+        if baseline is None:
+            baseline = (elapsed, list(comparable(records, bucketer)))
+            same = '-'
+        else:
+            same = 'yes' if list(comparable(records, bucketer)) == baseline[1] else 'NO'
+        print(f"{ext:<8} {os.path.getsize(path) / 2**20:>7.1f} {args.rows / elapsed:>10,.0f} "
+              f"{elapsed:>7.2f} {baseline[0] / elapsed:>7.1f}x {len(records):>8,}  {same}")
+
+
+if __name__ == '__main__':
+    main()
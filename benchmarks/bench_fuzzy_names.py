@@ -0,0 +1,118 @@
+"""
+Benchmark: approximate distributor-name matching in MasterIndex.
+
+Builds an in-memory index of a 40k-row master spread over a few anchor
+codes (so each anchor has thousands of names), then looks up names that
+miss the exact key: re-punctuated, re-spaced, legal form spelled out,
+one letter dropped or doubled. Reports how many resolve to the right
+row, how many to a wrong one, the latency per fuzzy lookup, and how
+many names absent from the master are wrongly accepted.
+
+Usage:
+    python benchmarks/bench_fuzzy_names.py [--distributors 40000] [--anchors 20] [--queries 2000] [--threshold 0.8]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fuzzy_names
+from master_index import MasterIndex, normalize_code, normalize_name
+
+FIRST = ('Shree', 'Sri', 'New', 'Royal', 'Maa', 'Jai', 'Om', 'Balaji', 'Ganesh', 'Krishna',
+         'Laxmi', 'Sai', 'Durga', 'Hari', 'Shiv', 'Raj', 'Anand', 'Kumar', 'Sharma', 'Gupta',
+         'Verma', 'Patel', 'Shah', 'Mehta', 'Jain', 'Agarwal', 'Reddy', 'Rao', 'Singh', 'Das')
+TRADE = ('Traders', 'Distributors', 'Agencies', 'Enterprises', 'Marketing', 'Sales',
+         'Associates', 'Stores', 'Suppliers', 'Corporation')
+FORM = ('', ' Pvt Ltd', ' Private Limited', ' & Co', ' and Sons', ' LLP')
+HEADERS = ['Audit Std Serial No', 'Anchor Code', 'Distributor Name', 'Region']
+
+
+def distributor_names(count, rng):
+    names = set()
+    while len(names) < count:
+        name = f"{rng.choice(FIRST)} {rng.choice(FIRST)} {rng.choice(TRADE)}"
+        if rng.random() < 0.3:
+            name += f" {rng.randint(1, 9)}"
+        names.add(name + rng.choice(FORM))
+    return sorted(names)
+
+
+def variant(name, rng):
+    """A realistic miskeying of name that is no longer an exact match"""
+    choice = rng.randrange(5)
+    if choice == 0:
+        return name.replace(' Pvt Ltd', ' Pvt. Ltd.').replace(' & Co', ' & Co.') + '.'
+    if choice == 1:
+        return name.replace(' ', '  ', 1) + ','
+    if choice == 2:
+        return (name.replace('Private Limited', 'Pvt Ltd').replace('Pvt Ltd', 'Private Limited')
+                .replace(' and ', ' & ') + ' ')[:-1] + '.'
+    letters = [i for i, ch in enumerate(name) if ch.isalpha()]
+    i = rng.choice(letters[2:])
+    if choice == 3:
+        return name[:i] + name[i + 1:]
+    return name[:i] + name[i] + name[i:]
+
+
+def build_index(count, anchors, rng):
+    names = distributor_names(count, rng)
+    entries, rows = {}, []
+    for n, name in enumerate(names):
+        row = (f"SER{n}", 5000 + n % anchors, name, 'North')
+        rows.append(row)
+        entries.setdefault((normalize_code(row[1]), normalize_name(name)), (n + 1, row))
+    return MasterIndex(HEADERS, 1, 2, entries, None), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--distributors', type=int, default=40000)
+    parser.add_argument('--anchors', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--threshold', default=str(fuzzy_names.DEFAULT_FUZZY_THRESHOLD))
+    args = parser.parse_args()
+    fuzzy_names.set_fuzzy_threshold(args.threshold)
+    rng = random.Random(0)
+
+    index, rows = build_index(args.distributors, args.anchors, rng)
+    queries = []
+    while len(queries) < args.queries:
+        row = rng.choice(rows)
+        name = variant(row[2], rng)
+        if normalize_name(name) != normalize_name(row[2]):
+            queries.append((row[1], name, row[0]))
+    outsiders = [(rng.choice(rows)[1], f"{rng.choice(FIRST)} Unlisted {rng.choice(TRADE)}")
+                 for _ in range(args.queries // 4)]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for code in {code for code, _, _ in queries}:
+            index.fuzzy_find(normalize_code(code), 'warm up')
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        results = [index.lookup(code, name) for code, name, _ in queries]
+        elapsed = time.perf_counter() - start
+        accepted_outsiders = sum(bool(index.lookup(code, name)) for code, name in outsiders)
+
+    right = sum(r.get('audit_std_serial_no') == serial for r, (_, _, serial) in zip(results, queries))
+    wrong = sum(bool(r) and r.get('audit_std_serial_no') != serial
+                for r, (_, _, serial) in zip(results, queries))
+    print(f"{args.distributors:,} names over {args.anchors} anchor codes "
+          f"(~{args.distributors // args.anchors:,} per anchor), "
+          f"threshold {fuzzy_names.FUZZY_THRESHOLD}")
+    print(f"trigram indexes for {args.anchors} anchors built in {build:.2f}s")
+    print(f"{len(queries):,} miskeyed names: {right:,} matched correctly, {wrong} wrongly, "
+          f"{len(queries) - right - wrong} not matched")
+    print(f"{elapsed / len(queries) * 1e3:.3f} ms per fuzzy lookup")
+    print(f"{accepted_outsiders} of {len(outsiders)} names absent from the master accepted")
+    return 1 if wrong or accepted_outsiders else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Benchmark: master lookups from the SQLite master store vs the pickled MasterIndex.
+
+Imports a synthetic master into a fresh store, checks that every
+distributor resolves to the same row as with MasterIndex, then times
+opening each backend, single lookups and a batch lookup of many
+distributors (one lookup_many query vs one lookup per distributor).
+
+Usage:
+    python benchmarks/bench_master_store.py [--distributors 40000] [--batch 5000] [--data-dir DIR]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import master_store
+from master_index import MasterIndex
+from master_store import MasterStore
+from synthetic import build_master, distributor_code, distributor_name
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--distributors', type=int, default=40000, help="rows of the master")
+    parser.add_argument('--batch', type=int, default=5000,
+                        help="distributors looked up together (as with --split)")
+    parser.add_argument('--data-dir', default=None,
+                        help="keep the generated master here between runs")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='bench_master_store_')
+    os.makedirs(data_dir, exist_ok=True)
+    master = os.path.join(data_dir, f'master_{args.distributors}.xlsx')
+    if not os.path.exists(master):
+        print(f"  generating {master}...")
+        build_master(master, args.distributors)
+    db = os.path.join(data_dir, 'master.sqlite')
+    if os.path.exists(db):
+        os.remove(db)
+
+    with MasterStore(db) as store:
+        (snapshot, _), elapsed = timed(store.import_master, master)
+    print(f"import: {snapshot['rows']:,} rows in {elapsed:.2f}s, "
+          f"store {os.path.getsize(db) / 2**20:.1f} MB")
+
+    cache_dir = os.path.join(data_dir, 'cache')
+    index, build_s = timed(MasterIndex.build, master)
+    index.save(MasterIndex.cache_path(master, cache_dir))
+    _, cached_s = timed(MasterIndex.load, master, cache_dir)
+    stored, open_s = timed(master_store.load_index, db)
+    print(f"\n{'open':<26} {'seconds':>8}")
+    print(f"{'MasterIndex (parse)':<26} {build_s:>8.3f}")
+    print(f"{'MasterIndex (cached)':<26} {cached_s:>8.3f}")
+    print(f"{'master store':<26} {open_s:>8.3f}")
+
+    keys = [(distributor_code(d), distributor_name(d).upper() + ' ')
+            for d in range(args.distributors)]
+    keys.append(('missing', 'nobody'))
+    mismatches = sum(index.lookup(*key) != stored.lookup(*key) for key in keys)
+    print(f"\nrows differing from MasterIndex: {mismatches} of {len(keys):,}")
+
+    sample = random.Random(0).sample(keys, min(args.batch, len(keys)))
+    print(f"\n{'lookups of ' + format(len(sample), ',') + ' distributors':<34} {'total s':>8} "
+          f"{'us each':>8}")
+    for label, fn in (('MasterIndex.lookup', lambda: [index.lookup(*k) for k in sample]),
+                      ('store lookup (one query each)', lambda: [stored.lookup(*k) for k in sample]),
+                      ('store lookup_many (one query)', lambda: stored.lookup_many(sample))):
+        _, elapsed = timed(fn)
+        print(f"{label:<34} {elapsed:>8.3f} {elapsed / len(sample) * 1e6:>8.1f}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+End-to-end benchmark: process_audit_report on synthetic countsheets.
+
+Each scale runs in a fresh Python process so its peak RSS is its own.
+Wall time, time per progress phase and peak RSS are written to a JSON
+results file; pass a previous results file with --compare to see deltas.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--scales 1000 10000 100000 1000000]
+        [--out results.json] [--compare previous.json] [--data-dir DIR]
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import openpyxl
+
+from synthetic import build_countsheet, build_master, build_template
+
+
+DEFAULT_SCALES = (1000, 10000, 100000)
+DISTRIBUTORS = 1
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def prepare_inputs(data_dir, rows):
+    """Synthetic inputs for one scale, reused if they already exist"""
+    template = os.path.join(data_dir, 'template.xlsx')
+    master = os.path.join(data_dir, 'master.xlsx')
+    countsheet = os.path.join(data_dir, f'countsheet_{rows}.xlsx')
+    if not os.path.exists(template):
+        build_template(template)
+    if not os.path.exists(master):
+        build_master(master, DISTRIBUTORS)
+    if not os.path.exists(countsheet):
+        print(f"  generating {rows:,} row countsheet...")
+        build_countsheet(countsheet, rows, DISTRIBUTORS)
+    return countsheet, template, master
+
+
+class PhaseClock:
+    """progress() callback that times each phase from its first event to the next phase"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.current = 'Preparing'
+        self.since = self.start
+        self.phases = {}
+
+    def __call__(self, phase, done, total):
+        if phase != self.current:
+            self._close(time.perf_counter())
+            self.current = phase
+
+    def _close(self, now):
+        self.phases[self.current] = round(self.phases.get(self.current, 0) + now - self.since, 3)
+        self.since = now
+
+    def stop(self):
+        now = time.perf_counter()
+        self._close(now)
+        return round(now - self.start, 3)
+
+
+def run_scale(args):
+    """Child process: run the pipeline once and write the measurement as JSON"""
+    import report_engine
+
+    output = os.path.join(args.data_dir, f'report_{args.rows}.xlsx')
+    clock = PhaseClock()
+    kwargs = {'progress': clock, 'cache_dir': os.path.join(args.data_dir, 'cache')}
+    if args.stream_threshold is not None:
+        kwargs['stream_threshold'] = args.stream_threshold
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        summary = report_engine.process_audit_report(
+            args.countsheet, args.template, args.master, output, **kwargs)
+    wall = clock.stop()
+
+    result = {
+        'rows': args.rows,
+        'valid_rows': summary['rows'],
+        'matched': summary['matched'],
+        'wall_s': wall,
+        'rows_per_s': round(summary['rows'] / wall) if wall else None,
+        'phases_s': clock.phases,
+        'peak_rss_mb': peak_rss_mb(),
+        'output_mb': round(os.path.getsize(output) / 2**20, 2),
+    }
+    with open(args.result, 'w') as f:
+        json.dump(result, f)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(rows, data_dir, stream_threshold):
+    countsheet, template, master = prepare_inputs(data_dir, rows)
+    result_file = os.path.join(data_dir, f'result_{rows}.json')
+    cmd = [sys.executable, os.path.abspath(__file__), '--child',
+           '--rows', str(rows), '--countsheet', countsheet, '--template', template,
+           '--master', master, '--data-dir', data_dir, '--result', result_file]
+    if stream_threshold is not None:
+        cmd += ['--stream-threshold', str(stream_threshold)]
+    subprocess.run(cmd, check=True)
+    with open(result_file) as f:
+        return json.load(f)
+
+
+def print_results(results, previous=None):
+    before = {r['rows']: r for r in (previous or {}).get('results', [])}
+    print(f"{'rows':>9} {'valid':>9} {'wall s':>9} {'rows/s':>8} {'rss MB':>8}  phases")
+    for r in results:
+        phases = ', '.join(f"{name} {secs:.1f}s" for name, secs in r['phases_s'].items())
+        line = (f"{r['rows']:>9,} {r['valid_rows']:>9,} {r['wall_s']:>9.2f} "
+                f"{r['rows_per_s'] or 0:>8,} {r['peak_rss_mb'] or 0:>8.1f}  {phases}")
+        old = before.get(r['rows'])
+        if old:
+            line += f"\n{'':>19} {_delta(old['wall_s'], r['wall_s']):>9} {'':>8} "
+            line += f"{_delta(old['peak_rss_mb'], r['peak_rss_mb']):>8}  vs {previous['meta'].get('revision')}"
+        print(line)
+
+
+def _delta(old, new):
+    if not old or new is None:
+        return ''
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES),
+                        help='countsheet row counts to run')
+    parser.add_argument('--out', default='bench_results.json', help='results file to write')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    parser.add_argument('--data-dir', help='keep generated inputs here and reuse them')
+    parser.add_argument('--stream-threshold', type=int,
+                        help='override report_engine.STREAM_ROW_THRESHOLD')
+    parser.add_argument('--xlsx-writer', choices=('openpyxl', 'native'),
+                        help='report writer backend (default: $TNBT_XLSX_WRITER or openpyxl)')
+    # Internal: one measurement in a fresh process
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    for name in ('--rows', '--countsheet', '--template', '--master', '--result'):
+        parser.add_argument(name, type=int if name == '--rows' else str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_scale(args)
+        return
+
+    if args.xlsx_writer:
+        os.environ['TNBT_XLSX_WRITER'] = args.xlsx_writer  # inherited by the child runs
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    with contextlib.ExitStack() as stack:
+        data_dir = args.data_dir or stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(data_dir, exist_ok=True)
+        results = []
+        for rows in args.scales:
+            print(f"Running {rows:,} rows...")
+            results.append(measure(rows, data_dir, args.stream_threshold))
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'openpyxl': openpyxl.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'stream_threshold': args.stream_threshold,
+            'xlsx_writer': os.environ.get('TNBT_XLSX_WRITER', 'openpyxl'),
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print()
+    print_results(results, previous)
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark: manufacturing-quarter bucketing throughput.
+
+Compares the previous calculate_quarter (strptime per format, per row)
+with QuarterBucketer on a mix of datetimes, repeated date strings in
+each supported format, Excel serial numbers and blanks.
+
+Usage:
+    python benchmarks/bench_quarters.py [--rows 500000]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quarters import QuarterBucketer
+
+
+def legacy_quarter(manufacturing_date):
+    """The previous implementation, minus its error print"""
+    if not manufacturing_date:
+        return None
+    if isinstance(manufacturing_date, str):
+        for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']:
+            try:
+                manufacturing_date = datetime.datetime.strptime(manufacturing_date, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    if isinstance(manufacturing_date, datetime.datetime):
+        month = manufacturing_date.month
+        year = manufacturing_date.year
+        if month >= 4:
+            fiscal_year = f"{str(year)[-2:]}-{str(year+1)[-2:]}"
+        else:
+            fiscal_year = f"{str(year-1)[-2:]}-{str(year)[-2:]}"
+        if month in [4, 5, 6]:
+            quarter = "Q1"
+        elif month in [7, 8, 9]:
+            quarter = "Q2"
+        elif month in [10, 11, 12]:
+            quarter = "Q3"
+        else:
+            quarter = "Q4"
+        return f"{quarter} FY {fiscal_year}"
+    return None
+
+
+def sample_dates(rows, seed=0):
+    """Manu Date cells roughly as they show up in countsheets"""
+    rnd = random.Random(seed)
+    days = [datetime.datetime(2022, 1, 1) + datetime.timedelta(days=d) for d in range(900)]
+    values = []
+    for _ in range(rows):
+        day = rnd.choice(days)
+        kind = rnd.random()
+        if kind < 0.4:
+            values.append(day)
+        elif kind < 0.55:
+            values.append(day.strftime('%d/%m/%Y'))
+        elif kind < 0.7:
+            values.append(day.strftime('%Y-%m-%d'))
+        elif kind < 0.85:
+            values.append(day.strftime('%d-%m-%Y'))
+        elif kind < 0.95:
+            values.append((day - datetime.datetime(1899, 12, 30)).days)  # Excel serial
+        else:
+            values.append(None)
+    return values
+
+
+def run(name, bucket, values):
+    start = time.perf_counter()
+    labels = [bucket(value) for value in values]
+    elapsed = time.perf_counter() - start
+    dropped = sum(1 for value, label in zip(values, labels) if value and label is None)
+    print(f"{name:<22} {len(values) / elapsed:>12,.0f} {elapsed:>8.2f} {dropped:>8,}")
+    return labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500000)
+    args = parser.parse_args()
+
+    values = sample_dates(args.rows)
+    print(f"{'approach':<22} {'rows/s':>12} {'total s':>8} {'dropped':>8}")
+    legacy = run('legacy', legacy_quarter, values)
+    current = run('QuarterBucketer', QuarterBucketer().quarter, values)
+
+    mismatches = sum(1 for old, new in zip(legacy, current) if old is not None and old != new)
+    print(f"\nLabels differing where the legacy code had one: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: native xlsx reader vs openpyxl read-only.
+
+Times iter_countsheet on a synthetic countsheet and MasterIndex.build on
+a synthetic master with each backend. That both return the same values
+is checked by tests/test_xlsx_reader.py.
+
+Usage:
+    python benchmarks/bench_xlsx_reader.py [--rows 100000] [--data-dir DIR]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sheet_readers
+from master_index import MasterIndex
+from sheet_readers import iter_countsheet
+from synthetic import build_countsheet, build_master
+
+
+def read_records(path, reader):
+    sheet_readers.set_xlsx_reader(reader)
+    start = time.perf_counter()
+    records = list(iter_countsheet(path))
+    return records, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--distributors', type=int, default=40000,
+                        help="rows of the synthetic master")
+    parser.add_argument('--data-dir', default=None,
+                        help="keep the generated workbooks here between runs")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='bench_xlsx_reader_')
+    os.makedirs(data_dir, exist_ok=True)
+    countsheet = os.path.join(data_dir, f'countsheet_{args.rows}.xlsx')
+    master = os.path.join(data_dir, f'master_{args.distributors}.xlsx')
+    for path, build in ((countsheet, lambda p: build_countsheet(p, args.rows)),
+                        (master, lambda p: build_master(p, args.distributors))):
+        if not os.path.exists(path):
+            print(f"  generating {path}...")
+            build(path)
+
+    print(f"{args.rows:,} countsheet rows through iter_countsheet")
+    print(f"{'reader':<9} {'rows/s':>10} {'read s':>7} {'speedup':>8}")
+    baseline = None
+    for reader in sheet_readers.XLSX_READERS:
+        _, elapsed = read_records(countsheet, reader)
+        baseline = baseline or elapsed
+        print(f"{reader:<9} {args.rows / elapsed:>10,.0f} {elapsed:>7.2f} {baseline / elapsed:>7.1f}x")
+
+    print(f"\n{args.distributors:,} row master through MasterIndex.build")
+    baseline = None
+    for reader in sheet_readers.XLSX_READERS:
+        sheet_readers.set_xlsx_reader(reader)
+        start = time.perf_counter()
+        MasterIndex.build(master)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{reader:<9} {'':>10} {elapsed:>7.2f} {baseline / elapsed:>7.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Benchmark: native xlsx report writer vs openpyxl streaming.
+
+Times a report built with each writer (single pass, write-only streaming
+for openpyxl) and compares the output sizes. That both write the same
+workbook is checked by tests/test_xlsx_writer.py; peak memory per writer
+is what bench_pipeline.py --xlsx-writer measures.
+
+Usage:
+    python benchmarks/bench_xlsx_writer.py [--rows 100000] [--data-dir DIR]
+"""
+import argparse
+import contextlib
+import functools
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import report_engine
+import xlsx_writer
+from synthetic import build_countsheet, build_master, build_template
+
+
+def run_report(countsheet, template, master, output, writer):
+    xlsx_writer.set_xlsx_writer(writer)
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        report_engine.process_audit_report(countsheet, template, master, output,
+                                           stream_threshold=0)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help="rows of the timed countsheet")
+    parser.add_argument('--data-dir', default=None,
+                        help="keep the generated workbooks here between runs")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='bench_xlsx_writer_')
+    os.makedirs(data_dir, exist_ok=True)
+    path = functools.partial(os.path.join, data_dir)
+    template, master = path('template.xlsx'), path('master.xlsx')
+    if not os.path.exists(template):
+        build_template(template)
+    if not os.path.exists(master):
+        build_master(master, 1)
+    countsheet = path(f'countsheet_{args.rows}.xlsx')
+    if not os.path.exists(countsheet):
+        print(f"  generating {args.rows:,} row countsheet...")
+        build_countsheet(countsheet, args.rows)
+
+    print(f"{args.rows:,} row report")
+    print(f"{'writer':<9} {'rows/s':>10} {'wall s':>7} {'speedup':>8} {'output MB':>10}")
+    baseline = None
+    for writer in xlsx_writer.XLSX_WRITERS:
+        output = path(f'report_{writer}.xlsx')
+        elapsed = run_report(countsheet, template, master, output, writer)
+        baseline = baseline or elapsed
+        print(f"{writer:<9} {args.rows / elapsed:>10,.0f} {elapsed:>7.2f} {baseline / elapsed:>7.1f}x"
+              f" {os.path.getsize(output) / 2**20:>10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Synthetic inputs for benchmarking the report pipeline.
+
+Builds a template, countsheets and a master file with the sheet names,
+headers and layout that report_engine expects. None of the data is real.
+"""
+import csv
+import datetime
+import gzip
+import random
+
+import openpyxl
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+
+COUNTSHEET_HEADERS = [
+    'Distributor code', 'Distributor Name', 'Item/SKU Code', 'Item Name',
+    'Field 1', 'Field 2', 'Field 3', 'Field 4', 'Item Rate',
+    'Original QTY', 'Original Damage', 'Original Expired',
+    'Manu Date', 'Expiry Date', 'Remarks', 'Batch No', 'Location',
+]
+
+MASTER_HEADERS = [
+    'Audit Std Serial No', 'Region', 'Anchor Code/ DB Code', 'Anchor Name',
+    'DB Name', 'Distributor City', 'Reported Value',
+]
+
+REPORT_HEADERS = [
+    'Sr No', 'Region', 'Audit Team', 'Anchor Code', 'Anchor Name',
+    'Distributor name', 'Article Code', 'Brand Pack', 'NPI / NON - NPI',
+    'Rate Excluding GST', 'Rate Including GST', 'GST (%)', 'Standard Pack',
+    'Primary Damage (Pcs)', 'Non-Saleable (Pcs)', 'BBD Stock (Pcs)',
+    'Total Verified Qty', 'Primary Damage (INR)', 'Non-Saleable (INR)',
+    'BBD Stock (INR)', 'Total Audited Value Including GST', 'Manufacturing Date',
+    'Expiry Date', 'Age (Days)', 'Within Norms', 'Remarks', 'Share of Value',
+]
+
+REGIONS = ('North', 'South', 'East', 'West')
+
+
+def distributor_code(d):
+    return 1000 + d
+
+
+def distributor_name(d):
+    return f"Distributor {d} Pvt Ltd"
+
+
+def build_template(path):
+    """Write a template.xlsx with both report sheets and a row 5 data template"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Artical level format'
+    ws['A1'] = 'Post Drainage Final Report'
+    ws['A1'].font = Font(bold=True, size=14)
+    ws.merge_cells('A1:H1')
+    ws['A2'] = 'Audit Std Serial No'
+    ws['A3'] = 'Article level details'
+
+    thin = Side(style='thin')
+    box = Border(left=thin, right=thin, top=thin, bottom=thin)
+    for col, header in enumerate(REPORT_HEADERS, 1):
+        cell = ws.cell(row=4, column=col, value=header)
+        cell.font = Font(bold=True)
+        cell.fill = PatternFill('solid', fgColor='FFD9E1F2')
+        cell.border = box
+        cell.alignment = Alignment(horizontal='center', wrap_text=True)
+        ws.column_dimensions[cell.column_letter].width = 14
+
+    for col in range(1, 28):
+        cell = ws.cell(row=5, column=col)
+        cell.font = Font(name='Calibri', size=10)
+        cell.border = box
+        cell.alignment = Alignment(horizontal='center' if col < 14 else 'right')
+        if 14 <= col <= 21:
+            cell.number_format = '#,##0.00'
+        if col in (22, 23):
+            cell.number_format = 'dd-mm-yyyy'
+    ws['X5'] = '=IF(V5="","",W5-V5)'
+    ws['Y5'] = '=IF(X5="","",IF(X5>180,"Yes","No"))'
+    ws['AA5'] = '=IF($U$2=0,0,U5/$U$2)'
+
+    ws['E7'] = 'Total'
+    ws['E7'].font = Font(bold=True)
+    ws['A9'] = 'Prepared by'
+    ws.merge_cells('A9:D9')
+
+    sign = wb.create_sheet('Sign Format.')
+    sign['B2'] = 'Post Drainage Audit - Sign Format'
+    sign['B4'] = 'Audit Std Serial No'
+    sign['B6'] = 'Anchor Code'
+    sign['B7'] = 'Anchor Name'
+    sign['B8'] = 'Distributor & City'
+    sign['B9'] = 'Date of Audit'
+    for col, label in zip((2, 3, 4, 6, 7, 8, 10),
+                          ('Primary Damage', 'Non-Saleable', 'BBD Stock', 'Primary INR',
+                           'Non-Saleable INR', 'BBD INR', 'Reported Value')):
+        sign.cell(row=11, column=col, value=label)
+    sign['B16'] = 'Quarter'
+    sign['B17'] = 'Total Audited Value'
+    sign['B20'] = 'Stock verified as on date upto  ( )'
+    sign['B22'] = 'Signed on ()'
+    wb.save(path)
+
+
+def countsheet_rows(rows, distributors=1, seed=0):
+    """Yield synthetic countsheet rows (about 1 in 5 has no quantity)"""
+    rnd = random.Random(seed)
+    string_dates = ('15/03/2024', '2023-11-02', '05-07-2024')
+    for i in range(rows):
+        d = i % distributors
+        roll = rnd.random()
+        if roll < 0.7:
+            manu = datetime.datetime(2023 + rnd.randint(0, 1), rnd.randint(1, 12), rnd.randint(1, 28))
+        elif roll < 0.9:
+            manu = rnd.choice(string_dates)
+        else:
+            manu = None
+        qty = [rnd.choice((0, 0, 1, 2, 3, 5, None)) for _ in range(3)]
+        rate = round(rnd.uniform(5, 500), 2)
+        yield [
+            distributor_code(d), distributor_name(d), f"SKU{i:07d}", f"Item {i}",
+            18, rnd.choice(('NPI', 'NON - NPI')), round(rate / 1.18, 2), 12, rate,
+            *qty, manu, None, '', f"B{rnd.randint(1, 9999)}", 'Godown',
+        ]
+
+
+def build_countsheet(path, rows, distributors=1, seed=0):
+    """Write a countsheet xlsx with `rows` data rows"""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Countsheet')
+    ws.append(COUNTSHEET_HEADERS)
+    for row in countsheet_rows(rows, distributors, seed):
+        ws.append(row)
+    wb.save(path)
+
+
+def build_countsheet_text(path, rows, distributors=1, seed=0):
+    """Write the same countsheet as CSV (TSV for .tsv, gzipped for .gz),
+    with dates as a scanner export writes them"""
+    delimiter = '\t' if '.tsv' in path else ','
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter=delimiter)
+        writer.writerow(COUNTSHEET_HEADERS)
+        for row in countsheet_rows(rows, distributors, seed):
+            writer.writerow([
+                value.strftime('%d/%m/%Y') if isinstance(value, datetime.datetime)
+                else '' if value is None else value
+                for value in row
+            ])
+
+
+def build_master(path, distributors=1):
+    """Write a master lookup file covering `distributors` distributors"""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Master')
+    ws.append(MASTER_HEADERS)
+    for d in range(distributors):
+        ws.append([
+            f"TNBT/{d:05d}", REGIONS[d % len(REGIONS)], float(distributor_code(d)),
+            f"Anchor {d}", distributor_name(d), f"City {d % 37}", 10000 * (d + 1),
+        ])
+    wb.save(path)
@@ -0,0 +1,134 @@
+"""
+Columnar INR arithmetic for blocks of countsheet rows.
+
+The rate and quantity fields of a block of rows are converted to float
+columns once; verified quantity, the three INR amounts, total audited
+value and the report's column subtotals are then whole-column
+operations. NumPy is used when it is installed, otherwise array('d').
+
+A row whose rate or quantities are not numeric keeps the old behaviour
+(all four treated as 0), but is listed in `problems` instead of being
+zeroed silently.
+"""
+from array import array
+from operator import add, mul
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+RATE_COLUMN = 'Item Rate'
+PCS_COLUMNS = ('Original QTY', 'Original Damage', 'Original Expired')
+
+# Report columns (1-based) of the Pcs inputs and of the computed amounts
+PCS_REPORT_COLUMNS = (14, 15, 16)
+AMOUNT_REPORT_COLUMNS = (17, 18, 19, 20, 21)
+SUBTOTAL_COLUMNS = PCS_REPORT_COLUMNS + AMOUNT_REPORT_COLUMNS
+
+
+def _to_float(val):
+    """Same conversion the row-by-row INR code used; None when it would fail"""
+    try:
+        return float(val or 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _cell_float(val):
+    """Value of a Pcs cell in the Total row sum (blank and text count as 0)"""
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class AmountColumns:
+    """Typed rate/quantity columns of `rows` and the amounts derived from them.
+
+    first_index is the 0-based data row index of rows[0], used in problems.
+    """
+
+    def __init__(self, rows, first_index=0):
+        self.size = len(rows)
+        self.problems = []
+
+        inputs = (RATE_COLUMN,) + PCS_COLUMNS
+        raw = [[row.get(name, 0) for row in rows] for name in inputs]
+        converted = [list(map(_to_float, column)) for column in raw]
+
+        # A row with any non-numeric input gets 0 for all four, as before
+        if any(None in column for column in converted):
+            for j, values in enumerate(zip(*converted)):
+                if None in values:
+                    bad = [(name, raw_col[j]) for name, raw_col, val
+                           in zip(inputs, raw, values) if val is None]
+                    self.problems.append((first_index + j, rows[j].get('Item/SKU Code', ''), bad))
+                    for column in converted:
+                        column[j] = 0.0
+
+        # Pcs cells are written as-is, so their Total row sums are per cell
+        self.pcs = [_float_column(map(_cell_float, raw_col)) for raw_col in raw[1:]]
+
+        if np is not None:
+            rate, primary, non_saleable, bbd = (np.array(c, dtype=float) for c in converted)
+            verified = primary + non_saleable + bbd
+            primary_inr = primary * rate
+            non_saleable_inr = non_saleable * rate
+            bbd_inr = bbd * rate
+            total = primary_inr + non_saleable_inr + bbd_inr
+        else:
+            rate, primary, non_saleable, bbd = (array('d', c) for c in converted)
+            verified = _float_column(map(add, map(add, primary, non_saleable), bbd))
+            primary_inr = _float_column(map(mul, primary, rate))
+            non_saleable_inr = _float_column(map(mul, non_saleable, rate))
+            bbd_inr = _float_column(map(mul, bbd, rate))
+            total = _float_column(map(add, map(add, primary_inr, non_saleable_inr), bbd_inr))
+        self.amounts = (verified, primary_inr, non_saleable_inr, bbd_inr, total)
+        # Plain Python floats per row for writing cells
+        self._row_amounts = list(zip(*(_as_list(c) for c in self.amounts)))
+
+    def row_amounts(self, j):
+        """(verified qty, primary INR, non-saleable INR, BBD INR, total) of rows[j]"""
+        return self._row_amounts[j]
+
+    @property
+    def total_values(self):
+        """Total Audited Value column as a list of floats"""
+        return _as_list(self.amounts[4])
+
+    def add_subtotals(self, subtotals):
+        """Add this block's column sums to {report column: running total}"""
+        for col, column in zip(SUBTOTAL_COLUMNS, self.pcs + list(self.amounts)):
+            subtotals[col] = _column_sum(column, subtotals.get(col, 0))
+        return subtotals
+
+    def report_problems(self, limit=10):
+        """Print the rows whose rate/quantities were not numeric"""
+        if not self.problems:
+            return
+        print(f"WARNING: {len(self.problems)} row(s) have non-numeric rate or quantity cells; "
+              f"their INR values are 0:")
+        for index, sku, bad in self.problems[:limit]:
+            cells = ', '.join(f"{name}={value!r}" for name, value in bad)
+            print(f"  Sr No {index + 1} ({sku}): {cells}")
+        if len(self.problems) > limit:
+            print(f"  ... and {len(self.problems) - limit} more")
+
+
+def _float_column(values):
+    if np is not None:
+        return np.fromiter(values, dtype=float)
+    return array('d', values)
+
+
+def _as_list(column):
+    return column.tolist()
+
+
+def _column_sum(column, start):
+    if np is not None:
+        return start + float(column.sum())
+    # Left to right, so totals match the old running sums exactly
+    return sum(column, start)
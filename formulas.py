@@ -0,0 +1,73 @@
+"""
+Row formula templates for the report's data rows.
+
+Formulas on template row 5 are compiled once into a format string plus the
+row numbers of their relative references, so rendering the formula for
+row N is a single str.format call. References follow Excel's fill-down
+rules: relative rows shift, absolute rows ($E$5, E$5) stay, and sheet
+qualified references ('Sign Format.'!C5) and ranges (E5:E9, 5:5) are
+handled like in openpyxl's Translator.
+"""
+from openpyxl.formula.tokenizer import Token
+from openpyxl.formula.translate import Translator
+
+
+class FormulaTemplate:
+    """A formula written for `origin_row`, ready to be rendered for any row"""
+
+    def __init__(self, formula, origin_row=5):
+        self.formula = formula
+        self.origin_row = origin_row
+        self._bases = []
+        parts = []
+
+        tokens = Translator(formula, f"A{origin_row}").get_tokens()
+        if tokens and tokens[0].type != Token.LITERAL:
+            parts.append('=')
+            for token in tokens:
+                if token.type == Token.OPERAND and token.subtype == Token.RANGE:
+                    parts.append(self._compile_range(token.value))
+                else:
+                    parts.append(_escape(token.value))
+            self._format = ''.join(parts)
+        else:
+            self._format = _escape(formula)
+
+    def _compile_range(self, range_str):
+        """Format-string version of a reference, with relative rows as fields"""
+        ws_part, range_str = Translator.strip_ws_name(range_str)
+        ws_part = _escape(ws_part)
+
+        match = Translator.ROW_RANGE_RE.match(range_str)  # e.g. `3:4`
+        if match is not None:
+            return ws_part + self._row(match.group(1)) + ':' + self._row(match.group(2))
+        match = Translator.COL_RANGE_RE.match(range_str)  # e.g. `A:BC`
+        if match is not None:
+            return ws_part + range_str
+        if ':' in range_str:  # e.g. `A1:B5`, `name:C2`
+            return ws_part + ':'.join(self._compile_range(piece)
+                                      for piece in range_str.split(':'))
+        match = Translator.CELL_REF_RE.match(range_str)
+        if match is None:  # Must be a named range
+            return ws_part + _escape(range_str)
+        return ws_part + match.group(1) + self._row(match.group(2))
+
+    def _row(self, row_str):
+        if row_str.startswith('$'):
+            return row_str
+        self._bases.append(int(row_str) - self.origin_row)
+        return '{}'
+
+    @property
+    def is_relative(self):
+        return bool(self._bases)
+
+    def render(self, row):
+        """The formula as it reads when filled down to `row`"""
+        if not self._bases:
+            return self.formula
+        return self._format.format(*[row + offset for offset in self._bases])
+
+
+def _escape(text):
+    return text.replace('{', '{{').replace('}', '}}')
@@ -0,0 +1,139 @@
+"""
+Approximate distributor-name matching within an anchor code.
+
+Names are first reduced to a canonical key (case, punctuation, spacing
+and spellings of the legal form such as "Pvt. Ltd." / "Private Limited"
+do not matter), then compared by the Dice coefficient of their character
+trigrams. A NameIndex holds an inverted trigram index over the names of
+one anchor code, so candidates are found without comparing the query
+against every name.
+
+Fuzzy matching is off unless a threshold is set (--fuzzy-threshold or
+TNBT_FUZZY_THRESHOLD), since a fuzzy match fills a report from another
+master row than the countsheet names. A candidate is accepted when it
+scores at least FUZZY_THRESHOLD, is
+clearly ahead of the next one (FUZZY_MARGIN) and has the same numbers in
+its name ("Traders 2" never matches "Traders 3").
+"""
+import os
+import re
+from collections import Counter
+
+
+def _threshold(value):
+    if value is None or str(value).strip().lower() == 'off':
+        return None
+    value = float(value)
+    if not 0 < value <= 1:
+        raise ValueError(f"fuzzy threshold must be above 0 and at most 1, or 'off', not {value}")
+    return value
+
+
+# Threshold used when fuzzy matching is turned on without a score
+DEFAULT_FUZZY_THRESHOLD = 0.8
+
+# Lowest score accepted as a match; None (the default) turns fuzzy matching off
+FUZZY_THRESHOLD = _threshold(os.environ.get('TNBT_FUZZY_THRESHOLD'))
+
+# How far the best candidate must score above the runner-up
+FUZZY_MARGIN = 0.05
+
+# Candidates ranked and shown when no match is accepted
+MAX_CANDIDATES = 3
+
+# Names with the most selective trigrams in common that are scored in full
+CANDIDATE_POOL = 32
+
+# Trigrams found in more than this share of an anchor's names (e.g. from
+# "pvt ltd") do not select candidates, only score them; anchors with up to
+# COMMON_GRAM_MIN names are always searched in full
+COMMON_GRAM_SHARE = 0.2
+COMMON_GRAM_MIN = 32
+
+_ALIASES = {
+    'private': 'pvt', 'pvt': 'pvt', 'limited': 'ltd', 'ltd': 'ltd', 'and': '&',
+    'company': 'co', 'corporation': 'corp', 'brothers': 'bros', 'enterprise': 'enterprises',
+}
+_PREFIX_RE = re.compile(r'^\s*m\s*/\s*s\b\.?', re.I)  # "M/s." before a firm's name
+_SEPARATOR_RE = re.compile(r'[^\w&]+')
+_NUMBER_RE = re.compile(r'\d+')
+
+
+def set_fuzzy_threshold(value):
+    """Change the acceptance threshold ('off' disables) for this and child processes"""
+    global FUZZY_THRESHOLD
+    FUZZY_THRESHOLD = _threshold(value)
+    os.environ['TNBT_FUZZY_THRESHOLD'] = 'off' if FUZZY_THRESHOLD is None else str(FUZZY_THRESHOLD)
+
+
+def fuzzy_key(name):
+    """Canonical form of a distributor name for approximate comparison"""
+    text = _PREFIX_RE.sub('', str(name).casefold())
+    tokens = [_ALIASES.get(token, token) for token in _SEPARATOR_RE.split(text.replace('_', ' '))
+              if token]
+    return ' '.join(tokens)
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+class NameIndex:
+    """Trigram index over the distributor names of one anchor code.
+
+    entries are (name, value) pairs; value is returned with a match.
+    """
+
+    def __init__(self, entries):
+        self.names = []
+        self.grams = []
+        self.numbers = []
+        self.values = []
+        postings = {}
+        for n, (name, value) in enumerate(entries):
+            key = fuzzy_key(name)
+            grams = trigrams(key)
+            self.names.append(name)
+            self.grams.append(grams)
+            self.numbers.append(_NUMBER_RE.findall(key))
+            self.values.append(value)
+            for gram in grams:
+                postings.setdefault(gram, []).append(n)
+        limit = max(COMMON_GRAM_MIN, int(len(self.names) * COMMON_GRAM_SHARE))
+        self.postings = {gram: ids for gram, ids in postings.items() if len(ids) <= limit}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _ranked(self, name, limit):
+        """[(score, name position)] best first, and the numbers in the name"""
+        key = fuzzy_key(name)
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        pool = shared.most_common(max(limit, CANDIDATE_POOL))
+        ranked = sorted(((dice(grams, self.grams[n]), n) for n, _ in pool), key=lambda c: -c[0])
+        return ranked[:limit], _NUMBER_RE.findall(key)
+
+    def candidates(self, name, limit=MAX_CANDIDATES):
+        """[(score, name, value)] of the closest names, best first"""
+        ranked, _ = self._ranked(name, limit)
+        return [(score, self.names[n], self.values[n]) for score, n in ranked]
+
+    def best(self, name):
+        """(score, name, value) of the accepted match or None, and the candidates"""
+        ranked, numbers = self._ranked(name, MAX_CANDIDATES)
+        candidates = [(score, self.names[n], self.values[n]) for score, n in ranked]
+        if FUZZY_THRESHOLD is None or not ranked or ranked[0][0] < FUZZY_THRESHOLD:
+            return None, candidates
+        if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < FUZZY_MARGIN:
+            return None, candidates
+        if self.numbers[ranked[0][1]] != numbers:
+            return None, candidates
+        return candidates[0], candidates
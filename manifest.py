@@ -0,0 +1,109 @@
+"""
+Incremental regeneration: remember what every report was built from.
+
+The manifest (a JSON file in the output folder) stores a fingerprint per
+report: content hashes of its countsheet rows, its master row and the
+template, plus the engine version and the settings that change the
+output. A report whose fingerprint is unchanged and whose output file is
+still the one that was written is skipped on the next run.
+
+For --split runs the countsheet hash covers only the distributor's own
+rows, so correcting one distributor in a consolidated countsheet rebuilds
+just that distributor's report.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from master_index import file_sha256
+
+
+MANIFEST_NAME = '.tnbt_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def rows_sha256(rows):
+    """Content hash of a list of countsheet records"""
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(json.dumps(list(row), default=str).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def match_sha256(match):
+    """Content hash of a lookup_master result (None, {} or a row dict)"""
+    if match:
+        match = sorted((str(k), v) for k, v in match.items())
+    return hashlib.sha256(json.dumps(match, default=str).encode('utf-8')).hexdigest()
+
+
+class ReportManifest:
+    """Fingerprints of the reports in one output folder"""
+
+    def __init__(self, path):
+        self.path = path
+        self.reports = {}
+        self.countsheets = {}  # countsheet sha256 -> [anchor code, distributor name]
+        self._file_hashes = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get('version') == MANIFEST_VERSION:
+            self.reports = data.get('reports', {})
+            self.countsheets = data.get('countsheets', {})
+
+    @classmethod
+    def for_folder(cls, folder):
+        return cls(os.path.join(folder, MANIFEST_NAME))
+
+    def file_hash(self, path):
+        """SHA-256 of a file, computed once per run"""
+        path = os.path.abspath(path)
+        sha = self._file_hashes.get(path)
+        if sha is None:
+            sha = self._file_hashes[path] = file_sha256(path)
+        return sha
+
+    def is_current(self, output, fingerprint):
+        """True when output exists, is untouched and was built from fingerprint"""
+        record = self.reports.get(os.path.abspath(output))
+        if not record or record['fingerprint'] != fingerprint:
+            return False
+        try:
+            st = os.stat(output)
+        except OSError:
+            return False
+        return [st.st_size, st.st_mtime_ns] == record['stamp']
+
+    def get(self, output):
+        return self.reports.get(os.path.abspath(output))
+
+    def record(self, output, fingerprint, rows, matched, rollup=None, fuzzy_match=None):
+        """Remember output's fingerprint; rollup keeps its figures for --rollup"""
+        st = os.stat(output)
+        self.reports[os.path.abspath(output)] = {
+            'fingerprint': fingerprint,
+            'stamp': [st.st_size, st.st_mtime_ns],
+            'rows': rows,
+            'matched': matched,
+            'fuzzy_match': fuzzy_match,
+            'rollup': rollup,
+        }
+
+    def forget(self, output):
+        self.reports.pop(os.path.abspath(output), None)
+
+    def save(self):
+        """Write atomically, like the master index cache"""
+        data = {'version': MANIFEST_VERSION, 'reports': self.reports,
+                'countsheets': self.countsheets}
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, self.path)
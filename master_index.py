@@ -0,0 +1,278 @@
+"""
+Persistent, indexed lookup over the master Excel file.
+
+The master file changes about once a month but is consulted for every
+report, so it is parsed once into a hash map keyed on
+(normalized anchor code, casefolded distributor name) and pickled to a
+cache folder. The cache is invalidated by the master's size, mtime and
+SHA-256 content hash. A distributor name without an exact key is matched
+approximately among the names under its anchor code (fuzzy_names).
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+
+import fuzzy_names
+from fuzzy_names import NameIndex
+from sheet_readers import open_sheet
+
+
+INDEX_VERSION = 1
+# Masters given as one of these are master_store databases
+STORE_EXTENSIONS = ('.sqlite', '.sqlite3', '.db')
+DEFAULT_CACHE_DIR = os.environ.get(
+    'TNBT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.tnbt_audit_cache'))
+
+# Indexes already loaded in this process, keyed by absolute master path
+_loaded = {}
+
+
+# Normalize anchor codes for robust matching (e.g. 1001.0 -> 1001)
+def normalize_code(val):
+    s = str(val).strip()
+    if s.endswith('.0'):
+        s = s[:-2]
+    return s
+
+
+def normalize_name(val):
+    """Distributor names match case-insensitively, ignoring outer spaces"""
+    return str(val).strip().casefold()
+
+
+def find_key_columns(headers):
+    """Indexes of the anchor code and distributor name columns (None if absent)"""
+    ac_idx = None
+    dn_idx = None
+    for idx, h in enumerate(headers):
+        if h and 'anchor code' in str(h).lower():
+            ac_idx = idx
+        if h and ('db name' in str(h).lower() or 'distributor name' in str(h).lower()):
+            dn_idx = idx
+    return ac_idx, dn_idx
+
+
+def is_master_store(path):
+    """True for a master_store SQLite database rather than a master workbook"""
+    return str(path).lower().endswith(STORE_EXTENSIONS)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MasterIndex:
+    """In-memory hash map over the master rows"""
+
+    def __init__(self, headers, ac_idx, dn_idx, entries, stamp):
+        self.headers = headers
+        self.ac_idx = ac_idx
+        self.dn_idx = dn_idx
+        self.entries = entries  # key -> (master row number, row values)
+        self.stamp = stamp      # (size, mtime_ns, sha256) of the master file
+        self._anchors = None    # anchor code -> entries, grouped on first fuzzy lookup
+        self._fuzzy = {}        # anchor code -> NameIndex
+
+    @property
+    def has_key_columns(self):
+        return self.ac_idx is not None and self.dn_idx is not None
+
+    @classmethod
+    def build(cls, master_file, stamp=None):
+        """Parse the master workbook and index every row"""
+        if stamp is None:
+            st = os.stat(master_file)
+            stamp = (st.st_size, st.st_mtime_ns, file_sha256(master_file))
+
+        with open_sheet(master_file) as sheet:
+            master_headers = sheet.headers
+            ac_idx, dn_idx = find_key_columns(master_headers)
+
+            entries = {}
+            if ac_idx is not None and dn_idx is not None:
+                width = len(master_headers)
+                for row_number, row in enumerate(sheet.rows(), 1):
+                    row = row[:width]
+                    key = (normalize_code(row[ac_idx]), normalize_name(row[dn_idx]))
+                    # The first matching row wins, as with the old linear scan
+                    if key not in entries:
+                        entries[key] = (row_number, row)
+
+        return cls(master_headers, ac_idx, dn_idx, entries, stamp)
+
+    @classmethod
+    def load(cls, master_file, cache_dir=None):
+        """Return the index for master_file, rebuilding the on-disk cache if stale.
+
+        A master_store database is queried in place instead (see
+        master_store.load_index).
+        """
+        if is_master_store(master_file):
+            import master_store
+            return master_store.load_index(master_file)
+
+        path = os.path.abspath(master_file)
+        st = os.stat(path)
+
+        cached = _loaded.get(path)
+        if cached and cached.stamp[:2] == (st.st_size, st.st_mtime_ns):
+            return cached
+
+        cache_file = cls.cache_path(path, cache_dir)
+        index = cls._read_cache(cache_file)
+        if index is not None and index.stamp[0] == st.st_size:
+            sha = file_sha256(path)
+            if index.stamp[2] == sha:
+                if index.stamp[1] != st.st_mtime_ns:
+                    # Touched but not changed: keep the index, refresh the stamp
+                    index.stamp = (st.st_size, st.st_mtime_ns, sha)
+                    index.save(cache_file)
+                _loaded[path] = index
+                return index
+            stamp = (st.st_size, st.st_mtime_ns, sha)
+        else:
+            stamp = None
+
+        index = cls.build(path, stamp)
+        index.save(cache_file)
+        _loaded[path] = index
+        return index
+
+    @staticmethod
+    def cache_path(master_file, cache_dir=None):
+        key = hashlib.sha1(os.path.abspath(master_file).encode('utf-8')).hexdigest()[:16]
+        name = f"master_{key}.idx"
+        return os.path.join(cache_dir or DEFAULT_CACHE_DIR, name)
+
+    @classmethod
+    def _read_cache(cls, cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                data = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+            return None
+        return cls(data['headers'], data['ac_idx'], data['dn_idx'],
+                   data['entries'], data['stamp'])
+
+    def save(self, cache_file):
+        """Write the index atomically so concurrent workers never see a partial file"""
+        data = {
+            'version': INDEX_VERSION,
+            'headers': self.headers,
+            'ac_idx': self.ac_idx,
+            'dn_idx': self.dn_idx,
+            'entries': self.entries,
+            'stamp': self.stamp,
+        }
+        cache_dir = os.path.dirname(cache_file)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_file)
+        except OSError as e:
+            # A read-only cache folder only costs us the reuse across runs
+            print(f"Could not write master index cache {cache_file}: {e}")
+
+    def find(self, anchor_code, distributor_name):
+        """Return (master row number, row values) or None.
+
+        A name with no exact match is matched approximately against the
+        names under the same anchor code (see fuzzy_find).
+        """
+        return self.find_match(anchor_code, distributor_name)[0]
+
+    def find_match(self, anchor_code, distributor_name):
+        """find(), plus a description of the match when it was approximate.
+
+        Returns (hit, fuzzy); fuzzy is None for exact matches and misses,
+        else {'distributor', 'master_name', 'row', 'score'}.
+        """
+        code = normalize_code(anchor_code)
+        hit = self._find_exact(code, normalize_name(distributor_name))
+        if hit is not None:
+            return hit, None
+        return self.fuzzy_match(code, distributor_name)
+
+    def _find_exact(self, code, name):
+        return self.entries.get((code, name))
+
+    def _anchor_entries(self, code):
+        """(distributor name, (row number, row values)) of each key under an anchor code"""
+        if self._anchors is None:
+            anchors = {}
+            for (anchor, _), hit in self.entries.items():
+                anchors.setdefault(anchor, []).append(hit)
+            self._anchors = anchors
+        return [(str(hit[1][self.dn_idx]).strip(), hit) for hit in self._anchors.get(code, ())]
+
+    def fuzzy_find(self, code, distributor_name):
+        """Best approximate match for a name under a normalized anchor code, or None"""
+        return self.fuzzy_match(code, distributor_name)[0]
+
+    def fuzzy_match(self, code, distributor_name):
+        """(hit, fuzzy) for the best approximate match, or (None, None); see find_match.
+
+        The score of an accepted match, or the closest names when none is
+        accepted, is printed for the report log.
+        """
+        threshold = fuzzy_names.FUZZY_THRESHOLD
+        if threshold is None or distributor_name is None:
+            return None, None
+        index = self._fuzzy.get(code)
+        if index is None:
+            index = self._fuzzy[code] = NameIndex(self._anchor_entries(code))
+        match, ranked = index.best(distributor_name)
+        if match is not None:
+            score, name, hit = match
+            print(f"Fuzzy match for distributor '{distributor_name}': '{name}' "
+                  f"(row {hit[0]}, score {score:.2f})")
+            return hit, {'distributor': str(distributor_name), 'master_name': name,
+                         'row': hit[0], 'score': round(score, 3)}
+        if ranked:
+            if ranked[0][0] < threshold:
+                reason = f'below {threshold:.2f}'
+            elif len(ranked) > 1 and ranked[0][0] - ranked[1][0] < fuzzy_names.FUZZY_MARGIN:
+                reason = 'ambiguous'
+            else:
+                reason = 'numbers differ'
+            print(f"No fuzzy match for distributor '{distributor_name}' ({reason}); closest: "
+                  + ', '.join(f"'{name}' ({score:.2f})" for score, name, _ in ranked))
+        return None, None
+
+    def lookup(self, anchor_code, distributor_name):
+        """Return the matching master row as a dict keyed by header, or {}.
+
+        The audit serial number is added under 'audit_std_serial_no'.
+        """
+        hit, fuzzy = self.find_match(anchor_code, distributor_name)
+        if hit is None:
+            return {}
+        return self.row_dict(hit[1], fuzzy)
+
+    def lookup_many(self, keys):
+        """lookup() for each (anchor code, distributor name) in keys, as a list"""
+        return [self.lookup(*key) for key in keys]
+
+    def row_dict(self, row, fuzzy=None):
+        """A master row as a dict keyed by header, plus 'audit_std_serial_no'.
+
+        A fuzzy match is described under 'fuzzy_match' (see find_match).
+        """
+        row_dict = dict(zip(self.headers, row))
+
+        # Find audit serial number
+        audit_key = next((h for h in self.headers
+                          if h and str(h).strip().lower() == "audit std serial no"), None)
+        row_dict['audit_std_serial_no'] = row[self.headers.index(audit_key)] if audit_key else ""
+        if fuzzy:
+            row_dict['fuzzy_match'] = fuzzy
+        return row_dict
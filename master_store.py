@@ -0,0 +1,373 @@
+"""
+SQLite store of master file snapshots.
+
+Each import of the master workbook is kept as a snapshot, so a report
+can be rebuilt later against the master that was current when it was
+first made. Rows are stored with their normalized anchor code and
+distributor name in indexed columns and are queried in place: nothing
+is parsed or loaded into memory per run, and a whole list of
+distributors is matched in a single query.
+
+    python master_store.py import master.xlsx [--db master.sqlite] [--effective 2025-04-01]
+    python master_store.py list [--db master.sqlite]
+
+Reports use the store when -m names it (any .sqlite/.sqlite3/.db file).
+The latest snapshot is used unless --master-as-of (or TNBT_MASTER_AS_OF)
+picks an older one by snapshot id or date.
+"""
+import argparse
+import datetime
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+from urllib.request import pathname2url
+
+from master_index import (DEFAULT_CACHE_DIR, MasterIndex, file_sha256, find_key_columns,
+                          normalize_code, normalize_name)
+from sheet_readers import open_sheet
+
+
+STORE_VERSION = 1
+DEFAULT_STORE = os.environ.get('TNBT_MASTER_DB', os.path.join(DEFAULT_CACHE_DIR, 'master.sqlite'))
+
+# Snapshot reports are built against: None for the latest, or a snapshot id or date
+MASTER_AS_OF = os.environ.get('TNBT_MASTER_AS_OF') or None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    effective_at TEXT NOT NULL,
+    imported_at TEXT NOT NULL,
+    source TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    headers BLOB NOT NULL,
+    ac_idx INTEGER NOT NULL,
+    dn_idx INTEGER NOT NULL,
+    row_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_effective ON snapshots (effective_at, id);
+CREATE TABLE IF NOT EXISTS master_rows (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+    row_number INTEGER NOT NULL,
+    anchor_code TEXT NOT NULL,
+    distributor_name TEXT NOT NULL,
+    row_values BLOB NOT NULL,
+    PRIMARY KEY (snapshot_id, row_number)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS master_rows_key
+    ON master_rows (snapshot_id, anchor_code, distributor_name, row_number);
+CREATE INDEX IF NOT EXISTS master_rows_distributor
+    ON master_rows (snapshot_id, distributor_name);
+"""
+
+_SNAPSHOT_COLUMNS = ('id, effective_at, imported_at, source, sha256, headers, ac_idx, dn_idx, '
+                     'row_count')
+
+# The first row of a key wins, as in MasterIndex. Without statistics the
+# planner would rather walk the primary key in row order than sort, so the
+# key index is named explicitly.
+_FIND_ROW = """
+SELECT row_number, row_values FROM master_rows INDEXED BY master_rows_key
+WHERE snapshot_id = ? AND anchor_code = ? AND distributor_name = ?
+ORDER BY row_number LIMIT 1
+"""
+_FIND_KEYS = """
+SELECT k.position, (SELECT m.row_values FROM master_rows m INDEXED BY master_rows_key
+                    WHERE m.snapshot_id = ? AND m.anchor_code = k.anchor_code
+                      AND m.distributor_name = k.distributor_name
+                    ORDER BY m.row_number LIMIT 1)
+FROM temp.lookup_keys k
+"""
+_ANCHOR_ROWS = """
+SELECT distributor_name, row_number, row_values FROM master_rows INDEXED BY master_rows_key
+WHERE snapshot_id = ? AND anchor_code = ?
+ORDER BY distributor_name, row_number
+"""
+
+
+def parse_as_of(value, end_of_day=True):
+    """A snapshot id (int) or the datetime a snapshot must be effective by.
+
+    A bare date means the end of that day (the start with end_of_day=False).
+    """
+    if isinstance(value, (int, datetime.datetime)):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time.max if end_of_day
+                                         else datetime.time.min)
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text)
+    try:
+        if len(text) == 10:
+            return parse_as_of(datetime.date.fromisoformat(text), end_of_day)
+        return datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"expected a snapshot id or an ISO date, not {value!r}") from None
+
+
+def set_master_as_of(value):
+    """Build reports against an older master snapshot, in this and child processes"""
+    global MASTER_AS_OF
+    if value is None:
+        MASTER_AS_OF = None
+        os.environ.pop('TNBT_MASTER_AS_OF', None)
+        return
+    parse_as_of(value)
+    MASTER_AS_OF = str(value)
+    os.environ['TNBT_MASTER_AS_OF'] = MASTER_AS_OF
+
+
+def _timestamp(moment):
+    return moment.replace(microsecond=0).isoformat()
+
+
+class MasterStore:
+    """A master_store database; readonly connections are safe to share across threads"""
+
+    def __init__(self, path, readonly=False):
+        self.path = os.path.abspath(path)
+        if readonly:
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(f"Master store not found: {self.path}")
+            self.conn = sqlite3.connect(f"file:{pathname2url(self.path)}?mode=ro", uri=True,
+                                        check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.conn = sqlite3.connect(self.path)
+        self.lock = threading.Lock()
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version > STORE_VERSION:
+            raise ValueError(f"{self.path} was written by a newer version (store version {version})")
+        if readonly and version == 0:
+            raise ValueError(f"{self.path} is not a master store")
+        if not readonly and version < STORE_VERSION:
+            with self.conn:
+                self.conn.executescript(SCHEMA)
+                self.conn.execute(f'PRAGMA user_version = {STORE_VERSION}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _snapshot(self, row):
+        if row is None:
+            return None
+        snapshot = dict(zip(('id', 'effective_at', 'imported_at', 'source', 'sha256', 'headers',
+                             'ac_idx', 'dn_idx', 'rows'), row))
+        snapshot['headers'] = pickle.loads(snapshot['headers'])
+        return snapshot
+
+    def snapshots(self):
+        """Every snapshot, oldest first"""
+        with self.lock:
+            rows = self.conn.execute(f'SELECT {_SNAPSHOT_COLUMNS} FROM snapshots '
+                                     'ORDER BY effective_at, id').fetchall()
+        return [self._snapshot(row) for row in rows]
+
+    def snapshot(self, as_of=None):
+        """The snapshot to use: the latest, one by id, or the last effective by a datetime"""
+        as_of = parse_as_of(as_of) if as_of is not None else None
+        query = f'SELECT {_SNAPSHOT_COLUMNS} FROM snapshots '
+        if as_of is None:
+            args = ()
+        elif isinstance(as_of, int):
+            query += 'WHERE id = ? '
+            args = (as_of,)
+        else:
+            query += 'WHERE effective_at <= ? '
+            args = (_timestamp(as_of),)
+        with self.lock:
+            snapshot = self._snapshot(self.conn.execute(
+                query + 'ORDER BY effective_at DESC, id DESC LIMIT 1', args).fetchone())
+        if snapshot is None:
+            if as_of is None:
+                raise ValueError(f"{self.path} holds no master snapshots; import one with "
+                                 f"'python master_store.py import MASTER.xlsx --db {self.path}'")
+            raise ValueError(f"{self.path} has no master snapshot as of {_timestamp(as_of)}")
+        return snapshot
+
+    def import_master(self, master_file, effective_at=None):
+        """Store master_file as a new snapshot.
+
+        Returns (snapshot, created); an unchanged master (same content as
+        the snapshot in effect at effective_at) is not stored again.
+        """
+        now = datetime.datetime.now()
+        effective_at = parse_as_of(effective_at, end_of_day=False) \
+            if effective_at is not None else now
+        if isinstance(effective_at, int):
+            raise ValueError("the effective time must be a date, not a snapshot id")
+        sha = file_sha256(master_file)
+        try:
+            previous = self.snapshot(effective_at)
+        except ValueError:
+            previous = None
+        if previous is not None and previous['sha256'] == sha:
+            return previous, False
+
+        with open_sheet(master_file) as sheet:
+            headers = sheet.headers
+            ac_idx, dn_idx = find_key_columns(headers)
+            if ac_idx is None or dn_idx is None:
+                raise ValueError(f"{master_file} has no Anchor Code and Distributor Name columns")
+            width = len(headers)
+            with self.lock, self.conn:
+                snapshot_id = self.conn.execute(
+                    'INSERT INTO snapshots (effective_at, imported_at, source, sha256, headers, '
+                    'ac_idx, dn_idx, row_count) VALUES (?, ?, ?, ?, ?, ?, ?, 0)',
+                    (_timestamp(effective_at), _timestamp(now), os.path.abspath(master_file), sha,
+                     pickle.dumps(headers, protocol=pickle.HIGHEST_PROTOCOL), ac_idx, dn_idx)
+                ).lastrowid
+
+                def rows():
+                    for row_number, row in enumerate(sheet.rows(), 1):
+                        row = row[:width]
+                        yield (snapshot_id, row_number, normalize_code(row[ac_idx]),
+                               normalize_name(row[dn_idx]),
+                               pickle.dumps(row, protocol=pickle.HIGHEST_PROTOCOL))
+
+                count = self.conn.executemany(
+                    'INSERT INTO master_rows VALUES (?, ?, ?, ?, ?)', rows()).rowcount
+                self.conn.execute('UPDATE snapshots SET row_count = ? WHERE id = ?',
+                                  (count, snapshot_id))
+        return self.snapshot(snapshot_id), True
+
+    def index(self, as_of=None):
+        """SnapshotIndex over the snapshot chosen by as_of"""
+        return SnapshotIndex(self, self.snapshot(as_of))
+
+
+class SnapshotIndex(MasterIndex):
+    """MasterIndex interface over one stored snapshot, queried in place"""
+
+    def __init__(self, store, snapshot):
+        super().__init__(snapshot['headers'], snapshot['ac_idx'], snapshot['dn_idx'], None,
+                         (snapshot['id'], snapshot['sha256']))
+        self.store = store
+        self.snapshot = snapshot
+
+    def _find_exact(self, code, name):
+        with self.store.lock:
+            hit = self.store.conn.execute(_FIND_ROW, (self.snapshot['id'], code, name)).fetchone()
+        return (hit[0], pickle.loads(hit[1])) if hit else None
+
+    def _anchor_entries(self, code):
+        with self.store.lock:
+            rows = self.store.conn.execute(_ANCHOR_ROWS, (self.snapshot['id'], code)).fetchall()
+        entries = {}
+        for name, row_number, values in rows:
+            if name not in entries:
+                row = pickle.loads(values)
+                entries[name] = (str(row[self.dn_idx]).strip(), (row_number, row))
+        return list(entries.values())
+
+    def lookup_many(self, keys):
+        """lookup() for each (anchor code, distributor name) in keys, in one query.
+
+        Names without an exact match then go through fuzzy_match one by one.
+        """
+        keys = list(keys)
+        found, fuzzy = {}, {}
+        with self.store.lock:
+            conn = self.store.conn
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS lookup_keys '
+                         '(position INTEGER PRIMARY KEY, anchor_code TEXT, distributor_name TEXT)')
+            conn.execute('DELETE FROM temp.lookup_keys')
+            conn.executemany('INSERT INTO temp.lookup_keys VALUES (?, ?, ?)',
+                             ((n, normalize_code(code), normalize_name(name))
+                              for n, (code, name) in enumerate(keys)))
+            for position, values in conn.execute(_FIND_KEYS, (self.snapshot['id'],)):
+                if values is not None:
+                    found[position] = pickle.loads(values)
+            conn.execute('DELETE FROM temp.lookup_keys')
+        for n, (code, name) in enumerate(keys):
+            if n not in found:
+                hit, fuzzy[n] = self.fuzzy_match(normalize_code(code), name)
+                if hit is not None:
+                    found[n] = hit[1]
+        return [self.row_dict(found[n], fuzzy.get(n)) if n in found else {}
+                for n in range(len(keys))]
+
+
+# Stores and snapshot indexes already opened, by process: a worker forked
+# from a process that had a store open must not use its SQLite connection
+_stores = {}
+_indexes = {}
+_open_lock = threading.Lock()
+
+
+def load_index(path, as_of=None):
+    """SnapshotIndex for the master store at path, as of MASTER_AS_OF by default"""
+    key = (os.getpid(), os.path.abspath(path))
+    with _open_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = MasterStore(key[1], readonly=True)
+        snapshot = store.snapshot(as_of if as_of is not None else MASTER_AS_OF)
+        index = _indexes.get((key, snapshot['id']))
+        if index is None:
+            index = _indexes[(key, snapshot['id'])] = SnapshotIndex(store, snapshot)
+        return index
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Keep versioned snapshots of the master file in a SQLite store.")
+    # --db is accepted after the command ("import master.xlsx --db X")
+    store = argparse.ArgumentParser(add_help=False)
+    store.add_argument('--db', default=DEFAULT_STORE,
+                       help="store to use (default: $TNBT_MASTER_DB or "
+                            "master.sqlite in the cache folder)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('import', parents=[store],
+                               help="add a master workbook as a new snapshot")
+    load.add_argument('master', help="master lookup Excel file")
+    load.add_argument('--effective', default=None, metavar='DATE',
+                      help="when this master came into use, for importing older masters "
+                           "(default: now)")
+    commands.add_parser('list', parents=[store], help="list the stored snapshots")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.command == 'import':
+        if not os.path.exists(args.master):
+            print(f"Master file not found: {args.master}", file=sys.stderr)
+            return 2
+        with MasterStore(args.db) as store:
+            try:
+                snapshot, created = store.import_master(args.master, args.effective)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                return 2
+        if created:
+            print(f"Imported {snapshot['rows']} rows as snapshot {snapshot['id']} "
+                  f"(effective {snapshot['effective_at']}) into {args.db}")
+        else:
+            print(f"Unchanged since snapshot {snapshot['id']} "
+                  f"(effective {snapshot['effective_at']}); nothing imported")
+        return 0
+
+    if not os.path.exists(args.db):
+        print(f"Master store not found: {args.db}", file=sys.stderr)
+        return 2
+    with MasterStore(args.db, readonly=True) as store:
+        snapshots = store.snapshots()
+    print(f"{'id':>4}  {'effective':<19}  {'imported':<19}  {'rows':>7}  source")
+    for s in snapshots:
+        print(f"{s['id']:>4}  {s['effective_at']:<19}  {s['imported_at']:<19}  {s['rows']:>7}  "
+              f"{os.path.basename(s['source'])}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
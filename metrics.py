@@ -0,0 +1,169 @@
+"""
+Named timing spans and log levels for the report pipeline.
+
+Code marks its phases with `with metrics.span('template load'):`. Spans
+cost next to nothing unless a recording is active:
+
+    with metrics.recording(trace_memory=True) as rec:
+        report_engine.process_audit_report(...)
+    print(rec.format_table())
+    rec.write_jsonl('metrics.jsonl', countsheet='...')
+
+Each span records wall time, CPU time, an optional row count and, when
+memory tracing is on, the tracemalloc peak reached inside it. Spans may
+nest; a nested span's peak also counts towards its parent's.
+"""
+import json
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+def _parse_level(name):
+    level = logging.getLevelName(str(name).upper())
+    return level if isinstance(level, int) else logging.INFO
+
+
+# Diagnostic print()s below this level are dropped (TNBT_LOG_LEVEL=DEBUG shows them)
+LOG_LEVEL = _parse_level(os.environ.get('TNBT_LOG_LEVEL', 'INFO'))
+
+
+def set_log_level(name):
+    """Set the level by name ('DEBUG', 'INFO', ...) for this and child processes"""
+    global LOG_LEVEL
+    LOG_LEVEL = _parse_level(name)
+    os.environ['TNBT_LOG_LEVEL'] = logging.getLevelName(LOG_LEVEL)
+
+
+def debug(message):
+    if LOG_LEVEL <= logging.DEBUG:
+        print(message)
+
+
+class Recorder:
+    """Finished spans of one recording, in the order they ended"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.spans = []
+        self.started = time.perf_counter()
+        self._stack = []
+
+    def write_jsonl(self, path, **context):
+        """Append one JSON object per span, tagged with `context` fields"""
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        recorded = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in self.spans:
+                f.write(json.dumps({'recorded': recorded, **context, **record}) + '\n')
+
+    def format_table(self):
+        return format_spans(self.spans)
+
+
+def format_spans(spans):
+    """Console table of spans; nested spans are indented under their parent"""
+    lines = [f"{'span':<24} {'wall s':>8} {'cpu s':>8} {'rows':>9} {'peak MB':>8}"]
+    for record in sorted(spans, key=lambda r: r['start_s']):
+        name = '  ' * record['depth'] + record['name']
+        rows = f"{record['rows']:,}" if record['rows'] is not None else ''
+        peak = f"{record['peak_mb']:.1f}" if record['peak_mb'] is not None else ''
+        lines.append(f"{name:<24} {record['wall_s']:>8.3f} {record['cpu_s']:>8.3f} "
+                     f"{rows:>9} {peak:>8}")
+    return '\n'.join(lines)
+
+
+def total_spans(spans):
+    """Sum spans of the same name and depth (e.g. across a batch); peaks take the max"""
+    totals = {}
+    for record in spans:
+        key = (record['name'], record['depth'])
+        total = totals.get(key)
+        if total is None:
+            totals[key] = dict(record)
+            continue
+        total['wall_s'] = round(total['wall_s'] + record['wall_s'], 4)
+        total['cpu_s'] = round(total['cpu_s'] + record['cpu_s'], 4)
+        if record['rows'] is not None:
+            total['rows'] = (total['rows'] or 0) + record['rows']
+        if record['peak_mb'] is not None:
+            total['peak_mb'] = max(total['peak_mb'] or 0, record['peak_mb'])
+    return list(totals.values())
+
+
+_active = None
+
+
+@contextmanager
+def recording(trace_memory=False):
+    """Collect the spans run inside the block; tracemalloc is started if asked for"""
+    global _active
+    previous = _active
+    recorder = Recorder(trace_memory)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    _active = recorder
+    try:
+        yield recorder
+    finally:
+        _active = previous
+        if started_tracing:
+            tracemalloc.stop()
+
+
+class span:
+    """Context manager timing one named phase; set `.rows` inside the block"""
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        self._recorder = None
+
+    def __enter__(self):
+        recorder = _active
+        if recorder is None:
+            return self
+        self._recorder = recorder
+        self._depth = len(recorder._stack)
+        self._peak = 0
+        if recorder.trace_memory and tracemalloc.is_tracing():
+            if recorder._stack:
+                parent = recorder._stack[-1]
+                parent._peak = max(parent._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        recorder._stack.append(self)
+        self._start = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        recorder = self._recorder
+        if recorder is None:
+            return False
+        wall = time.perf_counter() - self._start
+        cpu = time.process_time() - self._cpu
+        recorder._stack.pop()
+        peak_mb = None
+        if recorder.trace_memory and tracemalloc.is_tracing():
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            if recorder._stack:
+                parent = recorder._stack[-1]
+                parent._peak = max(parent._peak, self._peak)
+            peak_mb = round(self._peak / 2**20, 2)
+        recorder.spans.append({
+            'name': self.name,
+            'depth': self._depth,
+            'start_s': round(self._start - recorder.started, 4),
+            'wall_s': round(wall, 4),
+            'cpu_s': round(cpu, 4),
+            'rows': self.rows,
+            'peak_mb': peak_mb,
+            'error': exc[0].__name__ if exc[0] else None,
+        })
+        self._recorder = None
+        return False
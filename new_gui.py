@@ -2,26 +2,25 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, scrolledtext
 from tkinter.scrolledtext import ScrolledText
 import threading
-import sys
-import io
-from contextlib import redirect_stdout, redirect_stderr
-import openpyxl
-from openpyxl.utils import get_column_letter
-from copy import copy
+import queue
+from contextlib import nullcontext, redirect_stdout
 import datetime
-import re
 import os
 import webbrowser
 
+import metrics
+import report_engine
+from master_index import DEFAULT_CACHE_DIR
+from profiling import profile_name, profiled
+from report_engine import resource_path
+from progress import ChannelWriter, PhaseTimer, ProgressChannel, format_eta
 
-# Utility to get resource path for PyInstaller and normal script
-def resource_path(relative_path):
-    """ Get absolute path to resource, works for dev and for PyInstaller """
-    try:
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
-    return os.path.join(base_path, relative_path)
+# Oldest console lines are dropped beyond this many
+MAX_CONSOLE_LINES = 5000
+# How often the worker's events are drained into the UI (ms)
+DRAIN_INTERVAL_MS = 100
+# Per-phase timings of every GUI run are appended here as JSON lines
+METRICS_FILE = os.path.join(DEFAULT_CACHE_DIR, 'metrics.jsonl')
 
 
 class AuditReportGUI:
@@ -31,6 +30,8 @@ class AuditReportGUI:
         self.setup_variables()
         self.create_menu()
         self.create_widgets()
+        self.root.after(DRAIN_INTERVAL_MS, self.drain_events)
+        self.start_worker()
         
     def setup_window(self):
         self.root.title("TNBT Post Drainage Final Report Generator - Developed by Rishav Raj")
@@ -87,6 +88,7 @@ class AuditReportGUI:
         tools_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Tools", menu=tools_menu)
         tools_menu.add_command(label="🚀 Generate Report", command=self.start_generation, accelerator="F5")
+        tools_menu.add_command(label="🔬 Generate Report with Profiling", command=lambda: self.start_generation(profile=True))
         tools_menu.add_command(label="🗑️ Clear All Fields", command=self.clear_all, accelerator="Ctrl+L")
         tools_menu.add_command(label="📋 Clear Console", command=self.clear_console, accelerator="Ctrl+Shift+L")
         
@@ -116,6 +118,12 @@ class AuditReportGUI:
         self.master_path = tk.StringVar()
         self.output_path = tk.StringVar()
         self.processing = False
+        # Worker thread -> Tk main loop; widgets are only touched in drain_events
+        self.events = ProgressChannel()
+        self.phase_timer = PhaseTimer()
+        self.status_text = tk.StringVar()
+        # Reports run one at a time on a single long-lived worker thread
+        self.jobs = queue.Queue()
         
     def create_widgets(self):
         # Main container
@@ -322,9 +330,16 @@ class AuditReportGUI:
                             cursor='hand2')
         help_btn.pack(side='left')
         
-        # Progress bar
+        # Progress bar with phase / rows / ETA status
+        self.status_label = tk.Label(button_frame,
+                                     textvariable=self.status_text,
+                                     bg='#1e1e2e',
+                                     fg='#a6adc8',
+                                     font=('Segoe UI', 9))
+        self.status_label.pack(side='right', padx=(10, 0))
+        
         self.progress = ttk.Progressbar(button_frame, 
-                                       mode='indeterminate',
+                                       mode='determinate',
                                        style='TProgressbar')
         self.progress.pack(side='right', fill='x', expand=True, padx=(20, 0))
         
@@ -806,12 +821,14 @@ This application is designed to automate the generation of post-drainage audit r
                            "© 2025 All rights reserved.")
     
     def browse_file(self, var):
+        filetypes = [("Excel files", "*.xlsx *.xlsm *.xls")]
+        if var is self.countsheet_path:
+            filetypes.append(("CSV / TSV exports", "*.csv *.tsv *.csv.gz *.tsv.gz"))
+        elif var is self.master_path:
+            filetypes.append(("Master store", "*.sqlite *.sqlite3 *.db"))
         file_path = filedialog.askopenfilename(
             title="Select Excel File",
-            filetypes=[
-                ("Excel files", "*.xlsx *.xlsm *.xls"),
-                ("All files", "*.*")
-            ]
+            filetypes=filetypes + [("All files", "*.*")]
         )
         if file_path:
             var.set(file_path)
@@ -848,12 +865,49 @@ This application is designed to automate the generation of post-drainage audit r
     
     def log(self, message):
         """Add message to console with timestamp"""
+        if threading.current_thread() is not threading.main_thread():
+            # Tk is not thread-safe: queue it for drain_events
+            self.events.log(message)
+            return
+        self.write_console([message])
+        self.root.update_idletasks()
+    
+    def write_console(self, messages):
+        """Insert messages in one go and keep the console under MAX_CONSOLE_LINES"""
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-        formatted_message = f"[{timestamp}] {message}\n"
+        text = ''.join(f"[{timestamp}] {message}\n" for message in messages)
         
-        self.console.insert(tk.END, formatted_message)
+        self.console.insert(tk.END, text)
+        lines = int(self.console.index('end-1c').split('.')[0])
+        if lines > MAX_CONSOLE_LINES:
+            self.console.delete('1.0', f"{lines - MAX_CONSOLE_LINES}.0")
         self.console.see(tk.END)
-        self.root.update_idletasks()
+    
+    def drain_events(self):
+        """Apply queued worker events to the UI, then reschedule"""
+        messages = []
+        for kind, payload in self.events.drain():
+            if kind == 'log':
+                messages.append(payload)
+            elif kind == 'progress':
+                self.show_progress(*payload)
+            elif kind == 'finished':
+                if messages:
+                    self.write_console(messages)
+                    messages = []
+                self.finish_generation(*payload)
+        if messages:
+            self.write_console(messages)
+        self.root.after(DRAIN_INTERVAL_MS, self.drain_events)
+    
+    def show_progress(self, phase, done, total):
+        """Update the progress bar and status label for a progress event"""
+        eta = self.phase_timer.update(phase, done, total)
+        self.progress.config(maximum=max(total, 1), value=min(done, total))
+        status = f"{phase}: {done:,} / {total:,}" if total > 1 else f"{phase}..."
+        if eta is not None:
+            status += f" - {format_eta(eta)}"
+        self.status_text.set(status)
     
     def validate_inputs(self):
         """Validate that all required inputs are provided"""
@@ -865,7 +919,7 @@ This application is designed to automate the generation of post-drainage audit r
             return "Please specify output file location"
         return None
     
-    def start_generation(self):
+    def start_generation(self, profile=False):
         """Start the report generation in a separate thread"""
         error = self.validate_inputs()
         if error:
@@ -877,15 +931,31 @@ This application is designed to automate the generation of post-drainage audit r
         
         self.processing = True
         self.generate_btn.config(text="⏳ Processing...", state='disabled', bg='#6c7086')
-        self.progress.start(10)
+        self.progress.config(value=0)
+        self.status_text.set("Starting...")
+        self.phase_timer = PhaseTimer()
         
-        # Start processing in separate thread
-        thread = threading.Thread(target=self.generate_report)
-        thread.daemon = True
+        # Hand the job to the worker thread
+        self.jobs.put(lambda: self.generate_report(profile))
+    
+    def start_worker(self):
+        """Start the worker thread that runs queued reports"""
+        thread = threading.Thread(target=self.run_worker, daemon=True)
         thread.start()
     
-    def generate_report(self):
-        """Main report generation logic"""
+    def run_worker(self):
+        """Parse the template up front, then run jobs as they are queued"""
+        try:
+            report_engine.TEMPLATES.preload(self.template_path)
+        except Exception as e:
+            # Not fatal: the first report loads it and reports the error
+            self.log(f"Could not preload template: {e}")
+        while True:
+            job = self.jobs.get()
+            job()
+    
+    def generate_report(self, profile=False):
+        """Main report generation logic (profile=True also writes profile files)"""
         try:
             self.log("🚀 Starting audit report generation...")
             self.log(f"📊 Countsheet: {self.countsheet_path.get().split('/')[-1]}")
@@ -893,469 +963,66 @@ This application is designed to automate the generation of post-drainage audit r
             self.log(f"📁 Master: {self.master_path.get().split('/')[-1]}")
             self.log("=" * 60)
             
-            # Redirect stdout to capture print statements
-            old_stdout = sys.stdout
-            sys.stdout = mystdout = io.StringIO()
-            
+            # Stream print statements to the console line by line as they happen
+            writer = ChannelWriter(self.events, "📋 ")
+            profiler = nullcontext()
+            if profile:
+                profiler = profiled(profile_name(self.countsheet_path.get()),
+                                    os.path.dirname(os.path.abspath(self.output_path.get())))
             try:
-                # Call the main processing function
-                self.process_audit_report()
-                
-                # Get captured output
-                output = mystdout.getvalue()
-                if output:
-                    for line in output.split('\n'):
-                        if line.strip():
-                            self.log(f"📋 {line}")
-                
-                self.log("=" * 60)
-                self.log("✅ Report generated successfully!")
-                self.log(f"💾 Saved to: {self.output_path.get().split('/')[-1]}")
-                
-                # Show success message
-                self.root.after(0, lambda: messagebox.showinfo("Success", 
-                    "Audit report generated successfully!\n\n" +
-                    f"Output saved to:\n{self.output_path.get()}"))
-                
+                with metrics.recording() as recorder, redirect_stdout(writer), profiler:
+                    # Call the main processing function
+                    self.process_audit_report()
             finally:
-                sys.stdout = old_stdout
+                writer.flush()
+            
+            self.log_metrics(recorder)
+            self.log("=" * 60)
+            self.log("✅ Report generated successfully!")
+            self.log(f"💾 Saved to: {self.output_path.get().split('/')[-1]}")
+            self.events.finished(True, "Audit report generated successfully!\n\n" +
+                                 f"Output saved to:\n{self.output_path.get()}")
                 
         except Exception as e:
             self.log(f"❌ Error: {str(e)}")
-            self.root.after(0, lambda e=e: messagebox.showerror("Error", 
-                f"Failed to generate report:\n\n{str(e)}"))
-        
-        finally:
-            # Reset UI state
-            self.processing = False
-            self.root.after(0, self.reset_ui_state)
+            self.events.finished(False, f"Failed to generate report:\n\n{str(e)}")
+    
+    def log_metrics(self, recorder):
+        """Show the phase timing table and keep it in METRICS_FILE"""
+        self.log("⏱️ Phase timings:")
+        for line in recorder.format_table().splitlines():
+            self.log(f"   {line}")
+        try:
+            recorder.write_jsonl(METRICS_FILE,
+                                 countsheet=self.countsheet_path.get(),
+                                 output=self.output_path.get())
+        except OSError as e:
+            self.log(f"Could not write metrics to {METRICS_FILE}: {e}")
+    
+    def finish_generation(self, ok, message):
+        """Runs on the main thread once the worker has finished"""
+        self.processing = False
+        self.reset_ui_state()
+        if ok:
+            messagebox.showinfo("Success", message)
+        else:
+            messagebox.showerror("Error", message)
     
     def reset_ui_state(self):
         """Reset UI to normal state after processing"""
         self.generate_btn.config(text="🚀 Generate Report", state='normal', bg='#89b4fa')
-        self.progress.stop()
+        self.progress.config(value=0)
+        self.status_text.set("")
     
     def process_audit_report(self):
-        """Main processing logic - adapted from your original script"""
-        
-        # File paths from GUI
-        COUNTSHEET_FILE = self.countsheet_path.get()
-        TEMPLATE_FILE = self.template_path  # Use resource_path
-        MASTER_FILE = self.master_path.get()
-        OUTPUT_FILE = self.output_path.get()
-        
-        # Your original mapping
-        MAPPING = {
-            0: lambda i, row: i+1,  # Sr No
-            2: lambda i, row: 'Rutul Shah Co & LLp',  # Audit Team (static)
-            3: lambda i, row: row.get('Distributor code', ''),  # Anchor Code
-            5: lambda i, row: row.get('Distributor Name', ''),  # Distributor name
-            6: lambda i, row: row.get('Item/SKU Code', ''),  # Article Code
-            7: lambda i, row: row.get('Item Name', ''),  # Brand Pack
-            8: lambda i, row: row.get('Field 2', ''),  # NPI / NON - NPI
-            9: lambda i, row: row.get('Field 3', ''),  # Rate Excluding GST
-            10: lambda i, row: row.get('Item Rate', ''),  # Rate Including GST
-            11: lambda i, row: row.get('Field 1', ''),  # GST (%)
-            12: lambda i, row: row.get('Field 4', ''),  # Standard Pack
-            13: lambda i, row: row.get('Original QTY', ''),  # Primary Damage (Pcs)
-            14: lambda i, row: row.get('Original Damage', ''),  # Non-Saleable product and Non-manufacturing Defect (Pcs)
-            15: lambda i, row: row.get('Original Expired', ''),  # BBD Stock (Pcs)
-            21: lambda i, row: row.get('Manu Date', ''),  # Manufacturing Date
-            22: lambda i, row: row.get('Expiry Date', ''),  # Expiry Date
-            25: lambda i, row: row.get('Remarks', ''),  # Remarks
-        }
-        
-        # Read Countsheet data
-        print("Loading countsheet data...")
-        wb_count = openpyxl.load_workbook(COUNTSHEET_FILE, data_only=True)
-        ws_count = wb_count.active
-        count_headers = [cell.value for cell in next(ws_count.iter_rows(min_row=1, max_row=1))]
-        count_data = []
-        
-        for row in ws_count.iter_rows(min_row=2, values_only=True):
-            row_dict = dict(zip(count_headers, row))
-            
-            def is_valid(val):
-                if val is None:
-                    return False
-                if isinstance(val, str):
-                    return val.strip() not in ("", "0", "0.0")
-                try:
-                    return float(val) != 0.0
-                except Exception:
-                    return True
-            
-            values = [row_dict.get(col) for col in ['Original QTY', 'Original Damage', 'Original Expired']]
-            if any(is_valid(v) for v in values):
-                count_data.append(row_dict)
-        
-        print(f"Found {len(count_data)} valid data rows")
-        
-        # Open template and get sheet
-        print("Loading template...")
-        wb_temp = openpyxl.load_workbook(TEMPLATE_FILE)
-        ws_temp = wb_temp['Artical level format']
-        
-        # Store formatting and formula from original row 5
-        formatting = []
-        for col in range(1, 28):
-            cell = ws_temp.cell(row=5, column=col)
-            formula = None
-            if isinstance(cell.value, str) and cell.value.startswith('='):
-                formula = cell.value
-            formatting.append({
-                'font': copy(cell.font),
-                'border': copy(cell.border),
-                'fill': copy(cell.fill),
-                'number_format': cell.number_format,
-                'protection': copy(cell.protection),
-                'alignment': copy(cell.alignment),
-                'formula': formula
-            })
-        
-        # Find the row with the 'Total' label
-        total_label_row = None
-        for row in range(1, ws_temp.max_row + 1):
-            cell = ws_temp.cell(row=row, column=5)
-            if cell.value and isinstance(cell.value, str) and 'total' in cell.value.lower():
-                total_label_row = row
-                break
-        
-        if total_label_row is None:
-            raise Exception("Could not find the 'Total' label row in column E.")
-        
-        # Remove existing data rows and insert new ones
-        if total_label_row > 5:
-            ws_temp.delete_rows(5, total_label_row - 5)
-        
-        ws_temp.insert_rows(5, len(count_data))
-        
-        print("Formatting and populating data rows...")
-        
-        # Apply formatting and populate data
-        for i in range(len(count_data)):
-            for col in range(1, 28):
-                cell = ws_temp.cell(row=5 + i, column=col)
-                fmt = formatting[col-1]
-                cell.font = copy(fmt['font'])
-                cell.border = copy(fmt['border'])
-                cell.fill = copy(fmt['fill'])
-                cell.number_format = fmt['number_format']
-                cell.protection = copy(fmt['protection'])
-                cell.alignment = copy(fmt['alignment'])
-                cell.value = None
-        
-        # Write data and formulas
-        for i, row in enumerate(count_data):
-            for col_idx in range(27):
-                cell = ws_temp.cell(row=5 + i, column=col_idx+1)
-                if col_idx in MAPPING:
-                    value = MAPPING[col_idx](i, row)
-                    cell.value = value
-                else:
-                    fmt = formatting[col_idx]
-                    if fmt['formula']:
-                        def repl(m):
-                            col_letter = m.group(1)
-                            return f"{col_letter}{5 + i}"
-                        formula = re.sub(r'([A-Z]+)5', repl, fmt['formula'])
-                        cell.value = formula
-            
-            # Calculate INR columns
-            try:
-                rate_incl_gst = float(row.get('Item Rate', 0) or 0)
-                primary_damage_pcs = float(row.get('Original QTY', 0) or 0)
-                non_saleable_pcs = float(row.get('Original Damage', 0) or 0)
-                bbd_stock_pcs = float(row.get('Original Expired', 0) or 0)
-            except:
-                rate_incl_gst = primary_damage_pcs = non_saleable_pcs = bbd_stock_pcs = 0
-            
-            # Calculate totals
-            total_verified_qty = primary_damage_pcs + non_saleable_pcs + bbd_stock_pcs
-            ws_temp.cell(row=5 + i, column=17).value = total_verified_qty
-            
-            primary_damage_inr = primary_damage_pcs * rate_incl_gst
-            non_saleable_inr = non_saleable_pcs * rate_incl_gst
-            bbd_stock_inr = bbd_stock_pcs * rate_incl_gst
-            
-            ws_temp.cell(row=5 + i, column=18).value = primary_damage_inr
-            ws_temp.cell(row=5 + i, column=19).value = non_saleable_inr
-            ws_temp.cell(row=5 + i, column=20).value = bbd_stock_inr
-            
-            total_audited_value = primary_damage_inr + non_saleable_inr + bbd_stock_inr
-            ws_temp.cell(row=5 + i, column=21).value = total_audited_value
-        
-        print("Calculating subtotals...")
-        
-        # Calculate subtotals
-        subtotal_row = 5 + len(count_data)
-        
-        def safe_float(val):
-            try:
-                return float(val)
-            except (TypeError, ValueError):
-                return 0.0
-        
-        for col in range(14, 22):
-            col_values = []
-            for i in range(len(count_data)):
-                val = ws_temp.cell(row=5 + i, column=col).value
-                if isinstance(val, str) and val.startswith('='):
-                    continue
-                col_values.append(safe_float(val))
-            subtotal = sum(col_values)
-            ws_temp.cell(row=subtotal_row, column=col).value = subtotal
-        
-        # Save initial file
-        wb_temp.save(OUTPUT_FILE)
-        print(f'Data written to {OUTPUT_FILE}')
-        
-        # Master file lookup
-        print("Processing master file lookup...")
-        
-        wb_out = openpyxl.load_workbook(OUTPUT_FILE)
-        ws_out = wb_out['Artical level format']
-        anchor_code = ws_out.cell(row=5, column=4).value
-        distributor_name = ws_out.cell(row=5, column=6).value
-        
-        print(f"Looking up: Anchor Code = {anchor_code}, Distributor = {distributor_name}")
-        print(f"DEBUG: Anchor Code type: {type(anchor_code)}, value: '{anchor_code}'")
-        print(f"DEBUG: Distributor Name type: {type(distributor_name)}, value: '{distributor_name}'")
-        
-        wb_master = openpyxl.load_workbook(MASTER_FILE, data_only=True)
-        ws_master = wb_master.active
-        master_headers = [cell.value for cell in next(ws_master.iter_rows(min_row=1, max_row=1))]
-        print(f"DEBUG: Master file headers: {master_headers}")
-        
-        # Find relevant columns
-        ac_idx = None
-        dn_idx = None
-        for idx, h in enumerate(master_headers):
-            if h and 'anchor code' in str(h).lower():
-                ac_idx = idx
-                print(f"DEBUG: Found Anchor Code column at index {idx}: '{h}'")
-            if h and ('db name' in str(h).lower() or 'distributor name' in str(h).lower()):
-                dn_idx = idx
-                print(f"DEBUG: Found Distributor Name column at index {idx}: '{h}'")
-        
-        if ac_idx is None or dn_idx is None:
-            print('Could not find required columns in master file')
-            print(f"DEBUG: ac_idx = {ac_idx}, dn_idx = {dn_idx}")
-            return
-        
-        # Add normalize_code function for robust matching
-        def normalize_code(val):
-            s = str(val).strip()
-            if s.endswith('.0'):
-                s = s[:-2]
-            return s
-        
-        # Find matching row
-        found = False
-        print(f"DEBUG: Searching for Anchor Code '{anchor_code}' and Distributor '{distributor_name}'")
-        row_count = 0
-        for row in ws_master.iter_rows(min_row=2, values_only=True):
-            row_count += 1
-            if row_count <= 5:  # Show first 5 rows for debugging
-                print(f"DEBUG: Row {row_count}: AC='{row[ac_idx]}', DN='{row[dn_idx]}'")
-            if normalize_code(row[ac_idx]) == normalize_code(anchor_code) and \
-               str(row[dn_idx]).strip().lower() == str(distributor_name).strip().lower():
-                row_dict = dict(zip(master_headers, row))
-                print('Found matching row in master file')
-                print(f"DEBUG: Match found at row {row_count}")
-                anchor_name_val = row_dict.get('Anchor Name')
-                region_val = row_dict.get('Region')
-                
-                # Find audit serial number
-                audit_key = next((h for h in master_headers 
-                                if h and str(h).strip().lower() == "audit std serial no"), None)
-                audit_std_serial_no_val = row[master_headers.index(audit_key)] if audit_key else ""
-                
-                # Fill data in output file
-                for i in range(len(count_data)):
-                    ws_out.cell(row=5 + i, column=5).value = anchor_name_val
-                    ws_out.cell(row=5 + i, column=2).value = region_val
-                
-                ws_out.cell(row=2, column=2).value = audit_std_serial_no_val
-                
-                # Fill Sign Format sheet
-                print("Updating Sign Format sheet...")
-                ws_sign = wb_out['Sign Format.']
-                
-                ws_sign.cell(row=4, column=3).value = audit_std_serial_no_val
-                ws_sign.cell(row=6, column=3).value = row_dict.get('Anchor Code/ DB Code', '')
-                
-                db_name = row_dict.get('Anchor Name', '')
-                ws_sign.cell(row=7, column=3).value = db_name
-
-                dist_name = row_dict.get('DB Name', '')
-                #ws_sign.cell(row=7, column=3).value = dist_name
-                
-                city = row_dict.get('Distributor City', '')
-                ws_sign.cell(row=8, column=3).value = f"{dist_name} & {city}" if dist_name or city else ''
-                ws_sign.cell(row=9, column=3).value = datetime.datetime.now().strftime('%d-%m-%Y')
-                
-                # Update date placeholders
-                today_str = datetime.datetime.now().strftime('%d-%m-%Y')
-                
-                for cell_ref in ['B20', 'B22']:
-                    note_cell = ws_sign[cell_ref]
-                    if note_cell.value:
-                        if 'date upto  ( )' in note_cell.value:
-                            note_cell.value = note_cell.value.replace('date upto  ( )', f'date upto ({today_str})')
-                        elif 'date of Audit. ( )' in note_cell.value:
-                            note_cell.value = note_cell.value.replace('date of Audit. ( )', f'date of Audit. ({today_str})')
-                        elif '()' in note_cell.value:
-                            note_cell.value = note_cell.value.replace('()', f'({datetime.datetime.now().strftime("%d-%m-%y")})')
-                
-                # Add subtotals to Sign Format
-                ws_art = wb_out['Artical level format']
-                total_row_idx = None
-                for row_idx in range(1, ws_art.max_row + 1):
-                    cell = ws_art.cell(row=row_idx, column=5)
-                    if cell.value and isinstance(cell.value, str) and 'total' in cell.value.lower():
-                        total_row_idx = row_idx
-                        break
-                
-                if total_row_idx:
-                    ws_sign.cell(row=12, column=2).value = ws_art.cell(row=total_row_idx, column=14).value
-                    ws_sign.cell(row=12, column=3).value = ws_art.cell(row=total_row_idx, column=15).value
-                    ws_sign.cell(row=12, column=4).value = ws_art.cell(row=total_row_idx, column=16).value
-                    ws_sign.cell(row=12, column=6).value = ws_art.cell(row=total_row_idx, column=18).value
-                    ws_sign.cell(row=12, column=7).value = ws_art.cell(row=total_row_idx, column=19).value
-                    ws_sign.cell(row=12, column=8).value = ws_art.cell(row=total_row_idx, column=20).value
-                    ws_sign.cell(row=12, column=10).value = row_dict.get('Reported Value', '')
-                
-                found = True
-                break
-        
-        if not found:
-            print('No matching row found in master file')
-        
-        # --- Group by Manufacturing Quarter and aggregate Total Audited Value ---
-        print("Processing Manufacturing Quarter grouping...")
-        
-        # Read data from Artical level format sheet with calculated values (not formulas)
-        wb_art_data = openpyxl.load_workbook(OUTPUT_FILE, data_only=True)
-        ws_art = wb_art_data['Artical level format']
-        
-        # Manufacturing Date is in column V (22) and Total Audited Value is in column U (21)
-        manu_date_col = 22  # Column V (Manufacturing Date)
-        total_audited_value_col = 21  # Column U (Total Audited Value Including GST)
-        
-        print(f"Using Manufacturing Date column V ({manu_date_col})")
-        print(f"Using Total Audited Value column U ({total_audited_value_col})")
-        
-        def calculate_quarter(manufacturing_date):
-            """Calculate quarter based on manufacturing date"""
-            if not manufacturing_date:
-                return None
-            
-            try:
-                # Convert to datetime if it's a string
-                if isinstance(manufacturing_date, str):
-                    # Try different date formats
-                    for fmt in ['%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y']:
-                        try:
-                            manufacturing_date = datetime.datetime.strptime(manufacturing_date, fmt)
-                            break
-                        except ValueError:
-                            continue
-                    else:
-                        return None
-                
-                # If it's already a datetime object
-                if isinstance(manufacturing_date, datetime.datetime):
-                    month = manufacturing_date.month
-                    year = manufacturing_date.year
-                    
-                    # Calculate fiscal year (April to March) - use short format (24-25)
-                    if month >= 4:  # April to December
-                        fiscal_year = f"{str(year)[-2:]}-{str(year+1)[-2:]}"
-                    else:  # January to March
-                        fiscal_year = f"{str(year-1)[-2:]}-{str(year)[-2:]}"
-                    
-                    # Calculate quarter
-                    if month in [4, 5, 6]:
-                        quarter = "Q1"
-                    elif month in [7, 8, 9]:
-                        quarter = "Q2"
-                    elif month in [10, 11, 12]:
-                        quarter = "Q3"
-                    else:  # 1, 2, 3
-                        quarter = "Q4"
-                    
-                    return f"{quarter} FY {fiscal_year}"
-                
-                return None
-            except Exception as e:
-                print(f"Error calculating quarter for date {manufacturing_date}: {e}")
-                return None
-        
-        # Group by Manufacturing Quarter and aggregate Total Audited Value
-        quarter_data = {}
-        
-        # Read data rows (starting from row 5)
-        for row in range(5, ws_art.max_row + 1):
-            manu_date_cell = ws_art.cell(row=row, column=manu_date_col)
-            value_cell = ws_art.cell(row=row, column=total_audited_value_col)
-            
-            manu_date = manu_date_cell.value
-            value = value_cell.value
-            
-            # Calculate quarter from manufacturing date
-            quarter = calculate_quarter(manu_date)
-            
-            # Debug: Print first few rows to see what we're reading
-            if row <= 10:
-                print(f"Row {row}: Date='{manu_date}' (type: {type(manu_date)}), Quarter='{quarter}', Value='{value}' (type: {type(value)})")
-            
-            # Skip if quarter is empty or None
-            if not quarter or quarter == '':
-                continue
-            
-            # Convert value to float, skip if not numeric
-            try:
-                value = float(value) if value is not None else 0.0
-            except (ValueError, TypeError):
-                value = 0.0
-            
-            # Aggregate by quarter
-            if quarter in quarter_data:
-                quarter_data[quarter] += value
-            else:
-                quarter_data[quarter] = value
-        
-        print(f"Found {len(quarter_data)} unique quarters: {list(quarter_data.keys())}")
-        
-        # Sort quarters (assuming they are in format like "Q1 FY 2024-2025", "Q2 FY 2024-2025", etc.)
-        sorted_quarters = sorted(quarter_data.keys())
-        
-        # Clear C16-I16 and C17-I17 first
-        for col in range(3, 10):  # C to I (columns 3-9)
-            ws_sign.cell(row=16, column=col).value = None
-            ws_sign.cell(row=17, column=col).value = None
-        
-        # Fill quarter names in C16-I16 and aggregated values in C17-I17
-        for i, quarter in enumerate(sorted_quarters):
-            if i >= 7:  # Maximum 7 columns (C to I)
-                break
-            
-            col = 3 + i  # Start from column C (3)
-            aggregated_value = quarter_data[quarter]
-            
-            # Fill quarter name in row 16
-            ws_sign.cell(row=16, column=col).value = quarter
-            # Fill aggregated value in row 17
-            ws_sign.cell(row=17, column=col).value = aggregated_value
-            
-            print(f"Filled {quarter}: {aggregated_value} in column {get_column_letter(col)}")
-        
-        print(f"Manufacturing Quarter grouping completed. Filled {len(sorted_quarters)} quarters.")
-        
-        # Save final file
-        wb_out.save(OUTPUT_FILE)
-        print(f'Report completed and saved to {OUTPUT_FILE}')
+        """Run the report engine with the paths selected in the GUI"""
+        return report_engine.process_audit_report(
+            self.countsheet_path.get(),
+            self.template_path,
+            self.master_path.get(),
+            self.output_path.get(),
+            progress=self.events.progress,
+        )
 
 
 def main():
@@ -0,0 +1,93 @@
+"""
+Profiling for single report runs.
+
+`profiled()` runs a block under cProfile and, at the same time, a stack
+sampler on the same thread. It writes:
+
+    <name>.pstats      - cProfile data (python -m pstats, snakeviz, ...)
+    <name>.collapsed   - sampled stacks, one "frame;frame;frame count" line
+                         each, ready for flamegraph.pl or speedscope
+"""
+import cProfile
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from sheet_readers import countsheet_stem
+
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.005
+
+
+class StackSampler:
+    """Background thread that periodically records one thread's Python stack"""
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        frames = sys._current_frames
+        while not self._stop.wait(self.interval):
+            frame = frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def profile_name(countsheet_file):
+    """Base name for a run's profile files: the countsheet's"""
+    return countsheet_stem(countsheet_file)
+
+
+@contextmanager
+def profiled(name, output_dir, top=15):
+    """Profile the block; files are written to output_dir even if it raises"""
+    profiler = cProfile.Profile()
+    sampler = StackSampler()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+
+        os.makedirs(output_dir or '.', exist_ok=True)
+        base = os.path.join(output_dir, name)
+        profiler.dump_stats(base + '.pstats')
+        sampler.write_collapsed(base + '.collapsed')
+
+        print(f"Profile written to {base}.pstats and {base}.collapsed "
+              f"({sum(sampler.stacks.values())} stack samples)")
+        stats = pstats.Stats(profiler, stream=sys.stdout)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(top)
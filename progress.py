@@ -0,0 +1,89 @@
+"""
+Thread-safe progress channel between the report engine and the GUI.
+
+The engine (running on a worker thread) posts events; the Tk main loop
+drains them on `root.after` ticks. Nothing here touches Tk, so widgets are
+only ever updated from the main thread.
+"""
+import queue
+import time
+
+
+class ProgressChannel:
+    """Queue of ('log' | 'progress' | 'finished', payload) events"""
+
+    def __init__(self):
+        self._events = queue.Queue()
+
+    def log(self, message):
+        self._events.put(('log', message))
+
+    def progress(self, phase, done, total):
+        """Engine progress callback: `done` of `total` rows in `phase`"""
+        self._events.put(('progress', (phase, done, total)))
+
+    def finished(self, ok, message):
+        self._events.put(('finished', (ok, message)))
+
+    def drain(self, limit=5000):
+        """Return up to `limit` pending events without blocking"""
+        events = []
+        try:
+            while len(events) < limit:
+                events.append(self._events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+
+class ChannelWriter:
+    """File-like object that turns print() output into log events, line by line"""
+
+    def __init__(self, channel, prefix=''):
+        self.channel = channel
+        self.prefix = prefix
+        self._partial = ''
+
+    def write(self, text):
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            if line.strip():
+                self.channel.log(f"{self.prefix}{line}")
+        return len(text)
+
+    def flush(self):
+        if self._partial.strip():
+            self.channel.log(f"{self.prefix}{self._partial}")
+        self._partial = ''
+
+
+class PhaseTimer:
+    """Tracks the current phase to estimate time remaining"""
+
+    def __init__(self):
+        self.phase = None
+        self.started = None
+
+    def update(self, phase, done, total):
+        """Return the ETA in seconds for this progress event, or None"""
+        now = time.monotonic()
+        if phase != self.phase:
+            self.phase = phase
+            self.started = now
+            return None
+        if not done or not total or done >= total:
+            return None
+        elapsed = now - self.started
+        return elapsed / done * (total - done)
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return ''
+    seconds = int(seconds + 0.5)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m left"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s left"
+    return f"{seconds}s left"
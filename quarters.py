@@ -0,0 +1,118 @@
+"""
+Manufacturing-date to fiscal-quarter bucketing.
+
+QuarterBucketer turns a Manu Date cell into a label like "Q1 FY 24-25".
+It accepts datetime/date values, Excel serial numbers and date strings.
+String parsing tries the format that matched last time first and caches
+the label per distinct string; labels come from a (year, month) table
+built up front for the fiscal year start month in use.
+"""
+import datetime
+import os
+
+from openpyxl.utils.datetime import from_excel
+
+
+DATE_FORMATS = ('%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y')
+
+# April to March unless TNBT_FISCAL_START_MONTH says otherwise
+DEFAULT_FISCAL_START_MONTH = int(os.environ.get('TNBT_FISCAL_START_MONTH', 4))
+
+# Years with precomputed labels; others are computed on first use
+TABLE_YEARS = range(1950, 2101)
+
+# Largest serial Excel can display (9999-12-31)
+MAX_EXCEL_SERIAL = 2958465
+
+# Distinct date strings remembered before the cache is reset
+STRING_CACHE_SIZE = 65536
+
+
+class QuarterBucketer:
+    """Maps manufacturing dates to quarter labels for one fiscal year start month"""
+
+    def __init__(self, fiscal_start_month=None, formats=DATE_FORMATS):
+        if fiscal_start_month is None:
+            fiscal_start_month = DEFAULT_FISCAL_START_MONTH
+        if not 1 <= fiscal_start_month <= 12:
+            raise ValueError(f"fiscal start month must be 1-12, got {fiscal_start_month}")
+        self.fiscal_start_month = fiscal_start_month
+        self.formats = list(formats)
+        self._strings = {}
+        self._labels = {(year, month): self._make_label(year, month)
+                        for year in TABLE_YEARS for month in range(1, 13)}
+
+    def _make_label(self, year, month):
+        start = self.fiscal_start_month
+        quarter = (month - start) % 12 // 3 + 1
+        fy_start = year if month >= start else year - 1
+        if start == 1:
+            fiscal_year = f"{fy_start % 100:02d}"
+        else:
+            fiscal_year = f"{fy_start % 100:02d}-{(fy_start + 1) % 100:02d}"
+        return f"Q{quarter} FY {fiscal_year}"
+
+    def label(self, year, month):
+        """Quarter label for a calendar year and month"""
+        key = (year, month)
+        label = self._labels.get(key)
+        if label is None:
+            label = self._labels[key] = self._make_label(year, month)
+        return label
+
+    def quarter(self, value):
+        """Quarter label for a Manu Date cell, or None if it is blank or not a date"""
+        if not value:
+            return None
+        if isinstance(value, datetime.date):  # includes datetime
+            return self.label(value.year, value.month)
+        if isinstance(value, str):
+            try:
+                return self._strings[value]
+            except KeyError:
+                pass
+            label = self._parse(value)
+            if len(self._strings) >= STRING_CACHE_SIZE:
+                self._strings.clear()
+            self._strings[value] = label
+            return label
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return self._serial(value)
+        return None
+
+    def _parse(self, text):
+        for n, fmt in enumerate(self.formats):
+            try:
+                parsed = datetime.datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+            if n:
+                # Countsheets rarely mix formats: try this one first from now on
+                self.formats.insert(0, self.formats.pop(n))
+            return self.label(parsed.year, parsed.month)
+        return None
+
+    def _serial(self, serial):
+        if not 0 < serial <= MAX_EXCEL_SERIAL:
+            return None
+        parsed = from_excel(serial)
+        return self.label(parsed.year, parsed.month)
+
+
+_default = None
+
+
+def default_bucketer():
+    """Shared bucketer for the configured fiscal year start month"""
+    global _default
+    if _default is None:
+        _default = QuarterBucketer()
+    return _default
+
+
+def set_fiscal_start_month(month):
+    """Change the default fiscal year start for this and child processes"""
+    global _default, DEFAULT_FISCAL_START_MONTH
+    _default = QuarterBucketer(month)
+    DEFAULT_FISCAL_START_MONTH = month
+    os.environ['TNBT_FISCAL_START_MONTH'] = str(month)
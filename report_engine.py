@@ -0,0 +1,1527 @@
+"""
+Headless report engine for the TNBT Post Drainage Final Report Generator.
+
+All report logic lives here so it can be driven from the Tk GUI, from the
+command line, or from a process pool that works through a whole audit cycle.
+
+Usage:
+    python report_engine.py COUNTSHEET.xlsx --master MASTER.xlsx -o report.xlsx
+    python report_engine.py countsheets/ --master MASTER.xlsx -o reports/
+    python report_engine.py manifest.csv --master MASTER.xlsx -o reports/
+    python report_engine.py consolidated.xlsx --master MASTER.xlsx -o reports/ --split
+    python report_engine.py countsheets/ --master MASTER.xlsx -o reports/ --rollup
+    python report_engine.py inbox/ --master MASTER.xlsx -o outbox/ --watch
+"""
+import argparse
+import csv
+import datetime
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack, redirect_stdout
+from copy import copy
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+
+import metrics
+import xlsx_writer
+from columns import AmountColumns
+from formulas import FormulaTemplate
+from fuzzy_names import DEFAULT_FUZZY_THRESHOLD, set_fuzzy_threshold
+from profiling import profile_name, profiled
+from quarters import default_bucketer, set_fiscal_start_month
+from rollup import ROLLUP_NAME, Rollup, report_facts
+from templates import TemplateCache
+from manifest import ReportManifest, match_sha256, rows_sha256
+from master_index import MasterIndex, is_master_store, normalize_code
+from master_store import set_master_as_of
+from sheet_readers import (TEXT_EXTENSIONS, XLSX_READERS, countsheet_records, countsheet_stem,
+                           iter_countsheet, open_countsheet, set_xlsx_reader)
+from xlsx_writer import (XLSX_WRITERS, ReportXmlWriter, UnsupportedTemplate,
+                         load_template as load_xml_template, set_xlsx_writer)
+
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+COUNTSHEET_EXTENSIONS = EXCEL_EXTENSIONS + TEXT_EXTENSIONS
+
+# Countsheets with at least this many rows are written in write-only mode
+STREAM_ROW_THRESHOLD = 50000
+
+# Rows between progress(phase, done, total) callbacks
+PROGRESS_EVERY = 500
+
+# Streaming output computes INR amounts for this many rows at a time
+AMOUNT_BLOCK_ROWS = 10000
+
+# Bump whenever a change alters the generated workbooks, so --incremental
+# runs rebuild reports made by older versions
+ENGINE_VERSION = 1
+
+
+# Utility to get resource path for PyInstaller and normal script
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(".")
+    return os.path.join(base_path, relative_path)
+
+
+DEFAULT_TEMPLATE = resource_path('template.xlsx')
+
+
+# Countsheet column -> output column mapping (0-based output column index)
+MAPPING = {
+    0: lambda i, row: i+1,  # Sr No
+    2: lambda i, row: 'Rutul Shah Co & LLp',  # Audit Team (static)
+    3: lambda i, row: row.get('Distributor code', ''),  # Anchor Code
+    5: lambda i, row: row.get('Distributor Name', ''),  # Distributor name
+    6: lambda i, row: row.get('Item/SKU Code', ''),  # Article Code
+    7: lambda i, row: row.get('Item Name', ''),  # Brand Pack
+    8: lambda i, row: row.get('Field 2', ''),  # NPI / NON - NPI
+    9: lambda i, row: row.get('Field 3', ''),  # Rate Excluding GST
+    10: lambda i, row: row.get('Item Rate', ''),  # Rate Including GST
+    11: lambda i, row: row.get('Field 1', ''),  # GST (%)
+    12: lambda i, row: row.get('Field 4', ''),  # Standard Pack
+    13: lambda i, row: row.get('Original QTY', ''),  # Primary Damage (Pcs)
+    14: lambda i, row: row.get('Original Damage', ''),  # Non-Saleable product and Non-manufacturing Defect (Pcs)
+    15: lambda i, row: row.get('Original Expired', ''),  # BBD Stock (Pcs)
+    21: lambda i, row: row.get('Manu Date', ''),  # Manufacturing Date
+    22: lambda i, row: row.get('Expiry Date', ''),  # Expiry Date
+    25: lambda i, row: row.get('Remarks', ''),  # Remarks
+}
+
+
+def process_audit_report(countsheet_file, template_file, master_file, output_file,
+                         single_pass=True, cache_dir=None,
+                         stream_threshold=STREAM_ROW_THRESHOLD, progress=None):
+    """Generate one audit report.
+
+    By default the workbook is built in memory and written exactly once;
+    single_pass=False keeps the original save -> reload -> save round trip.
+    Countsheets with at least stream_threshold rows are written through a
+    write-only workbook instead, so memory stays flat (None disables it).
+    cache_dir overrides where the master index cache is kept.
+    Progress is reported with print() so callers can capture it, and as
+    progress(phase, rows_done, rows_total) calls when a callback is given.
+    Returns a small summary dict describing the report that was written.
+    """
+    COUNTSHEET_FILE = countsheet_file
+    TEMPLATE_FILE = template_file
+    MASTER_FILE = master_file
+    OUTPUT_FILE = output_file
+
+    summary = {
+        'countsheet': COUNTSHEET_FILE,
+        'output': OUTPUT_FILE,
+        'rows': 0,
+        'matched': False,
+        'fuzzy_match': None,
+    }
+
+    def lookup(anchor_code, distributor_name):
+        return lookup_master(MASTER_FILE, anchor_code, distributor_name, cache_dir)
+
+    # Read Countsheet data; the sheet is opened once, and its estimated size
+    # (known before any row is read) chooses how the report is built
+    print("Loading countsheet data...")
+    with ExitStack() as stack:
+        with metrics.span('countsheet open') as span:
+            sheet = stack.enter_context(open_countsheet(COUNTSHEET_FILE))
+            estimated_rows = span.rows = sheet.estimated_rows
+        records = countsheet_records(sheet)
+        if single_pass and _use_xml_writer(TEMPLATE_FILE):
+            return _build_xml(records, TEMPLATE_FILE, OUTPUT_FILE,
+                              lookup, summary, progress, estimated_rows)
+        if single_pass and stream_threshold is not None and estimated_rows >= stream_threshold:
+            print(f"Countsheet has about {estimated_rows} rows - "
+                  "streaming output (write-only mode)")
+            return _build_streaming(records, TEMPLATE_FILE, OUTPUT_FILE, lookup, summary,
+                                    progress, estimated_rows)
+
+        # insert_rows below needs the row count up front, so the filtered stream
+        # is collected here; only rows with a quantity are ever materialized
+        # (the read-only workbook parses rows lazily, so this also covers reading them)
+        with metrics.span('countsheet load') as span:
+            count_data = []
+            for row in records:
+                count_data.append(row)
+                if progress and len(count_data) % PROGRESS_EVERY == 0:
+                    progress("Loading countsheet", len(count_data), estimated_rows)
+            span.rows = len(count_data)
+
+    print(f"Found {len(count_data)} valid data rows")
+    return build_report(count_data, TEMPLATE_FILE, OUTPUT_FILE, lookup, summary,
+                        single_pass, progress)
+
+
+def render_report(rows, template_file, output_file, match,
+                  stream_threshold=STREAM_ROW_THRESHOLD, progress=None):
+    """Build a report for rows whose master row has already been looked up.
+
+    match is what lookup_master returned for the rows' distributor.
+    """
+    summary = {'output': output_file, 'rows': 0, 'matched': False, 'fuzzy_match': None}
+
+    def lookup(anchor_code, distributor_name):
+        return match
+
+    print(f"Rendering {len(rows)} data rows")
+    if _use_xml_writer(template_file):
+        return _build_xml(iter(rows), template_file, output_file, lookup, summary,
+                          progress, len(rows))
+    if stream_threshold is not None and len(rows) >= stream_threshold:
+        return _build_streaming(iter(rows), template_file, output_file, lookup, summary,
+                                progress, len(rows))
+    return build_report(rows, template_file, output_file, lookup, summary,
+                        progress=progress)
+
+
+def build_report(count_data, template_file, output_file, lookup, summary, single_pass=True,
+                 progress=None):
+    """Build the report for count_data in memory from the template and save it.
+
+    lookup(anchor_code, distributor_name) returns the master row dict, {}
+    when there is no match, or None when the master cannot be searched.
+    """
+    summary['rows'] = len(count_data)
+    row_total = len(count_data)
+
+    # Open template and get sheet
+    print("Loading template...")
+    with metrics.span('template load'):
+        wb_temp, (formatting, total_label_row) = TEMPLATES.checkout(template_file)
+        ws_temp = wb_temp['Artical level format']
+
+    print("Formatting and populating data rows...")
+
+    # Remove existing data rows and insert styled new ones. The row 5 style
+    # arrays already point into the template's style tables, so each cell
+    # only gets a copy of its column's ids instead of fresh font/border/fill/...
+    # objects.
+    with metrics.span('styling', row_total):
+        if total_label_row > 5:
+            ws_temp.delete_rows(5, total_label_row - 5)
+
+        ws_temp.insert_rows(5, row_total)
+
+        styles = [fmt['style'] for fmt in formatting]
+        for i in range(row_total):
+            for col_idx, style in enumerate(styles):
+                ws_temp.cell(row=5 + i, column=col_idx+1)._style = copy(style)
+
+    # Verified qty and INR amounts for every row, as whole columns
+    with metrics.span('amounts', row_total):
+        amounts = AmountColumns(count_data)
+    amounts.report_problems()
+
+    # Populate data
+    with metrics.span('data write', row_total):
+        for i, row in enumerate(count_data):
+            values = data_row_values(i, row, formatting, amounts.row_amounts(i))
+            for col_idx, value in enumerate(values):
+                ws_temp.cell(row=5 + i, column=col_idx+1).value = value
+            if progress and (i + 1) % PROGRESS_EVERY == 0:
+                progress("Writing rows", i + 1, row_total)
+        if progress:
+            progress("Writing rows", row_total, row_total)
+
+    print("Calculating subtotals...")
+
+    # Calculate subtotals from the columns, not by reading the cells back
+    subtotal_row = 5 + row_total
+
+    with metrics.span('subtotals', row_total):
+        subtotals = amounts.add_subtotals({})
+        for col, subtotal in subtotals.items():
+            ws_temp.cell(row=subtotal_row, column=col).value = subtotal
+
+    if not single_pass:
+        return _finish_roundtrip(wb_temp, count_data, output_file, lookup, summary)
+
+    # Master file lookup, straight on the in-memory workbook
+    print("Processing master file lookup...")
+    ws_sign = wb_temp['Sign Format.']
+    anchor_code = ws_temp.cell(row=5, column=4).value
+    distributor_name = ws_temp.cell(row=5, column=6).value
+
+    with metrics.span('master lookup'):
+        match = lookup(anchor_code, distributor_name)
+        if match:
+            fill_master_details(ws_temp, ws_sign, match, row_total, subtotals)
+    if match is None:
+        summary['rollup'] = report_facts(match, subtotals, {})
+        with metrics.span('final save'):
+            wb_temp.save(output_file)
+        print(f'Data written to {output_file}')
+        return summary
+    if not match:
+        print('No matching row found in master file')
+    _record_match(summary, match)
+
+    # --- Group by Manufacturing Quarter and aggregate Total Audited Value ---
+    print("Processing Manufacturing Quarter grouping...")
+    with metrics.span('quarter grouping', row_total):
+        quarter_rows = ((row.get('Manu Date', ''), value)
+                        for row, value in zip(count_data, amounts.total_values))
+        quarter_data = aggregate_quarters(quarter_rows)
+        fill_quarter_summary(ws_sign, quarter_data)
+    summary['rollup'] = report_facts(match, subtotals, quarter_data)
+
+    # Save final file
+    if progress:
+        progress("Saving report", 0, 1)
+    with metrics.span('final save'):
+        wb_temp.save(output_file)
+    print(f'Report completed and saved to {output_file}')
+    return summary
+
+
+def read_template_layout(ws_temp):
+    """Row 5 formatting/formulas and the 'Total' label row of the article sheet"""
+    # Store formatting and formula from original row 5
+    formatting = []
+    for col in range(1, 28):
+        cell = ws_temp.cell(row=5, column=col)
+        formula = None
+        if isinstance(cell.value, str) and cell.value.startswith('='):
+            formula = cell.value
+        formatting.append({
+            'font': copy(cell.font),
+            'border': copy(cell.border),
+            'fill': copy(cell.fill),
+            'number_format': cell.number_format,
+            'protection': copy(cell.protection),
+            'alignment': copy(cell.alignment),
+            'style': copy(cell._style),
+            'formula': formula,
+            'formula_template': FormulaTemplate(formula) if formula else None,
+        })
+
+    # Find the row with the 'Total' label
+    total_label_row = find_total_row(ws_temp)
+    if total_label_row is None:
+        raise Exception("Could not find the 'Total' label row in column E.")
+    return formatting, total_label_row
+
+
+def _template_layout(wb):
+    return read_template_layout(wb['Artical level format'])
+
+
+# Templates are parsed once per process and copied for each report
+TEMPLATES = TemplateCache(_template_layout)
+
+
+def data_row_values(i, row, formatting, amounts):
+    """Values for the 27 columns of data row i (output row 5 + i).
+
+    amounts is the row's (verified qty, primary damage INR, non-saleable
+    INR, BBD INR, total audited value) from AmountColumns.
+    """
+    values = [None] * 27
+    for col_idx in range(27):
+        if col_idx in MAPPING:
+            values[col_idx] = MAPPING[col_idx](i, row)
+        else:
+            template = formatting[col_idx]['formula_template']
+            if template:
+                values[col_idx] = template.render(5 + i)
+
+    # Total verified qty, INR columns and total audited value (Q-U)
+    values[16:21] = amounts
+    return values
+
+
+def _build_streaming(rows, template_file, output_file, lookup, summary, progress=None,
+                     expected_rows=0):
+    """Write the report through a write-only workbook.
+
+    The template is only read: its header block, data-row styles, Total
+    row, footer and the other sheets are re-emitted row by row, and data
+    rows are written as they arrive from `rows`. Subtotals and quarter
+    totals are accumulated on the way, so memory does not grow with the
+    row count. expected_rows is the total passed to progress() while rows
+    are still arriving.
+    """
+    print("Loading template...")
+    with metrics.span('template load'):
+        wb_temp, (formatting, total_label_row) = TEMPLATES.checkout(template_file)
+        ws_temp = wb_temp['Artical level format']
+
+    rows, match = _lookup_first_row(rows, lookup, summary)
+
+    wb_out = openpyxl.Workbook(write_only=True)
+    sheets = {ws.title: wb_out.create_sheet(ws.title) for ws in wb_temp.worksheets}
+    ws_art = sheets['Artical level format']
+
+    # Header block
+    header_values = {}
+    if match:
+        header_values[(2, 2)] = match['audit_std_serial_no']
+    _copy_sheet_setup(ws_temp, ws_art)
+    _stream_template_rows(ws_temp, ws_art, 1, 4, header_values)
+
+    # One styled prototype cell per column; data cells share its style array
+    with metrics.span('styling'):
+        prototypes = []
+        for fmt in formatting:
+            proto = WriteOnlyCell(ws_art)
+            proto.font = fmt['font']
+            proto.border = fmt['border']
+            proto.fill = fmt['fill']
+            proto.number_format = fmt['number_format']
+            proto.protection = fmt['protection']
+            proto.alignment = fmt['alignment']
+            prototypes.append(proto._style)
+
+    print("Formatting and populating data rows...")
+    subtotals = {col: 0.0 for col in range(14, 22)}
+    row_count = 0
+
+    def write_rows():
+        # Yields (manufacturing date, total audited value) for the quarter grouping
+        nonlocal row_count
+        for i, row, values in _stream_row_values(rows, formatting, match, subtotals):
+            cells = []
+            for col_idx, value in enumerate(values):
+                cell = WriteOnlyCell(ws_art)
+                cell._style = copy(prototypes[col_idx])
+                # Set after the style so dates still get a date number format
+                cell.value = value
+                cells.append(cell)
+            ws_art.append(cells)
+            row_count = i + 1
+
+            if progress and row_count % PROGRESS_EVERY == 0:
+                progress("Writing rows", row_count, max(row_count, expected_rows))
+            yield row.get('Manu Date', ''), values[20]
+
+    print("Processing Manufacturing Quarter grouping...")
+    # Rows are read, filtered, written and grouped by quarter in one stream
+    with metrics.span('read + write rows') as span:
+        quarter_data = aggregate_quarters(write_rows())
+        span.rows = row_count
+    if progress:
+        progress("Writing rows", row_count, row_count)
+    print(f"Found {row_count} valid data rows")
+    summary['rows'] = row_count
+    summary['rollup'] = report_facts(match, subtotals, quarter_data)
+
+    # Total row and everything below it, shifted to follow the data
+    print("Calculating subtotals...")
+    with metrics.span('subtotals'):
+        offset = 5 + row_count - total_label_row
+        total_values = {(total_label_row, col): value for col, value in subtotals.items()}
+        _stream_template_rows(ws_temp, ws_art, total_label_row, ws_temp.max_row, total_values,
+                              offset)
+
+    # Remaining sheets are small and copied cell by cell
+    for ws_src in wb_temp.worksheets:
+        if ws_src.title == 'Artical level format':
+            continue
+        values = {}
+        if ws_src.title == 'Sign Format.':
+            if match:
+                print("Updating Sign Format sheet...")
+                values.update(sign_format_values(ws_src, match, subtotals))
+            with metrics.span('quarter grouping'):
+                values.update(quarter_summary_values(quarter_data))
+        _copy_sheet_setup(ws_src, sheets[ws_src.title])
+        _stream_template_rows(ws_src, sheets[ws_src.title], 1, ws_src.max_row, values)
+
+    if progress:
+        progress("Saving report", 0, 1)
+    with metrics.span('final save'):
+        wb_out.save(output_file)
+    print(f'Report completed and saved to {output_file}')
+    return summary
+
+
+def _lookup_first_row(rows, lookup, summary):
+    """Look up the master row for the first countsheet row of a stream.
+
+    The master row is needed before the first data row is written.
+    Returns the (unconsumed) rows and the lookup result.
+    """
+    first = next(rows, None)
+    if first is not None:
+        rows = itertools.chain([first], rows)
+        anchor_code = MAPPING[3](0, first)
+        distributor_name = MAPPING[5](0, first)
+    else:
+        anchor_code = distributor_name = None
+
+    print("Processing master file lookup...")
+    with metrics.span('master lookup'):
+        match = lookup(anchor_code, distributor_name)
+    if match == {}:
+        print('No matching row found in master file')
+    _record_match(summary, match)
+    return rows, match
+
+
+def _record_match(summary, match):
+    """Note in summary whether the master row was found, and if only approximately"""
+    summary['matched'] = bool(match)
+    summary['fuzzy_match'] = match.get('fuzzy_match') if match else None
+
+
+def _stream_row_values(rows, formatting, match, subtotals):
+    """Yield (i, countsheet row, output values) for every row of a stream.
+
+    INR amounts are computed AMOUNT_BLOCK_ROWS rows at a time and added
+    to subtotals; master attributes are filled in from match.
+    """
+    done = 0
+    while True:
+        block = list(itertools.islice(rows, AMOUNT_BLOCK_ROWS))
+        if not block:
+            break
+        amounts = AmountColumns(block, done)
+        amounts.report_problems()
+        amounts.add_subtotals(subtotals)
+        for j, row in enumerate(block):
+            values = data_row_values(done + j, row, formatting, amounts.row_amounts(j))
+            if match:
+                values[1] = match.get('Region')
+                values[4] = match.get('Anchor Name')
+            yield done + j, row, values
+        done += len(block)
+
+
+def _build_xml(rows, template_file, output_file, lookup, summary, progress=None,
+               expected_rows=0):
+    """Write the report with xlsx_writer: the template package is copied and
+    only the data rows are generated, as sheet XML.
+
+    Same flow as _build_streaming (subtotals and quarter totals are
+    accumulated while rows stream through), but nothing is built as
+    openpyxl objects, so output time is linear and memory flat.
+    """
+    print("Loading template...")
+    with metrics.span('template load'):
+        wb_temp, (formatting, total_label_row) = TEMPLATES.peek(template_file)
+        template = load_xml_template(template_file, total_label_row)
+
+    rows, match = _lookup_first_row(rows, lookup, summary)
+
+    subtotals = {col: 0.0 for col in range(14, 22)}
+    row_count = 0
+    with ReportXmlWriter(template, output_file) as writer:
+        writer.begin({(2, 2): match['audit_std_serial_no']} if match else None)
+
+        def write_rows():
+            # Yields (manufacturing date, total audited value) for the quarter grouping
+            nonlocal row_count
+            for i, row, values in _stream_row_values(rows, formatting, match, subtotals):
+                writer.write_row(values)
+                row_count = i + 1
+                if progress and row_count % PROGRESS_EVERY == 0:
+                    progress("Writing rows", row_count, max(row_count, expected_rows))
+                yield row.get('Manu Date', ''), values[20]
+
+        print("Formatting and populating data rows...")
+        print("Processing Manufacturing Quarter grouping...")
+        # Rows are read from the countsheet as they are written
+        with metrics.span('read + write rows') as span:
+            quarter_data = aggregate_quarters(write_rows())
+            span.rows = row_count
+        if progress:
+            progress("Writing rows", row_count, row_count)
+        print(f"Found {row_count} valid data rows")
+        summary['rows'] = row_count
+        summary['rollup'] = report_facts(match, subtotals, quarter_data)
+
+        print("Calculating subtotals...")
+        total_values = {(total_label_row, col): value for col, value in subtotals.items()}
+        sign_values = {}
+        if match:
+            print("Updating Sign Format sheet...")
+            sign_values.update(sign_format_values(wb_temp['Sign Format.'], match, subtotals))
+        with metrics.span('quarter grouping'):
+            sign_values.update(quarter_summary_values(quarter_data))
+
+        if progress:
+            progress("Saving report", 0, 1)
+        with metrics.span('final save'):
+            writer.finish(total_values, sign_values)
+    print(f'Report completed and saved to {output_file}')
+    return summary
+
+
+def _use_xml_writer(template_file):
+    """True when the native writer is selected and can copy this template"""
+    if xlsx_writer.XLSX_WRITER != 'native':
+        return False
+    try:
+        _, (_, total_label_row) = TEMPLATES.peek(template_file)
+        load_xml_template(template_file, total_label_row)
+    except UnsupportedTemplate as e:
+        print(f"Native writer cannot copy this template ({e}); using openpyxl")
+        return False
+    return True
+
+
+def _copy_sheet_setup(ws_src, ws_dst):
+    """Copy column widths and page setup to a write-only sheet"""
+    for key, dim in ws_src.column_dimensions.items():
+        new_dim = ws_dst.column_dimensions[key]
+        new_dim.min, new_dim.max = dim.min, dim.max
+        new_dim.width = dim.width
+        new_dim.hidden = dim.hidden
+        new_dim.outlineLevel = dim.outlineLevel
+        new_dim.collapsed = dim.collapsed
+
+    ws_dst.sheet_format = copy(ws_src.sheet_format)
+    ws_dst.sheet_properties = copy(ws_src.sheet_properties)
+    ws_dst.page_margins = copy(ws_src.page_margins)
+    ws_dst.print_options = copy(ws_src.print_options)
+    for attr in ('orientation', 'paperSize', 'scale', 'fitToWidth', 'fitToHeight'):
+        setattr(ws_dst.page_setup, attr, getattr(ws_src.page_setup, attr))
+    ws_dst.freeze_panes = ws_src.freeze_panes
+    if ws_src.print_title_rows:
+        ws_dst.print_title_rows = ws_src.print_title_rows
+
+
+def _stream_template_rows(ws_src, ws_dst, first_row, last_row, values=None, offset=0):
+    """Append template rows first_row..last_row to a write-only sheet.
+
+    values overrides cell values as {(template row, column): value}; offset
+    is how far the rows move down in the output. Merged ranges starting in
+    the copied rows move with them.
+    """
+    values = values or {}
+    last_row = max([last_row] + [row for row, _ in values])
+    max_col = max([ws_src.max_column] + [col for _, col in values])
+
+    for merged in ws_src.merged_cells.ranges:
+        if first_row <= merged.min_row <= last_row:
+            shifted = copy(merged)
+            shifted.shift(row_shift=offset)
+            ws_dst.merged_cells.add(shifted.coord)
+
+    for row in range(first_row, last_row + 1):
+        height = ws_src.row_dimensions[row].height
+        if height is not None:
+            ws_dst.row_dimensions[row + offset].height = height
+        cells = []
+        for col in range(1, max_col + 1):
+            src = ws_src.cell(row=row, column=col)
+            cell = WriteOnlyCell(ws_dst, value=values.get((row, col), src.value))
+            if src.has_style:
+                cell.font = copy(src.font)
+                cell.border = copy(src.border)
+                cell.fill = copy(src.fill)
+                cell.number_format = src.number_format
+                cell.protection = copy(src.protection)
+                cell.alignment = copy(src.alignment)
+            cells.append(cell)
+        ws_dst.append(cells)
+
+
+def _finish_roundtrip(wb_temp, count_data, output_file, lookup, summary):
+    """Original finishing path: save, reload, reload with data_only, save again.
+
+    Kept for comparing against the single-pass build.
+    """
+    # Save initial file
+    with metrics.span('save'):
+        wb_temp.save(output_file)
+    print(f'Data written to {output_file}')
+
+    # Master file lookup
+    print("Processing master file lookup...")
+
+    with metrics.span('master lookup'):
+        wb_out = openpyxl.load_workbook(output_file)
+        ws_out = wb_out['Artical level format']
+        ws_sign = wb_out['Sign Format.']
+        anchor_code = ws_out.cell(row=5, column=4).value
+        distributor_name = ws_out.cell(row=5, column=6).value
+
+        match = lookup(anchor_code, distributor_name)
+        total_row_idx = find_total_row(ws_out)
+        subtotals = {}
+        if total_row_idx:
+            subtotals = {col: ws_out.cell(row=total_row_idx, column=col).value
+                         for col in range(14, 22)}
+        if match:
+            # Add subtotals to Sign Format
+            fill_master_details(ws_out, ws_sign, match, len(count_data), subtotals)
+    if match is None:
+        summary['rollup'] = report_facts(match, subtotals, {})
+        return summary
+    if not match:
+        print('No matching row found in master file')
+    _record_match(summary, match)
+
+    # --- Group by Manufacturing Quarter and aggregate Total Audited Value ---
+    print("Processing Manufacturing Quarter grouping...")
+
+    with metrics.span('quarter grouping', len(count_data)):
+        # Read data from Artical level format sheet with calculated values (not formulas)
+        wb_art_data = openpyxl.load_workbook(output_file, data_only=True)
+        ws_art = wb_art_data['Artical level format']
+
+        # Manufacturing Date is in column V (22) and Total Audited Value is in column U (21)
+        manu_date_col = 22  # Column V (Manufacturing Date)
+        total_audited_value_col = 21  # Column U (Total Audited Value Including GST)
+
+        print(f"Using Manufacturing Date column V ({manu_date_col})")
+        print(f"Using Total Audited Value column U ({total_audited_value_col})")
+
+        quarter_rows = ((ws_art.cell(row=row, column=manu_date_col).value,
+                         ws_art.cell(row=row, column=total_audited_value_col).value)
+                        for row in range(5, ws_art.max_row + 1))
+        quarter_data = aggregate_quarters(quarter_rows)
+        fill_quarter_summary(ws_sign, quarter_data)
+    summary['rollup'] = report_facts(match, subtotals, quarter_data)
+
+    # Save final file
+    with metrics.span('final save'):
+        wb_out.save(output_file)
+    print(f'Report completed and saved to {output_file}')
+    return summary
+
+
+def find_total_row(ws):
+    """Find the row with the 'Total' label in column E"""
+    for row_idx in range(1, ws.max_row + 1):
+        cell = ws.cell(row=row_idx, column=5)
+        if cell.value and isinstance(cell.value, str) and 'total' in cell.value.lower():
+            return row_idx
+    return None
+
+
+def lookup_master(master_file, anchor_code, distributor_name, cache_dir=None):
+    """Find the master row for an anchor code and distributor name.
+
+    Uses the persistent master index, so the master workbook is only parsed
+    when it has changed since the last run.
+    Returns a dict of the master row keyed by header (plus the audit
+    serial number under 'audit_std_serial_no'), an empty dict when there
+    is no match, or None when the master file lacks the required columns.
+    """
+    print(f"Looking up: Anchor Code = {anchor_code}, Distributor = {distributor_name}")
+    metrics.debug(f"DEBUG: Anchor Code type: {type(anchor_code)}, value: '{anchor_code}'")
+    metrics.debug(f"DEBUG: Distributor Name type: {type(distributor_name)}, value: '{distributor_name}'")
+
+    index = MasterIndex.load(master_file, cache_dir)
+    metrics.debug(f"DEBUG: Master file headers: {index.headers}")
+
+    if not index.has_key_columns:
+        print('Could not find required columns in master file')
+        metrics.debug(f"DEBUG: ac_idx = {index.ac_idx}, dn_idx = {index.dn_idx}")
+        return None
+
+    hit, fuzzy = index.find_match(anchor_code, distributor_name)
+    if hit is None:
+        return {}
+    print('Found matching row in master file')
+    metrics.debug(f"DEBUG: Match found at row {hit[0]}")
+    return index.row_dict(hit[1], fuzzy)
+
+
+def fill_master_details(ws_art, ws_sign, row_dict, row_count, subtotals):
+    """Write master attributes and totals into both report sheets"""
+    anchor_name_val = row_dict.get('Anchor Name')
+    region_val = row_dict.get('Region')
+
+    # Fill data in output file
+    for i in range(row_count):
+        ws_art.cell(row=5 + i, column=5).value = anchor_name_val
+        ws_art.cell(row=5 + i, column=2).value = region_val
+
+    ws_art.cell(row=2, column=2).value = row_dict['audit_std_serial_no']
+
+    # Fill Sign Format sheet
+    print("Updating Sign Format sheet...")
+    for (row, col), value in sign_format_values(ws_sign, row_dict, subtotals).items():
+        ws_sign.cell(row=row, column=col).value = value
+
+
+def sign_format_values(ws_sign, row_dict, subtotals):
+    """Cell values for the Sign Format sheet from a master row and the subtotals.
+
+    ws_sign is only read (for the date placeholder notes in B20/B22).
+    Returns {(row, column): value}.
+    """
+    values = {}
+    audit_std_serial_no_val = row_dict['audit_std_serial_no']
+
+    values[(4, 3)] = audit_std_serial_no_val
+    values[(6, 3)] = row_dict.get('Anchor Code/ DB Code', '')
+
+    db_name = row_dict.get('Anchor Name', '')
+    values[(7, 3)] = db_name
+
+    dist_name = row_dict.get('DB Name', '')
+    #values[(7, 3)] = dist_name
+
+    city = row_dict.get('Distributor City', '')
+    values[(8, 3)] = f"{dist_name} & {city}" if dist_name or city else ''
+    values[(9, 3)] = datetime.datetime.now().strftime('%d-%m-%Y')
+
+    # Update date placeholders
+    today_str = datetime.datetime.now().strftime('%d-%m-%Y')
+
+    for row, cell_ref in ((20, 'B20'), (22, 'B22')):
+        note = ws_sign[cell_ref].value
+        if note:
+            if 'date upto  ( )' in note:
+                values[(row, 2)] = note.replace('date upto  ( )', f'date upto ({today_str})')
+            elif 'date of Audit. ( )' in note:
+                values[(row, 2)] = note.replace('date of Audit. ( )', f'date of Audit. ({today_str})')
+            elif '()' in note:
+                values[(row, 2)] = note.replace('()', f'({datetime.datetime.now().strftime("%d-%m-%y")})')
+
+    # Add subtotals to Sign Format
+    if subtotals:
+        values[(12, 2)] = subtotals[14]
+        values[(12, 3)] = subtotals[15]
+        values[(12, 4)] = subtotals[16]
+        values[(12, 6)] = subtotals[18]
+        values[(12, 7)] = subtotals[19]
+        values[(12, 8)] = subtotals[20]
+        values[(12, 10)] = row_dict.get('Reported Value', '')
+    return values
+
+
+def aggregate_quarters(rows):
+    """Group (manufacturing date, total audited value) pairs by quarter"""
+    quarter_data = {}
+    bucket = default_bucketer().quarter
+
+    for n, (manu_date, value) in enumerate(rows):
+        # Calculate quarter from manufacturing date
+        quarter = bucket(manu_date)
+
+        # Debug: Print first few rows to see what we're reading
+        if n < 6:
+            metrics.debug(f"Row {5 + n}: Date='{manu_date}' (type: {type(manu_date)}), Quarter='{quarter}', Value='{value}' (type: {type(value)})")
+
+        # Skip if quarter is empty or None
+        if not quarter or quarter == '':
+            continue
+
+        # Convert value to float, skip if not numeric
+        try:
+            value = float(value) if value is not None else 0.0
+        except (ValueError, TypeError):
+            value = 0.0
+
+        # Aggregate by quarter
+        if quarter in quarter_data:
+            quarter_data[quarter] += value
+        else:
+            quarter_data[quarter] = value
+
+    print(f"Found {len(quarter_data)} unique quarters: {list(quarter_data.keys())}")
+    return quarter_data
+
+
+def fill_quarter_summary(ws_sign, quarter_data):
+    """Write quarter names to C16-I16 and their totals to C17-I17"""
+    for (row, col), value in quarter_summary_values(quarter_data).items():
+        ws_sign.cell(row=row, column=col).value = value
+
+
+def quarter_summary_values(quarter_data):
+    """Sign Format cells for the quarter summary, as {(row, column): value}"""
+    values = {}
+
+    # Sort quarters (assuming they are in format like "Q1 FY 2024-2025", "Q2 FY 2024-2025", etc.)
+    sorted_quarters = sorted(quarter_data.keys())
+
+    # Clear C16-I16 and C17-I17 first
+    for col in range(3, 10):  # C to I (columns 3-9)
+        values[(16, col)] = None
+        values[(17, col)] = None
+
+    # Fill quarter names in C16-I16 and aggregated values in C17-I17
+    for i, quarter in enumerate(sorted_quarters):
+        if i >= 7:  # Maximum 7 columns (C to I)
+            break
+
+        col = 3 + i  # Start from column C (3)
+        aggregated_value = quarter_data[quarter]
+
+        # Fill quarter name in row 16
+        values[(16, col)] = quarter
+        # Fill aggregated value in row 17
+        values[(17, col)] = aggregated_value
+
+        print(f"Filled {quarter}: {aggregated_value} in column {get_column_letter(col)}")
+
+    print(f"Manufacturing Quarter grouping completed. Filled {len(sorted_quarters)} quarters.")
+    return values
+
+
+def calculate_quarter(manufacturing_date):
+    """Calculate quarter based on manufacturing date (e.g. "Q1 FY 24-25")"""
+    return default_bucketer().quarter(manufacturing_date)
+
+
+# --- Batch processing ---
+
+def discover_jobs(source, output_dir, template_file, master_file):
+    """Build the job list for a countsheet directory or manifest file.
+
+    A directory contributes every Excel and CSV/TSV countsheet in it.
+    A manifest is either a CSV with a 'countsheet' column (optional 'output'
+    and 'master' columns) or a plain text file with one countsheet per line.
+    Relative paths in a manifest are resolved against the manifest's folder.
+    """
+    jobs = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.startswith('~$') or not name.lower().endswith(COUNTSHEET_EXTENSIONS):
+                continue
+            jobs.append({'countsheet': os.path.join(source, name)})
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, newline='', encoding='utf-8-sig') as f:
+            if source.lower().endswith('.csv'):
+                entries = [
+                    {k.strip().lower(): (v or '').strip() for k, v in rec.items() if k}
+                    for rec in csv.DictReader(f)
+                ]
+            else:
+                entries = [{'countsheet': line.strip()} for line in f
+                           if line.strip() and not line.startswith('#')]
+        for entry in entries:
+            if not entry.get('countsheet'):
+                continue
+            job = {}
+            for key in ('countsheet', 'output', 'master'):
+                if entry.get(key):
+                    job[key] = os.path.join(base_dir, entry[key])
+            jobs.append(job)
+
+    for job in jobs:
+        job.setdefault('master', master_file)
+        job.setdefault('template', template_file)
+        if 'output' not in job:
+            stem = countsheet_stem(job['countsheet'])
+            job['output'] = os.path.join(output_dir, f"{stem}_report.xlsx")
+    return jobs
+
+
+def is_countsheet_file(path):
+    """True for a single countsheet, False for a folder or a manifest.
+
+    A .csv is a manifest when its header has a 'countsheet' column.
+    """
+    if not os.path.isfile(path) or not path.lower().endswith(COUNTSHEET_EXTENSIONS):
+        return False
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+            headers = next(csv.reader(f), [])
+        return 'countsheet' not in (h.strip().lower() for h in headers)
+    return True
+
+
+def split_by_distributor(rows):
+    """Group countsheet rows by Distributor code in one pass (first-seen order)"""
+    groups = {}
+    for row in rows:
+        code = normalize_code(row.get('Distributor code', ''))
+        group = groups.get(code)
+        if group is None:
+            groups[code] = group = []
+        group.append(row)
+    return groups
+
+
+# Hex digits of a distributor code's hash added to split report names that need it
+CODE_HASH_LENGTH = 8
+
+
+def distributor_file_names(codes):
+    """The part of each split report's file name for these distributor codes.
+
+    Characters that cannot go in a file name become '_'. A code changed that
+    way (so 'A/1' and 'A 1' are not both 'A_1', nor every odd code 'blank'),
+    or one that differs from another only in case, gets a short hash of the
+    code appended. Raises ValueError if two names would still be the same.
+    """
+    def hashed(name, code):
+        return f"{name}_{hashlib.sha1(code.encode('utf-8')).hexdigest()[:CODE_HASH_LENGTH]}"
+
+    names = {}
+    for code in codes:
+        name = re.sub(r'[^\w.-]+', '_', code).strip('_') or 'blank'
+        names[code] = name if name == code else hashed(name, code)
+    # Windows file names are case-insensitive
+    folded = {}
+    for code, name in names.items():
+        folded.setdefault(name.lower(), []).append(code)
+    for clash in folded.values():
+        if len(clash) > 1:
+            for code in clash:
+                if names[code] == code:
+                    names[code] = hashed(code, code)
+    if len({name.lower() for name in names.values()}) < len(names):
+        raise ValueError('Distributor codes give the same report file name: '
+                         + ', '.join(sorted(repr(code) for code in names)))
+    return names
+
+
+def plan_distributor_jobs(countsheet_file, template_file, master_file, output_dir,
+                          cache_dir=None):
+    """Read a consolidated countsheet once and plan one report per distributor.
+
+    Each group is matched against the master index here, so workers only
+    render. Outputs are named <countsheet>_<distributor code>.xlsx (see
+    distributor_file_names).
+    """
+    print(f"Splitting {os.path.basename(countsheet_file)} by Distributor code...")
+    groups = split_by_distributor(iter_countsheet(countsheet_file))
+    index = MasterIndex.load(master_file, cache_dir)
+    if not index.has_key_columns:
+        print('Could not find required columns in master file')
+
+    # All distributors are matched at once (one query against a master store)
+    matches = [None] * len(groups)
+    if index.has_key_columns:
+        matches = index.lookup_many([(MAPPING[3](0, rows[0]), MAPPING[5](0, rows[0]))
+                                     for rows in groups.values()])
+
+    stem = countsheet_stem(countsheet_file)
+    names = distributor_file_names(groups)
+    jobs = []
+    for (code, rows), match in zip(groups.items(), matches):
+        jobs.append({
+            'countsheet': countsheet_file,
+            'distributor': code,
+            'rows': rows,
+            'match': match,
+            'template': template_file,
+            'output': os.path.join(output_dir, f"{stem}_{names[code]}.xlsx"),
+        })
+    print(f"Found {len(jobs)} distributors")
+    return jobs
+
+
+def run_job(job):
+    """Run one report job, capturing its printed log.
+
+    A job either names a countsheet and master file, or (from
+    plan_distributor_jobs) carries its rows and master match directly.
+
+    Never raises: failures are reported in the returned result dict so a
+    single bad countsheet cannot take down a whole batch. With job['metrics']
+    set, the job's timing spans are returned under 'spans'; with
+    job['profile_dir'] set, the job is profiled into that folder.
+    """
+    start = time.perf_counter()
+    log = io.StringIO()
+    result = {
+        'countsheet': job['countsheet'],
+        'distributor': job.get('distributor'),
+        'output': job['output'],
+        'status': 'ok',
+        'rows': 0,
+        'matched': False,
+        'fuzzy_match': None,
+        'error': None,
+        'spans': [],
+        'rollup': None,
+    }
+    recorder = None
+    try:
+        stream_threshold = job.get('stream_threshold', STREAM_ROW_THRESHOLD)
+        with ExitStack() as stack:
+            stack.enter_context(redirect_stdout(log))
+            if job.get('metrics'):
+                recorder = stack.enter_context(
+                    metrics.recording(trace_memory=job.get('trace_memory', False)))
+            if job.get('profile_dir'):
+                # A split report's profile is named like the report itself
+                name = (countsheet_stem(job['output']) if job.get('distributor') is not None
+                        else profile_name(job['countsheet']))
+                stack.enter_context(profiled(name, job['profile_dir']))
+            if 'rows' in job:
+                summary = render_report(job['rows'], job['template'], job['output'],
+                                        job['match'], stream_threshold=stream_threshold)
+            else:
+                summary = process_audit_report(job['countsheet'], job['template'],
+                                               job['master'], job['output'],
+                                               cache_dir=job.get('cache_dir'),
+                                               stream_threshold=stream_threshold)
+        result['rows'] = summary['rows']
+        result['matched'] = summary['matched']
+        result['fuzzy_match'] = summary['fuzzy_match']
+        result['rollup'] = summary.get('rollup')
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = str(e) or e.__class__.__name__
+        log.write(traceback.format_exc())
+    result['seconds'] = time.perf_counter() - start
+    result['log'] = log.getvalue()
+    if recorder is not None:
+        result['spans'] = recorder.spans
+    return result
+
+
+def pool_size(workers, job_count):
+    """Worker processes run_batch starts for job_count jobs (workers=None: one per core)"""
+    return max(1, min(workers or os.cpu_count() or 1, job_count or 1))
+
+
+def run_batch(jobs, workers=None, on_result=None):
+    """Fan jobs out over a process pool sized to the host's cores.
+
+    on_result(done, total, result) is called as each job finishes.
+    Results are returned in the order of `jobs`.
+    """
+    workers = pool_size(workers, len(jobs))
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job): idx for idx, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            idx = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # Worker process died (e.g. out of memory)
+                result = failed_result(jobs[idx], f"worker crashed: {e}")
+            results[idx] = result
+            if on_result:
+                on_result(done, len(jobs), result)
+    return results
+
+
+def failed_result(job, error):
+    """Result dict for a job that never returned one"""
+    return {
+        'countsheet': job['countsheet'],
+        'distributor': job.get('distributor'),
+        'output': job['output'],
+        'status': 'failed', 'rows': 0, 'matched': False, 'fuzzy_match': None,
+        'error': error, 'seconds': 0.0, 'log': '',
+        'spans': [], 'rollup': None,
+    }
+
+
+def skipped_result(job, record):
+    """Result dict for a job whose report is already up to date"""
+    result = failed_result(job, None)
+    result.update(status='skipped', rows=record['rows'], matched=record['matched'],
+                  fuzzy_match=record.get('fuzzy_match'), rollup=record.get('rollup'))
+    return result
+
+
+def job_fingerprint(job, manifest, cache_dir=None):
+    """What job's report is built from, for the --incremental manifest"""
+    if 'rows' in job:
+        countsheet = rows_sha256(job['rows'])
+        match = job['match']
+    else:
+        countsheet = manifest.file_hash(job['countsheet'])
+        key = manifest.countsheets.get(countsheet)
+        if key is None:
+            rows = iter_countsheet(job['countsheet'])
+            first = next(rows, None)
+            rows.close()
+            key = [MAPPING[3](0, first), MAPPING[5](0, first)] if first else []
+            manifest.countsheets[countsheet] = key
+        match = None
+        index = MasterIndex.load(job['master'], cache_dir)
+        if key and index.has_key_columns:
+            match = index.lookup(*key)
+    return {
+        'engine': ENGINE_VERSION,
+        'countsheet': countsheet,
+        'master_row': match_sha256(match),
+        'template': manifest.file_hash(job['template']),
+        'fiscal_start_month': default_bucketer().fiscal_start_month,
+    }
+
+
+def plan_incremental(jobs, manifest, cache_dir=None):
+    """Split jobs into those to run and skipped results for up-to-date reports.
+
+    Each job to run gets its 'fingerprint' for recording once it is done.
+    A countsheet that cannot be read is left to fail in its job as usual.
+    """
+    todo, skipped = [], []
+    for job in jobs:
+        try:
+            job['fingerprint'] = job_fingerprint(job, manifest, cache_dir)
+        except Exception:
+            job['fingerprint'] = None
+        if job['fingerprint'] and manifest.is_current(job['output'], job['fingerprint']):
+            skipped.append(skipped_result(job, manifest.get(job['output'])))
+        else:
+            todo.append(job)
+    return todo, skipped
+
+
+def update_manifest(manifest, jobs, results):
+    """Record the reports that were built, forget the ones that failed"""
+    for job, result in zip(jobs, results):
+        if result['status'] == 'ok' and job['fingerprint']:
+            manifest.record(job['output'], job['fingerprint'], result['rows'], result['matched'],
+                            result['rollup'], result['fuzzy_match'])
+        else:
+            manifest.forget(job['output'])
+    manifest.save()
+
+
+def write_batch_metrics(path, results):
+    """Append every job's spans to a JSON-lines metrics file"""
+    recorded = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with open(path, 'a', encoding='utf-8') as f:
+        for r in results:
+            context = {'recorded': recorded, 'countsheet': r['countsheet'],
+                       'distributor': r['distributor'], 'output': r['output']}
+            for record in r['spans']:
+                f.write(json.dumps({**context, **record}) + '\n')
+
+
+def job_label(result):
+    """Countsheet name, plus the distributor code for split reports"""
+    label = os.path.basename(result['countsheet'])
+    if result.get('distributor') is not None:
+        label += f" [{result['distributor']}]"
+    return label
+
+
+STATUS_LABELS = {'ok': 'OK', 'failed': 'FAILED', 'skipped': 'SKIPPED'}
+
+
+def describe_fuzzy_match(fuzzy):
+    """One line for a fuzzy_match record (see MasterIndex.find_match)"""
+    return (f"fuzzy master match '{fuzzy['distributor']}' -> '{fuzzy['master_name']}' "
+            f"(row {fuzzy['row']}, score {fuzzy['score']:.2f})")
+
+
+def format_job_status(done, total, result):
+    """One status line for a finished job"""
+    status = STATUS_LABELS[result['status']]
+    line = (f"[{done}/{total}] {status:<6} {job_label(result)} "
+            f"({result['rows']} rows, {result['seconds']:.1f}s)")
+    if result['status'] == 'ok' and not result['matched']:
+        line += " - no master match"
+    if result['fuzzy_match']:
+        line += f" - {describe_fuzzy_match(result['fuzzy_match'])}"
+    if result['error']:
+        line += f" - {result['error']}"
+    return line
+
+
+def format_summary(results):
+    """Render a plain-text summary table for a batch run"""
+    headers = ('Status', 'Countsheet', 'Rows', 'Master', 'Seconds', 'Output / Error')
+    table = []
+    for r in results:
+        table.append((
+            STATUS_LABELS[r['status']],
+            job_label(r),
+            str(r['rows']),
+            ('fuzzy' if r['fuzzy_match'] else 'yes') if r['matched'] else 'no',
+            f"{r['seconds']:.1f}",
+            r['error'] if r['error'] else os.path.basename(r['output']),
+        ))
+    widths = [max(len(h), *(len(row[i]) for row in table)) if table else len(h)
+              for i, h in enumerate(headers)]
+    lines = ["  ".join(h.ljust(w) for h, w in zip(headers, widths)).rstrip(),
+             "  ".join("-" * w for w in widths)]
+    for row in table:
+        lines.append("  ".join(v.ljust(w) for v, w in zip(row, widths)).rstrip())
+
+    ok = sum(1 for r in results if r['status'] == 'ok')
+    failed = sum(1 for r in results if r['status'] == 'failed')
+    skipped = len(results) - ok - failed
+    total_rows = sum(r['rows'] for r in results)
+    lines.append("")
+    tally = f"{ok}/{len(results)} reports generated, {failed} failed, "
+    if skipped:
+        tally += f"{skipped} up to date, "
+    lines.append(tally + f"{total_rows} data rows")
+    fuzzy = [r for r in results if r['fuzzy_match']]
+    if fuzzy:
+        lines.append(f"{len(fuzzy)} reports use an approximate master match; check them:")
+        lines.extend(f"  {job_label(r)}: {describe_fuzzy_match(r['fuzzy_match'])}"
+                     for r in fuzzy)
+    return "\n".join(lines)
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Generate TNBT post drainage audit reports without the GUI.")
+    parser.add_argument('source',
+                        help="countsheet file, folder of countsheets, or manifest (.csv/.txt)")
+    parser.add_argument('-m', '--master', required=True,
+                        help="master lookup Excel file, or a master store (.sqlite) "
+                             "made with master_store.py")
+    parser.add_argument('-o', '--output', required=True,
+                        help="output file (single countsheet) or output folder (batch)")
+    parser.add_argument('-t', '--template', default=DEFAULT_TEMPLATE,
+                        help="report template (default: template.xlsx next to the app)")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker processes for batch runs (default: CPU count)")
+    parser.add_argument('--cache-dir', default=None,
+                        help="folder for the master index cache "
+                             "(default: $TNBT_CACHE_DIR or ~/.tnbt_audit_cache)")
+    parser.add_argument('--stream-threshold', type=int, default=STREAM_ROW_THRESHOLD,
+                        help="countsheet rows at which the report is written in "
+                             f"write-only streaming mode (default: {STREAM_ROW_THRESHOLD}, "
+                             "0 = always)")
+    parser.add_argument('--split', action='store_true',
+                        help="countsheets cover several distributors: write one report "
+                             "per Distributor code into the output folder")
+    parser.add_argument('--incremental', action='store_true',
+                        help="skip reports whose countsheet rows, master row, template "
+                             "and engine version are unchanged since they were last "
+                             "generated (tracked in .tnbt_manifest.json in the output folder)")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running: generate a report for every countsheet that "
+                             "arrives in the source folder (see --archive/--errors)")
+    parser.add_argument('--archive', default=None, metavar='DIR',
+                        help="with --watch, where processed countsheets are moved "
+                             "(default: SOURCE/archive)")
+    parser.add_argument('--errors', default=None, metavar='DIR',
+                        help="with --watch, where countsheets that failed are moved "
+                             "(default: SOURCE/errors)")
+    parser.add_argument('--settle', type=float, default=2.0, metavar='SECONDS',
+                        help="with --watch, how long a file must stay unchanged before "
+                             "it is picked up (default: 2)")
+    parser.add_argument('--poll', action='store_true',
+                        help="with --watch, rescan the folder every second instead of "
+                             "using inotify (needed for network shares)")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="print the full log of every batch job")
+    parser.add_argument('--fiscal-start-month', type=int, default=None, metavar='MONTH',
+                        help="first month (1-12) of the fiscal year used for the "
+                             "quarter summary (default: $TNBT_FISCAL_START_MONTH or 4)")
+    parser.add_argument('--log-level', default=None, choices=('DEBUG', 'INFO'),
+                        type=str.upper,
+                        help="DEBUG also prints lookup and date parsing diagnostics "
+                             "(default: $TNBT_LOG_LEVEL or INFO)")
+    parser.add_argument('--xlsx-reader', default=None, choices=XLSX_READERS, type=str.lower,
+                        help="backend for reading .xlsx countsheets and masters: openpyxl, "
+                             "or native (parses the sheet XML directly, faster) "
+                             "(default: $TNBT_XLSX_READER or openpyxl)")
+    parser.add_argument('--xlsx-writer', default=None, choices=XLSX_WRITERS, type=str.lower,
+                        help="backend for writing reports: openpyxl, or native (copies the "
+                             "template package and streams the data rows as XML, faster) "
+                             "(default: $TNBT_XLSX_WRITER or openpyxl)")
+    parser.add_argument('--fuzzy-threshold', nargs='?', const=str(DEFAULT_FUZZY_THRESHOLD),
+                        default=None, metavar='SCORE',
+                        help="match a distributor name without an exact master match "
+                             "approximately within its anchor code, accepting scores (0-1) "
+                             f"from SCORE (default {DEFAULT_FUZZY_THRESHOLD}); off unless "
+                             "given or $TNBT_FUZZY_THRESHOLD is set")
+    parser.add_argument('--master-as-of', default=None, metavar='SNAPSHOT',
+                        help="with a master store, use the snapshot with this id, or the "
+                             "one in effect on this date, instead of the latest "
+                             "(default: $TNBT_MASTER_AS_OF)")
+    parser.add_argument('--rollup', nargs='?', const='', default=None, metavar='FILE',
+                        help="batch runs: also write the region and quarter totals of all "
+                             f"reports to FILE (default: {ROLLUP_NAME}.xlsx in the output "
+                             "folder) and the per-report figures to a .csv next to it")
+    parser.add_argument('--metrics', metavar='FILE', default=None,
+                        help="append per-phase timings as JSON lines to FILE and "
+                             "print a summary table")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="with --metrics, also record the tracemalloc peak of "
+                             "each phase (several times slower)")
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='DIR',
+                        help="profile each report and write <countsheet>.pstats and "
+                             "<countsheet>.collapsed (flame graph stacks) to DIR "
+                             "(default: next to the reports)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    try:
+        return run(args)
+    except (ValueError, OSError, KeyError) as e:
+        # Bad input (missing file, unknown snapshot, wrong sheet, ...): one line, not a traceback
+        metrics.debug(traceback.format_exc())
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+def run(args):
+    """main() for parsed arguments"""
+    if args.log_level:
+        metrics.set_log_level(args.log_level)
+    if args.fiscal_start_month:
+        set_fiscal_start_month(args.fiscal_start_month)
+    if args.xlsx_reader:
+        set_xlsx_reader(args.xlsx_reader)
+    if args.xlsx_writer:
+        set_xlsx_writer(args.xlsx_writer)
+    if args.master_as_of:
+        set_master_as_of(args.master_as_of)
+    if args.fuzzy_threshold:
+        set_fuzzy_threshold(args.fuzzy_threshold)
+
+    if not os.path.exists(args.template):
+        print(f"Template not found: {args.template}", file=sys.stderr)
+        return 2
+
+    if args.watch:
+        return watch(args)
+
+    single_file = is_countsheet_file(args.source)
+    if args.rollup is not None and single_file and not args.split:
+        print("--rollup needs a batch run (a folder, a manifest or --split)", file=sys.stderr)
+        return 2
+    if single_file and not args.split:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        manifest = fingerprint = None
+        if args.incremental:
+            manifest = ReportManifest.for_folder(os.path.dirname(os.path.abspath(args.output)))
+            fingerprint = job_fingerprint({'countsheet': args.source, 'master': args.master,
+                                           'template': args.template},
+                                          manifest, args.cache_dir)
+            if manifest.is_current(args.output, fingerprint):
+                print(f"{args.output} is up to date")
+                return 0
+        with ExitStack() as stack:
+            recorder = stack.enter_context(
+                metrics.recording(args.trace_memory and bool(args.metrics)))
+            if args.profile is not None:
+                stack.enter_context(profiled(
+                    profile_name(args.source),
+                    args.profile or os.path.dirname(os.path.abspath(args.output))))
+            summary = process_audit_report(args.source, args.template, args.master,
+                                           args.output, cache_dir=args.cache_dir,
+                                           stream_threshold=args.stream_threshold)
+        if manifest is not None:
+            manifest.record(args.output, fingerprint, summary['rows'], summary['matched'],
+                            summary.get('rollup'), summary['fuzzy_match'])
+            manifest.save()
+        if args.metrics:
+            recorder.write_jsonl(args.metrics, countsheet=args.source, output=args.output)
+            print()
+            print(recorder.format_table())
+        return 0
+
+    os.makedirs(args.output, exist_ok=True)
+    if single_file:
+        jobs = [{'countsheet': args.source, 'master': args.master}]
+    else:
+        jobs = discover_jobs(args.source, args.output, args.template, args.master)
+    if not jobs:
+        print(f"No countsheets found in {args.source}", file=sys.stderr)
+        return 2
+
+    # Parse each master workbook once up front; workers then only load the
+    # cached index (a master store is opened by each worker itself)
+    for master in sorted({job['master'] for job in jobs}):
+        if is_master_store(master):
+            continue
+        print(f"Indexing master file {os.path.basename(master)}...")
+        MasterIndex.load(master, args.cache_dir)
+
+    if args.split:
+        jobs = [dist_job for job in jobs
+                for dist_job in plan_distributor_jobs(job['countsheet'], args.template,
+                                                      job['master'], args.output,
+                                                      args.cache_dir)]
+    for job in jobs:
+        job['cache_dir'] = args.cache_dir
+        job['stream_threshold'] = args.stream_threshold
+        job['metrics'] = bool(args.metrics)
+        job['trace_memory'] = args.trace_memory
+        if args.profile is not None:
+            job['profile_dir'] = args.profile or args.output
+
+    skipped = []
+    if args.incremental:
+        positions = {job['output']: n for n, job in enumerate(jobs)}
+        manifest = ReportManifest.for_folder(args.output)
+        jobs, skipped = plan_incremental(jobs, manifest, args.cache_dir)
+        print(f"{len(skipped)} reports up to date")
+
+    # Reports are folded into the rollup as they finish, never read back
+    rollup = Rollup() if args.rollup is not None else None
+    if rollup is not None:
+        for result in skipped:
+            rollup.add(result)
+
+    workers = pool_size(args.workers, len(jobs))
+    print(f"Generating {len(jobs)} reports with {workers} worker "
+          f"process{'es' if workers != 1 else ''}...")
+
+    def on_result(done, total, result):
+        print(format_job_status(done, total, result))
+        if args.verbose or result['status'] != 'ok':
+            for line in result['log'].splitlines():
+                print(f"    {line}")
+        if rollup is not None:
+            rollup.add(result)
+
+    results = run_batch(jobs, workers=workers, on_result=on_result)
+    if args.incremental:
+        update_manifest(manifest, jobs, results)
+        results = sorted(skipped + results, key=lambda r: positions[r['output']])
+    print()
+    print(format_summary(results))
+    if rollup is not None:
+        rollup_file = args.rollup or os.path.join(args.output, ROLLUP_NAME + '.xlsx')
+        rollup_csv = os.path.splitext(rollup_file)[0] + '.csv'
+        rollup.write(rollup_file, rollup_csv)
+        print()
+        print(rollup.format_summary())
+        print(f"Rollup written to {rollup_file} and {rollup_csv}")
+    if args.metrics:
+        write_batch_metrics(args.metrics, results)
+        print()
+        print(metrics.format_spans(metrics.total_spans(
+            [record for r in results for record in r['spans']])))
+    return 0 if all(r['status'] != 'failed' for r in results) else 1
+
+
+def watch(args):
+    """--watch: run the watch-folder daemon on args.source"""
+    from watcher import FolderWatcher
+
+    if not os.path.isdir(args.source):
+        print(f"--watch needs a folder to watch, not {args.source}", file=sys.stderr)
+        return 2
+    if args.split:
+        print("--split cannot be combined with --watch", file=sys.stderr)
+        return 2
+    if args.rollup is not None:
+        print("--rollup cannot be combined with --watch", file=sys.stderr)
+        return 2
+    if not is_master_store(args.master):
+        print(f"Indexing master file {os.path.basename(args.master)}...")
+        MasterIndex.load(args.master, args.cache_dir)
+    job_options = {
+        'master': args.master,
+        'template': args.template,
+        'cache_dir': args.cache_dir,
+        'stream_threshold': args.stream_threshold,
+    }
+    if args.profile is not None:
+        job_options['profile_dir'] = args.profile or args.output
+    FolderWatcher(args.source, args.output, job_options,
+                  archive_dir=args.archive, error_dir=args.errors, workers=args.workers,
+                  settle_seconds=args.settle, poll=args.poll,
+                  metrics_file=args.metrics).run()
+    return 0
+
+
+if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Cycle rollup: region and quarter totals across all reports of a batch.
+
+Every report job returns the figures the rollup needs with its result
+(see report_facts): the master attributes, the subtotals of the Total row
+and the Total Audited Value per manufacturing quarter. A Rollup folds the
+results in as the jobs finish, so the generated workbooks are never read
+back, and keeps one line per report plus running totals by region and by
+region and quarter. write() saves them as one summary workbook and a CSV
+with the per-report lines.
+"""
+import csv
+import os
+import re
+import tempfile
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from columns import SUBTOTAL_COLUMNS
+
+
+# Default file name (.xlsx and .csv) in the output folder
+ROLLUP_NAME = 'rollup'
+
+# Headers of the article sheet's subtotal columns, in SUBTOTAL_COLUMNS order
+SUBTOTAL_LABELS = ('Primary Dmg', 'Non Saleable', 'BBD', 'Verified Qty',
+                   'PD INR', 'NS INR', 'BBD INR', 'Total INR')
+
+# (rollup column, master header) of the master attributes carried along
+MASTER_ATTRIBUTES = (
+    ('Region', 'Region'),
+    ('Anchor Code', 'Anchor Code/ DB Code'),
+    ('Anchor Name', 'Anchor Name'),
+    ('DB Name', 'DB Name'),
+    ('City', 'Distributor City'),
+    ('Audit Serial', 'audit_std_serial_no'),
+    ('Reported Value', 'Reported Value'),
+)
+
+# Region of reports without a master match or a Region in the master
+NO_REGION = '(no region)'
+
+_QUARTER_RE = re.compile(r'^Q(\d) FY (\d+)')
+_BOLD = Font(bold=True)
+
+
+def _number(value):
+    try:
+        return float(value) if value not in (None, '') else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _plain(value):
+    """A master cell as a JSON-safe value (the facts are kept in the manifest)"""
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def report_facts(match, subtotals, quarter_data):
+    """What the rollup needs from one report.
+
+    match is the master row (None or {} without a match), subtotals
+    {report column: total} and quarter_data {quarter: total audited value}.
+    """
+    match = match or {}
+    return {
+        'master': {name: _plain(match.get(header)) for name, header in MASTER_ATTRIBUTES},
+        'subtotals': {label: _number(subtotals.get(col))
+                      for col, label in zip(SUBTOTAL_COLUMNS, SUBTOTAL_LABELS)},
+        'quarters': {quarter: _number(value) for quarter, value in quarter_data.items()},
+    }
+
+
+def quarter_sort_key(quarter):
+    """Chronological order for labels like "Q1 FY 24-25" (fiscal year, then quarter)"""
+    m = _QUARTER_RE.match(quarter)
+    return (0, int(m.group(2)), int(m.group(1))) if m else (1, 0, 0, quarter)
+
+
+class Rollup:
+    """Streaming reducer over the results of a batch run"""
+
+    def __init__(self):
+        self.reports = []      # one line per report
+        self.regions = {}      # region -> {'Reports', 'Rows', 'Reported Value', subtotals...}
+        self.by_quarter = {}   # (region, quarter) -> total audited value
+        self.quarters = set()
+        self.failed = 0
+        self.missing = 0       # up-to-date reports recorded without rollup figures
+
+    def add(self, result):
+        """Fold in one run_job / skipped result"""
+        facts = result.get('rollup')
+        if result['status'] == 'failed':
+            self.failed += 1
+            return
+        if not facts:
+            self.missing += 1
+            return
+        master = facts['master']
+        region = str(master['Region']).strip() if master['Region'] not in (None, '') else ''
+        region = region or NO_REGION
+
+        totals = self.regions.setdefault(
+            region, dict.fromkeys(('Reports', 'Rows', 'Reported Value') + SUBTOTAL_LABELS, 0))
+        totals['Reports'] += 1
+        totals['Rows'] += result['rows']
+        totals['Reported Value'] += _number(master['Reported Value'])
+        for label in SUBTOTAL_LABELS:
+            totals[label] += facts['subtotals'][label]
+        for quarter, value in facts['quarters'].items():
+            self.quarters.add(quarter)
+            self.by_quarter[region, quarter] = self.by_quarter.get((region, quarter), 0) + value
+
+        self.reports.append({
+            'Countsheet': os.path.basename(result['countsheet']),
+            'Distributor Code': result.get('distributor'),
+            'Report': os.path.basename(result['output']),
+            'Rows': result['rows'],
+            'Master Match': ('fuzzy' if result.get('fuzzy_match') else 'yes')
+                            if result['matched'] else 'no',
+            **master,
+            'Region': region,
+            **facts['subtotals'],
+            'quarters': facts['quarters'],
+        })
+
+    def sorted_quarters(self):
+        return sorted(self.quarters, key=quarter_sort_key)
+
+    def region_rows(self):
+        """Header and rows of the per-region table, with a Total row"""
+        header = ['Region', 'Reports', 'Rows', 'Reported Value', *SUBTOTAL_LABELS]
+        rows = [[region, *(totals[h] for h in header[1:])]
+                for region, totals in sorted(self.regions.items())]
+        rows.append(['Total', *(sum(row[i] for row in rows) for i in range(1, len(header)))])
+        return header, rows
+
+    def quarter_rows(self):
+        """Header and rows of total audited value by region and quarter, with totals"""
+        quarters = self.sorted_quarters()
+        header = ['Region', *quarters, 'Total']
+        rows = []
+        for region in sorted(self.regions):
+            values = [self.by_quarter.get((region, q), 0.0) for q in quarters]
+            rows.append([region, *values, sum(values)])
+        rows.append(['Total', *(sum(row[i] for row in rows) for i in range(1, len(header)))])
+        return header, rows
+
+    def report_rows(self):
+        """Header and rows of the one-line-per-report table"""
+        quarters = self.sorted_quarters()
+        fixed = ['Countsheet', 'Distributor Code', 'Report', 'Rows', 'Master Match',
+                 *(name for name, _ in MASTER_ATTRIBUTES), *SUBTOTAL_LABELS]
+        rows = [[line[h] for h in fixed] + [line['quarters'].get(q) for q in quarters]
+                for line in self.reports]
+        return fixed + quarters, rows
+
+    def write(self, xlsx_path, csv_path=None):
+        """Save the summary workbook and (optionally) the per-report CSV atomically"""
+        wb = openpyxl.Workbook(write_only=True)
+        for title, (header, rows) in (('Regions', self.region_rows()),
+                                      ('Quarters', self.quarter_rows()),
+                                      ('Reports', self.report_rows())):
+            ws = wb.create_sheet(title)
+            ws.freeze_panes = 'B2'
+            cells = []
+            for value in header:
+                cell = WriteOnlyCell(ws, value)
+                cell.font = _BOLD
+                cells.append(cell)
+            ws.append(cells)
+            for row in rows:
+                ws.append(row)
+        _replace(xlsx_path, wb.save)
+
+        if csv_path:
+            header, rows = self.report_rows()
+
+            def save_csv(path):
+                # utf-8-sig so Excel shows non-ASCII distributor names correctly
+                with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(header)
+                    writer.writerows(rows)
+            _replace(csv_path, save_csv)
+
+    def format_summary(self):
+        """Short plain-text account of what went into the rollup"""
+        _, rows = self.region_rows()
+        total = rows[-1]
+        line = (f"Rollup: {len(self.reports)} reports in {len(self.regions)} regions, "
+                f"{len(self.quarters)} quarters, Total INR {total[-1]:,.2f}")
+        if self.failed:
+            line += f"; {self.failed} failed reports left out"
+        if self.missing:
+            line += (f"; {self.missing} up-to-date reports have no rollup figures "
+                     "(rerun them without --incremental)")
+        return line
+
+
+def _replace(path, save):
+    """save(temporary path) next to path, then move it into place"""
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    os.close(fd)
+    try:
+        save(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
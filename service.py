@@ -0,0 +1,516 @@
+"""
+Local HTTP service for requesting reports from other tools.
+
+Endpoints (all responses are JSON except the report download):
+
+    POST /jobs                  queue a report; either upload the countsheet
+                                as the request body (?name=countsheet.xlsx)
+                                or send {"countsheet": "/path/on/this/host.xlsx"}
+    GET  /jobs/<id>             job status: queued, running, ok or failed
+    GET  /jobs/<id>/report      download the finished workbook
+    GET  /metrics               request latency, queue depth and job counts
+    GET  /health
+
+Jobs wait in a bounded queue (POST /jobs answers 503 when it is full) and
+run on a fixed pool of worker processes. Each worker parses the template
+and loads the master index once at startup and keeps both across jobs.
+The service binds to 127.0.0.1 by default: it reads any path it is given,
+so it must not be exposed beyond the machine.
+
+Usage:
+    python service.py --master MASTER.xlsx -o reports/ [--port 8765] [--workers 2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import metrics
+import report_engine
+from fuzzy_names import DEFAULT_FUZZY_THRESHOLD, set_fuzzy_threshold
+from master_index import MasterIndex, is_master_store
+from master_store import set_master_as_of
+from quarters import set_fiscal_start_month
+from sheet_readers import XLSX_READERS, countsheet_stem, set_xlsx_reader
+from xlsx_writer import XLSX_WRITERS, set_xlsx_writer
+
+
+DEFAULT_PORT = 8765
+
+# Jobs waiting for a worker before POST /jobs is refused with 503
+QUEUE_SIZE = 100
+
+# Finished jobs remembered for status and download (oldest dropped first)
+MAX_JOBS_KEPT = 1000
+
+# Largest accepted request body (uploaded countsheet)
+MAX_BODY_BYTES = 200 * 1024 * 1024
+MAX_HEADER_BYTES = 64 * 1024
+
+# Latencies kept per route for the percentiles in /metrics
+LATENCY_WINDOW = 1000
+
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 409: 'Conflict', 411: 'Length Required',
+           413: 'Payload Too Large', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _warm_worker(template_file, master_file, cache_dir):
+    """Pool initializer: load what every job needs once per worker process"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the server handles Ctrl+C
+    report_engine.TEMPLATES.preload(template_file)
+    MasterIndex.load(master_file, cache_dir)
+
+
+def _ready():
+    return os.getpid()
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ServiceMetrics:
+    """Request latencies per route, queue depth and job durations"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.time()
+        self.requests = Counter()
+        self.latencies = {}
+        self.job_seconds = deque(maxlen=window)
+        self.queue_wait = deque(maxlen=window)
+        self.max_queue_depth = 0
+        self.rejected = 0
+        self.window = window
+
+    def observe_request(self, route, seconds):
+        self.requests[route] += 1
+        if route not in self.latencies:
+            self.latencies[route] = deque(maxlen=self.window)
+        self.latencies[route].append(seconds)
+
+    def observe_queue(self, depth):
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def snapshot(self, queue_depth, running, jobs):
+        def summary(values):
+            if not values:
+                return {'count': 0}
+            ordered = sorted(values)
+            return {'count': len(ordered),
+                    'mean_ms': round(1000 * sum(ordered) / len(ordered), 3),
+                    'p50_ms': round(1000 * _percentile(ordered, 0.5), 3),
+                    'p95_ms': round(1000 * _percentile(ordered, 0.95), 3),
+                    'max_ms': round(1000 * ordered[-1], 3)}
+
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'queue_depth': queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'running': running,
+            'rejected': self.rejected,
+            'jobs': dict(Counter(job['status'] for job in jobs)),
+            'requests': dict(self.requests),
+            'latency': {route: summary(values) for route, values in self.latencies.items()},
+            'job_seconds': summary(self.job_seconds),
+            'queue_wait': summary(self.queue_wait),
+        }
+
+
+class ReportService:
+    """Job table, bounded queue and worker pool behind the HTTP handlers"""
+
+    def __init__(self, master_file, output_dir, template_file=report_engine.DEFAULT_TEMPLATE,
+                 workers=None, queue_size=QUEUE_SIZE, cache_dir=None,
+                 stream_threshold=report_engine.STREAM_ROW_THRESHOLD):
+        self.master_file = os.path.abspath(master_file)
+        self.output_dir = os.path.abspath(output_dir)
+        self.upload_dir = os.path.join(self.output_dir, 'uploads')
+        self.template_file = os.path.abspath(template_file)
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.queue_size = queue_size
+        self.cache_dir = cache_dir
+        self.stream_threshold = stream_threshold
+        self.jobs = {}
+        self.running = 0
+        self.done = 0
+        self.metrics = ServiceMetrics()
+        self.queue = None
+        self.pool = None
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT):
+        """Run until cancelled"""
+        os.makedirs(self.upload_dir, exist_ok=True)
+        # Build the master index cache once before the workers load it (a
+        # master store is opened by each worker, not inherited from here)
+        if not is_master_store(self.master_file):
+            MasterIndex.load(self.master_file, self.cache_dir)
+        self.queue = asyncio.Queue(self.queue_size)
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_warm_worker,
+            initargs=(self.template_file, self.master_file, self.cache_dir))
+        loop = asyncio.get_running_loop()
+        # Start (and warm) the workers now: before the first request, and
+        # before the listening socket exists so they do not inherit it
+        await loop.run_in_executor(self.pool, _ready)
+        try:
+            loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except (NotImplementedError, AttributeError):
+            pass  # Windows: Ctrl+C only
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        print(f"Serving reports on http://{host}:{port} "
+              f"({self.workers} workers, queue of {self.queue_size})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in workers:
+                task.cancel()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- jobs ---
+
+    def submit(self, countsheet, upload=None, name=None):
+        """Queue a report for countsheet; raises HTTPError(503) when full"""
+        self._check_queue()
+        job_id = uuid.uuid4().hex[:12]
+        stem = countsheet_stem(name or countsheet)
+        job = {
+            'id': job_id,
+            'status': 'queued',
+            'countsheet': name or countsheet,
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'rows': 0,
+            'matched': False,
+            'fuzzy_match': None,
+            'error': None,
+            'seconds': None,
+            'log': None,
+            'download_name': f"{stem}_report.xlsx",
+            '_countsheet': countsheet,
+            '_upload': upload,
+            '_output': os.path.join(self.output_dir, f"{stem}_{job_id}.xlsx"),
+        }
+        self.jobs[job_id] = job
+        self.queue.put_nowait(job)
+        self.metrics.observe_queue(self.queue.qsize())
+        self._forget_old_jobs()
+        return job
+
+    def _check_queue(self):
+        if self.queue.full():
+            self.metrics.rejected += 1
+            raise HTTPError(503, f"queue is full ({self.queue_size} jobs waiting)")
+
+    def _forget_old_jobs(self):
+        """Drop the oldest finished jobs beyond MAX_JOBS_KEPT, with their files"""
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job['status'] in ('ok', 'failed')]
+        for job_id in finished[:max(0, len(self.jobs) - MAX_JOBS_KEPT)]:
+            job = self.jobs.pop(job_id)
+            for path in (job['_output'], job['_upload']):
+                if path:
+                    _remove(path)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            job['status'] = 'running'
+            job['started'] = time.time()
+            self.metrics.queue_wait.append(job['started'] - job['submitted'])
+            self.running += 1
+            engine_job = {
+                'countsheet': job['_countsheet'],
+                'master': self.master_file,
+                'template': self.template_file,
+                'output': job['_output'],
+                'cache_dir': self.cache_dir,
+                'stream_threshold': self.stream_threshold,
+            }
+            try:
+                result = await loop.run_in_executor(self.pool, report_engine.run_job, engine_job)
+            except Exception as e:
+                # Worker process died (e.g. out of memory)
+                result = report_engine.failed_result(engine_job, f"worker crashed: {e}")
+            finally:
+                self.running -= 1
+                self.queue.task_done()
+            job.update(status=result['status'], rows=result['rows'],
+                       matched=result['matched'], fuzzy_match=result['fuzzy_match'],
+                       error=result['error'],
+                       seconds=round(result['seconds'], 3), finished=time.time())
+            if result['status'] != 'ok':
+                job['log'] = result['log']
+            self.metrics.job_seconds.append(result['seconds'])
+            self.done += 1
+            result['countsheet'] = job['countsheet']  # the upload's name, not its temp file
+            print(report_engine.format_job_status(
+                self.done, self.done + self.running + self.queue.qsize(), result))
+            if job['_upload']:
+                _remove(job['_upload'])
+
+    def job_status(self, job):
+        status = {k: v for k, v in job.items() if not k.startswith('_')}
+        status['queue_depth'] = self.queue.qsize()
+        if job['status'] == 'ok':
+            status['report_url'] = f"/jobs/{job['id']}/report"
+        return status
+
+    # --- HTTP ---
+
+    async def handle(self, reader, writer):
+        start = time.perf_counter()
+        route = 'invalid'
+        try:
+            try:
+                method, target, headers = await self._read_head(reader)
+                url = urlsplit(target)
+                route = route_label(method, url.path)
+                status, content_type, body, extra = await self.dispatch(
+                    method, url.path, parse_qs(url.query), headers, reader)
+            except HTTPError as e:
+                status, content_type, extra = e.status, 'application/json', {}
+                body = json.dumps({'error': str(e)}).encode('utf-8')
+            except Exception as e:
+                status, content_type, extra = 500, 'application/json', {}
+                body = json.dumps({'error': f"{e.__class__.__name__}: {e}"}).encode('utf-8')
+            head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(body)}",
+                    "Connection: close"]
+            head += [f"{k}: {v}" for k, v in extra.items()]
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            self.metrics.observe_request(route, time.perf_counter() - start)
+
+    async def _read_head(self, reader):
+        try:
+            raw = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HTTPError(413, "request headers too large")
+        lines = raw.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, "malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        return method.upper(), target, headers
+
+    async def _read_body(self, reader, headers):
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            raise HTTPError(411, "send a Content-Length instead of chunked encoding")
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, "bad Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"request body over {MAX_BODY_BYTES} bytes")
+        return await reader.readexactly(length) if length else b''
+
+    async def dispatch(self, method, path, query, headers, reader):
+        """Returns (status, content type, body bytes, extra headers)"""
+        parts = [p for p in path.split('/') if p]
+
+        if parts == ['jobs']:
+            if method != 'POST':
+                raise HTTPError(405, "use POST to create a job")
+            body = await self._read_body(reader, headers)
+            job = await self.create_job(body, headers, query)
+            return (202, 'application/json', _json(self.job_status(job)),
+                    {'Location': f"/jobs/{job['id']}"})
+
+        if parts[:1] == ['jobs'] and len(parts) in (2, 3):
+            if method != 'GET':
+                raise HTTPError(405, "use GET")
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HTTPError(404, f"no job {parts[1]}")
+            if len(parts) == 2:
+                return 200, 'application/json', _json(self.job_status(job)), {}
+            if parts[2] != 'report':
+                raise HTTPError(404, f"unknown path {path}")
+            if job['status'] != 'ok':
+                raise HTTPError(409, f"job is {job['status']}")
+            # File I/O runs on the default thread pool so other requests are not held up
+            data = await asyncio.get_running_loop().run_in_executor(
+                None, _read_file, job['_output'])
+            return (200, XLSX_TYPE, data,
+                    {'Content-Disposition': f'attachment; filename="{job["download_name"]}"'})
+
+        if parts == ['metrics'] and method == 'GET':
+            snapshot = self.metrics.snapshot(self.queue.qsize(), self.running,
+                                             list(self.jobs.values()))
+            return 200, 'application/json', _json(snapshot), {}
+
+        if parts == ['health'] and method == 'GET':
+            return 200, 'application/json', _json({'status': 'ok'}), {}
+
+        raise HTTPError(404, f"unknown path {path}")
+
+    async def create_job(self, body, headers, query):
+        content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+        if content_type == 'application/json':
+            try:
+                request = json.loads(body or b'{}')
+            except ValueError:
+                raise HTTPError(400, "body is not valid JSON")
+            countsheet = request.get('countsheet') if isinstance(request, dict) else None
+            if not countsheet:
+                raise HTTPError(400, 'expected {"countsheet": "<path>"}')
+            if not os.path.isfile(countsheet):
+                raise HTTPError(400, f"countsheet not found: {countsheet}")
+            return self.submit(os.path.abspath(countsheet))
+
+        if not body:
+            raise HTTPError(400, "upload the countsheet as the request body, or send "
+                                 'JSON {"countsheet": "<path>"}')
+        name = os.path.basename(query.get('name', ['countsheet.xlsx'])[0]) or 'countsheet.xlsx'
+        if not name.lower().endswith(report_engine.COUNTSHEET_EXTENSIONS):
+            raise HTTPError(400, f"unsupported countsheet type: {name}")
+        self._check_queue()  # before writing the upload to disk
+        upload = os.path.join(self.upload_dir, f"{uuid.uuid4().hex}_{name}")
+        await asyncio.get_running_loop().run_in_executor(None, _write_file, upload, body)
+        try:
+            return self.submit(upload, upload=upload, name=name)
+        except HTTPError:
+            # The queue filled up while the upload was being written
+            _remove(upload)
+            raise
+
+
+def route_label(method, path):
+    """Route name used for the latency metrics, with job ids collapsed"""
+    parts = [p for p in path.split('/') if p]
+    if parts[:1] == ['jobs'] and len(parts) > 1:
+        parts[1] = '{id}'
+    return f"{method} /{'/'.join(parts)}"
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _json(data):
+    return json.dumps(data, indent=1, default=str).encode('utf-8')
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Serve TNBT audit reports over HTTP on this machine.")
+    parser.add_argument('-m', '--master', required=True,
+                        help="master lookup Excel file, or a master store (.sqlite)")
+    parser.add_argument('-o', '--output', required=True,
+                        help="folder for uploaded countsheets and generated reports")
+    parser.add_argument('-t', '--template', default=report_engine.DEFAULT_TEMPLATE,
+                        help="report template (default: template.xlsx next to the app)")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="address to bind (default: 127.0.0.1, this machine only)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help=f"jobs allowed to wait for a worker (default: {QUEUE_SIZE})")
+    parser.add_argument('--cache-dir', default=None,
+                        help="folder for the master index cache "
+                             "(default: $TNBT_CACHE_DIR or ~/.tnbt_audit_cache)")
+    parser.add_argument('--stream-threshold', type=int,
+                        default=report_engine.STREAM_ROW_THRESHOLD,
+                        help="countsheet rows at which reports are written in "
+                             "write-only streaming mode")
+    parser.add_argument('--fiscal-start-month', type=int, default=None, metavar='MONTH',
+                        help="first month (1-12) of the fiscal year used for the "
+                             "quarter summary (default: $TNBT_FISCAL_START_MONTH or 4)")
+    parser.add_argument('--log-level', default=None, choices=('DEBUG', 'INFO'),
+                        type=str.upper,
+                        help="DEBUG also prints lookup and date parsing diagnostics "
+                             "(default: $TNBT_LOG_LEVEL or INFO)")
+    parser.add_argument('--xlsx-reader', default=None, choices=XLSX_READERS, type=str.lower,
+                        help="backend for reading .xlsx inputs: openpyxl or native "
+                             "(default: $TNBT_XLSX_READER or openpyxl)")
+    parser.add_argument('--xlsx-writer', default=None, choices=XLSX_WRITERS, type=str.lower,
+                        help="backend for writing reports: openpyxl or native "
+                             "(default: $TNBT_XLSX_WRITER or openpyxl)")
+    parser.add_argument('--fuzzy-threshold', nargs='?', const=str(DEFAULT_FUZZY_THRESHOLD),
+                        default=None, metavar='SCORE',
+                        help="match distributor names approximately, accepting scores "
+                             f"(0-1) from SCORE (default {DEFAULT_FUZZY_THRESHOLD}); off "
+                             "unless given or $TNBT_FUZZY_THRESHOLD is set")
+    parser.add_argument('--master-as-of', default=None, metavar='SNAPSHOT',
+                        help="with a master store, use this snapshot id or the one in "
+                             "effect on this date (default: the latest)")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    if args.log_level:
+        metrics.set_log_level(args.log_level)
+    if args.fiscal_start_month:
+        set_fiscal_start_month(args.fiscal_start_month)
+    if args.xlsx_reader:
+        set_xlsx_reader(args.xlsx_reader)
+    if args.xlsx_writer:
+        set_xlsx_writer(args.xlsx_writer)
+    if args.master_as_of:
+        set_master_as_of(args.master_as_of)
+    if args.fuzzy_threshold:
+        set_fuzzy_threshold(args.fuzzy_threshold)
+    if not os.path.exists(args.template):
+        print(f"Template not found: {args.template}", file=sys.stderr)
+        return 2
+    service = ReportService(args.master, args.output, args.template, workers=args.workers,
+                            queue_size=args.queue_size, cache_dir=args.cache_dir,
+                            stream_threshold=args.stream_threshold)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("Stopped")
+    return 0
+
+
+if __name__ == '__main__':
+    import multiprocessing
+    multiprocessing.freeze_support()
+    sys.exit(main())
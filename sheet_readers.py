@@ -0,0 +1,683 @@
+"""
+Streaming readers for countsheet workbooks and CSV/TSV exports.
+
+Workbooks are opened read-only and rows are handed on as plain value
+tuples, so a 200k-row countsheet never has to be held in memory as
+openpyxl cells; the optional native backend (NativeXlsxSheet) skips
+openpyxl and parses the sheet XML itself. Delimited text (optionally
+gzipped) is read with the csv module, with the quantity, rate and date
+columns converted to the types an Excel countsheet would have. Kept
+rows are projected onto the fields the report reads (CountsheetRecord)
+instead of a dict of every column.
+"""
+import csv
+import datetime
+import gzip
+import io
+import math
+import os
+import posixpath
+import re
+import zipfile
+from operator import itemgetter
+from xml.etree import ElementTree
+
+import openpyxl
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH, from_ISO8601, from_excel
+
+from quarters import DATE_FORMATS
+
+
+QUANTITY_COLUMNS = ('Original QTY', 'Original Damage', 'Original Expired')
+
+# Countsheet columns the report reads; records keep only these
+RECORD_FIELDS = (
+    'Distributor code', 'Distributor Name', 'Item/SKU Code', 'Item Name',
+    'Field 1', 'Field 2', 'Field 3', 'Field 4', 'Item Rate',
+    'Original QTY', 'Original Damage', 'Original Expired',
+    'Manu Date', 'Expiry Date', 'Remarks',
+)
+
+_EMPTY_QUANTITIES = frozenset(("", "0", "0.0"))
+
+# Delimited text countsheets (scanner exports), plain or gzipped
+TEXT_EXTENSIONS = ('.csv', '.tsv', '.csv.gz', '.tsv.gz')
+
+# Text columns converted to numbers and dates, as Excel would store them
+NUMBER_COLUMNS = QUANTITY_COLUMNS + ('Item Rate', 'Field 1', 'Field 3', 'Field 4')
+DATE_COLUMNS = ('Manu Date', 'Expiry Date')
+# Codes become integers only when that round-trips (leading zeros stay text)
+CODE_COLUMNS = ('Distributor code',)
+
+# Numbers with thousands separators: Western 1,234,567 or Indian 1,23,45,678
+# grouping. Other commas ("12,5", "1,2,3") leave the value as text.
+_GROUPED_NUMBER = re.compile(r'[+-]?(?:\d{1,3}(?:,\d{3})+|\d{1,2}(?:,\d{2})*,\d{3})(?:\.\d*)?')
+
+# Bytes of a text countsheet used to guess its encoding and delimiter
+SNIFF_BYTES = 64 * 1024
+
+# Excel reader backend: 'openpyxl' (XlsxSheet) or 'native' (NativeXlsxSheet)
+XLSX_READERS = ('openpyxl', 'native')
+XLSX_READER = os.environ.get('TNBT_XLSX_READER', 'openpyxl').lower()
+
+SHEET_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_DIMENSION = f'{{{SHEET_MAIN_NS}}}dimension'
+_SHEET_DATA = f'{{{SHEET_MAIN_NS}}}sheetData'
+_ROW = f'{{{SHEET_MAIN_NS}}}row'
+_VALUE = f'{{{SHEET_MAIN_NS}}}v'
+_INLINE = f'{{{SHEET_MAIN_NS}}}is'
+_SI = f'{{{SHEET_MAIN_NS}}}si'
+_TEXT = f'{{{SHEET_MAIN_NS}}}t'
+_RUN = f'{{{SHEET_MAIN_NS}}}r'
+
+
+def set_xlsx_reader(name):
+    """Choose the Excel reader backend for this and child processes"""
+    global XLSX_READER
+    name = name.lower()
+    if name not in XLSX_READERS:
+        raise ValueError(f"unknown xlsx reader {name!r}; expected one of {XLSX_READERS}")
+    XLSX_READER = name
+    os.environ['TNBT_XLSX_READER'] = name
+
+
+class XlsxSheet:
+    """Active worksheet of an Excel file, read as a stream of value tuples"""
+
+    def __init__(self, path):
+        self.path = path
+        self.wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        self.ws = self.wb.active
+        self._rows = self.ws.iter_rows(values_only=True)
+        self.headers = list(next(self._rows, ()))
+
+    @property
+    def estimated_rows(self):
+        """Data row count taken from the sheet's dimension record (may be stale).
+
+        Sheets saved without one (streaming writers often skip it) are
+        sized by counting row tags in the raw sheet XML instead.
+        """
+        if self.ws.max_row is None:
+            return max(0, count_xml_rows(self.wb._archive, self.ws._worksheet_path) - 1)
+        return max(0, self.ws.max_row - 1)
+
+    def rows(self):
+        """Yield every data row as a tuple padded to the header width"""
+        width = len(self.headers)
+        for row in self._rows:
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            yield row
+
+    def close(self):
+        self.wb.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NativeXlsxSheet:
+    """Active worksheet of an Excel file, parsed straight from the sheet XML.
+
+    Gives the same values as XlsxSheet (read-only openpyxl, cached values)
+    without building a cell object per value: the shared string table and
+    the date styles are loaded once, the sheet part is streamed with
+    iterparse, and each finished row element is dropped. With `columns`
+    (header names) only those cells are decoded; the others read as None.
+    Like openpyxl, rows and columns outside the sheet's dimension record
+    are not returned.
+    """
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.archive = zipfile.ZipFile(path)
+        try:
+            self._load_workbook()
+            self._file = self.archive.open(self.sheet_part)
+        except Exception:
+            self.archive.close()
+            raise
+        self._events = ElementTree.iterparse(self._file, events=('start',))
+        self._sheet_data = None
+        self.dimensions = self._read_dimensions()
+        self._selected = None  # column numbers to decode; None for all
+        self._rows = self._iter_rows()
+        self.headers = list(next(self._rows, ()))
+        if columns is not None:
+            self._selected = {idx + 1 for idx in column_indexes(self.headers, columns).values()
+                              if idx is not None}
+
+    def _part(self, name):
+        with self.archive.open(name) as f:
+            return ElementTree.parse(f).getroot()
+
+    def _load_workbook(self):
+        """Find the active sheet, epoch, date styles and shared strings"""
+        office = 'xl/workbook.xml'
+        if '_rels/.rels' in self.archive.namelist():
+            for rel in self._part('_rels/.rels'):
+                if rel.get('Type', '').endswith('/officeDocument'):
+                    office = rel.get('Target').lstrip('/')
+        folder = posixpath.dirname(office)
+        rels_part = posixpath.join(folder, '_rels', posixpath.basename(office) + '.rels')
+        targets = {}
+        for rel in self._part(rels_part):
+            target = rel.get('Target')
+            if rel.get('TargetMode') == 'External':
+                continue
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(folder, target))
+            targets[rel.get('Id')] = (rel.get('Type', '').rsplit('/', 1)[-1], target)
+
+        book = self._part(office)
+        pr = book.find(f'{{{SHEET_MAIN_NS}}}workbookPr')
+        date1904 = pr is not None and pr.get('date1904', '').lower() in ('1', 'true')
+        self.epoch = MAC_EPOCH if date1904 else WINDOWS_EPOCH
+        active = 0
+        for view in book.iterfind(f'{{{SHEET_MAIN_NS}}}bookViews/{{{SHEET_MAIN_NS}}}workbookView'):
+            if view.get('activeTab') is not None:
+                active = int(view.get('activeTab'))
+                break
+        sheets = [sheet.get(f'{{{REL_NS}}}id')
+                  for sheet in book.iterfind(f'{{{SHEET_MAIN_NS}}}sheets/{{{SHEET_MAIN_NS}}}sheet')]
+        sheets = [targets[rid][1] for rid in sheets if rid in targets]
+        self.sheet_part = sheets[active] if active < len(sheets) else sheets[0]
+
+        parts = {kind: target for kind, target in targets.values()}
+        self.date_styles, self.timedelta_styles = set(), set()
+        if parts.get('styles') in self.archive.namelist():
+            self._load_styles(self._part(parts['styles']))
+        self.shared_strings = []
+        if parts.get('sharedStrings') in self.archive.namelist():
+            self._load_shared_strings(parts['sharedStrings'])
+
+    def _load_styles(self, root):
+        """Index the cell styles whose number format is a date or a duration"""
+        custom = {int(fmt.get('numFmtId')): fmt.get('formatCode')
+                  for fmt in root.iterfind(f'{{{SHEET_MAIN_NS}}}numFmts/{{{SHEET_MAIN_NS}}}numFmt')}
+        xfs = root.iterfind(f'{{{SHEET_MAIN_NS}}}cellXfs/{{{SHEET_MAIN_NS}}}xf')
+        for style_id, xf in enumerate(xfs):
+            fmt_id = int(xf.get('numFmtId', 0))
+            fmt = custom[fmt_id] if fmt_id in custom else builtin_format_code(fmt_id)
+            if is_date_format(fmt):
+                self.date_styles.add(style_id)
+            if is_timedelta_format(fmt):
+                self.timedelta_styles.add(style_id)
+
+    def _load_shared_strings(self, part):
+        """Plain text of every shared string; phonetic runs are left out"""
+        strings = self.shared_strings
+        with self.archive.open(part) as f:
+            for _, node in ElementTree.iterparse(f):
+                if node.tag == _SI:
+                    strings.append(_plain_text(node).replace('x005F_', ''))
+                    node.clear()
+
+    def _read_dimensions(self):
+        """(min_col, min_row, max_col, max_row) from the sheet's dimension record"""
+        dimensions = None
+        for _, element in self._events:
+            if element.tag == _SHEET_DATA:
+                self._sheet_data = element
+                break
+            if element.tag == _DIMENSION:
+                try:
+                    dimensions = range_boundaries(element.get('ref'))
+                except (TypeError, ValueError):
+                    pass
+        return dimensions
+
+    def _row_elements(self):
+        """Yield each <row> element once it has been parsed completely.
+
+        Only start events are requested (half the events of start+end): a
+        row is complete once the next one starts, and the rows before it
+        are then dropped from the tree so memory stays flat.
+        """
+        sheet_data = self._sheet_data
+        if sheet_data is None:
+            return
+        row = None
+        for _, element in self._events:
+            if element.tag == _ROW:
+                sheet_data.clear()
+                if row is not None:
+                    yield row
+                row = element
+        if row is not None:
+            yield row
+
+    @property
+    def estimated_rows(self):
+        """Data row count taken from the sheet's dimension record (may be stale).
+
+        Sheets saved without one are sized by counting row tags instead.
+        """
+        if self.dimensions is None:
+            return max(0, count_xml_rows(self.archive, self.sheet_part) - 1)
+        return max(0, self.dimensions[3] - 1)
+
+    def _iter_rows(self):
+        """Yield every sheet row from row 1, as openpyxl's values_only rows"""
+        max_col = max_row = None
+        if self.dimensions is not None:
+            max_col, max_row = self.dimensions[2], self.dimensions[3]
+        empty_row = (None,) * max_col if max_col is not None else ()
+        strings = self.shared_strings
+        dates, durations, epoch = self.date_styles, self.timedelta_styles, self.epoch
+        columns = {}
+        counter = 1
+        row_number = 0
+        for row in self._row_elements():
+            r = row.get('r')
+            if r is None:
+                row_number += 1
+            else:
+                try:
+                    row_number = int(r)
+                except ValueError:
+                    row_number = int(float(r))
+            if max_row is not None and row_number > max_row:
+                break
+            while counter < row_number:
+                counter += 1
+                yield empty_row
+            if counter > row_number:
+                continue
+
+            values = {}
+            col = 0
+            selected = self._selected
+            for cell in row:
+                ref = cell.get('r')
+                if ref is None:
+                    col += 1
+                else:
+                    letters = ref.rstrip('0123456789')
+                    col = columns.get(letters)
+                    if col is None:
+                        col = columns[letters] = column_index_from_string(letters)
+                if selected is not None and col not in selected:
+                    continue
+                kind = cell.get('t', 'n')
+                if kind == 'inlineStr':
+                    inline = cell.find(_INLINE)
+                    values[col] = _plain_text(inline) if inline is not None else None
+                    continue
+                value = cell.findtext(_VALUE)
+                if not value:
+                    continue
+                if kind == 'n':
+                    value = float(value) if ('.' in value or 'E' in value or 'e' in value) \
+                        else int(value)
+                    style = cell.get('s')
+                    if style and int(style) in dates:
+                        try:
+                            value = from_excel(value, epoch, timedelta=int(style) in durations)
+                        except (OverflowError, ValueError):
+                            value = "#VALUE!"
+                    values[col] = value
+                elif kind == 's':
+                    values[col] = strings[int(value)]
+                elif kind == 'b':
+                    values[col] = bool(int(value))
+                elif kind == 'd':
+                    values[col] = from_ISO8601(value)
+                else:
+                    values[col] = value  # 'str' (formula text) and 'e' (error)
+
+            # Without a dimension record a row ends at its last cell, as in openpyxl
+            width = col if max_col is None else max_col
+            yield tuple(map(values.get, range(1, width + 1)))
+            counter += 1
+
+        # openpyxl pads the trailing rows only when the sheet runs past max_row
+        if max_row is not None and row_number > max_row:
+            for _ in range(counter, max_row + 1):
+                yield empty_row
+
+    def rows(self):
+        """Yield every data row as a tuple padded to the header width"""
+        width = len(self.headers)
+        for row in self._rows:
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            yield row
+
+    def close(self):
+        self._file.close()
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _plain_text(node):
+    """Text of an <si> or <is> element: its <t> plus the <t> of each rich run"""
+    snippets = []
+    text = node.findtext(_TEXT)
+    if text is not None:
+        snippets.append(text)
+    for run in node.iterfind(_RUN):
+        text = run.findtext(_TEXT)
+        if text is not None:
+            snippets.append(text)
+    return ''.join(snippets)
+
+
+class CsvSheet:
+    """CSV/TSV countsheet (optionally gzipped), read as a stream of value tuples.
+
+    Blank cells become None; the NUMBER_COLUMNS, CODE_COLUMNS and
+    DATE_COLUMNS are converted to int/float and datetime where they parse,
+    and left as text otherwise so the usual non-numeric warnings still apply.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.compressed = _is_gzip(path)
+        with self._open_binary() as f:
+            head = f.read(SNIFF_BYTES)
+        # For estimated_rows: sample size, header bytes, complete lines and their bytes
+        self._head = (len(head), head.find(b'\n') + 1, head.count(b'\n'),
+                      head.rfind(b'\n') + 1)
+        self.encoding = _guess_encoding(head)
+        self.delimiter = _guess_delimiter(head.decode(self.encoding, errors='replace'), path)
+        self._file = io.TextIOWrapper(self._open_binary(), encoding=self.encoding,
+                                      errors='replace', newline='')
+        self._rows = csv.reader(self._file, delimiter=self.delimiter)
+        self.headers = [h.strip() for h in next(self._rows, [])]
+        self._numbers = [idx for idx in column_indexes(self.headers, NUMBER_COLUMNS).values()
+                         if idx is not None]
+        self._dates = [idx for idx in column_indexes(self.headers, DATE_COLUMNS).values()
+                       if idx is not None]
+        self._codes = [idx for idx in column_indexes(self.headers, CODE_COLUMNS).values()
+                       if idx is not None]
+
+    def _open_binary(self):
+        return gzip.open(self.path, 'rb') if self.compressed else open(self.path, 'rb')
+
+    @property
+    def estimated_rows(self):
+        """Data row count, exact for files shorter than SNIFF_BYTES.
+
+        Longer files are not read for it: their (uncompressed) size is
+        divided by the average data line length of the sniffed sample.
+        """
+        head_bytes, header_bytes, lines, lines_bytes = self._head
+        if head_bytes < SNIFF_BYTES:
+            return max(0, lines + (lines_bytes < head_bytes) - 1)
+        if lines < 2:
+            return 0
+        size = _gzip_size(self.path) if self.compressed else os.path.getsize(self.path)
+        return round((size - header_bytes) * (lines - 1) / (lines_bytes - header_bytes))
+
+    def rows(self):
+        """Yield every data row as a tuple padded to the header width"""
+        width = len(self.headers)
+        numbers, dates, codes = self._numbers, self._dates, self._codes
+        to_number, to_date = _text_to_number, _DateParser()
+        for row in self._rows:
+            if not row:
+                continue  # blank line
+            if len(row) < width:
+                row += [''] * (width - len(row))
+            row = [value or None for value in row]
+            for idx in numbers:
+                value = row[idx]
+                if value is not None:
+                    row[idx] = to_number(value)
+            for idx in dates:
+                value = row[idx]
+                if value is not None:
+                    row[idx] = to_date(value)
+            for idx in codes:
+                value = row[idx]
+                if value is not None and value.isdigit() and str(int(value)) == value:
+                    row[idx] = int(value)
+            yield tuple(row)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _is_gzip(path):
+    with open(path, 'rb') as f:
+        return f.read(2) == b'\x1f\x8b'
+
+
+def _gzip_size(path):
+    """Uncompressed size from a gzip file's trailer (modulo 4 GiB, last member only)"""
+    with open(path, 'rb') as f:
+        f.seek(-4, os.SEEK_END)
+        return int.from_bytes(f.read(4), 'little')
+
+
+def _guess_encoding(head):
+    """UTF-8 (with or without BOM) when it decodes, else Windows-1252"""
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sample is fine
+        if e.start < len(head) - 3:
+            return 'cp1252'
+    return 'utf-8-sig'
+
+
+def _guess_delimiter(text, path):
+    try:
+        return csv.Sniffer().sniff(text.split('\n', 1)[0], delimiters=',\t;|').delimiter
+    except csv.Error:
+        return '\t' if '.tsv' in path.lower() else ','
+
+
+def _text_to_number(value):
+    """int or float for a numeric string, else the stripped string"""
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    text = value.replace(',', '') if _GROUPED_NUMBER.fullmatch(value) else value
+    try:
+        number = float(text)
+    except ValueError:
+        return value or None
+    if math.isfinite(number):  # 'nan' / 'inf' stay text, as in Excel
+        return number
+    return value
+
+
+class _DateParser:
+    """Parses date strings to datetimes, remembering each distinct string"""
+
+    def __init__(self, formats=DATE_FORMATS + ('%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M:%S')):
+        self.formats = formats
+        self.cache = {}
+
+    def __call__(self, value):
+        try:
+            return self.cache[value]
+        except KeyError:
+            pass
+        text = value.strip()
+        parsed = text or None
+        for fmt in self.formats:
+            try:
+                parsed = datetime.datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            try:
+                parsed = datetime.datetime.fromisoformat(text)
+            except ValueError:
+                pass
+        if len(self.cache) < 65536:
+            self.cache[value] = parsed
+        return parsed
+
+
+def count_xml_rows(archive, member, chunk_size=1 << 20):
+    """Count <row> elements in a worksheet part without parsing it"""
+    count = 0
+    tail = b''
+    with archive.open(member) as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            data = tail + chunk
+            count += data.count(b'<row ') + data.count(b'<row>')
+            # Carry over less than a whole tag, so a split tag is counted once
+            tail = data[-4:]
+    return count
+
+
+class _Missing:
+    """Stands in for a field whose column the countsheet does not have"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'MISSING'
+
+    def __reduce__(self):
+        # Unpickles to the same object, so records can cross process pools
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+
+class CountsheetRecord(tuple):
+    """One countsheet row projected onto RECORD_FIELDS.
+
+    Reads like the header-keyed dict it replaces: get(header, default)
+    returns default when the countsheet has no such column.
+    """
+    __slots__ = ()
+
+    _index = {name: idx for idx, name in enumerate(RECORD_FIELDS)}
+
+    def get(self, name, default=None):
+        try:
+            value = self[self._index[name]]
+        except KeyError:
+            raise KeyError(f"{name!r} is not in sheet_readers.RECORD_FIELDS") from None
+        return default if value is MISSING else value
+
+    def as_dict(self):
+        return {name: value for name, value in zip(RECORD_FIELDS, self)
+                if value is not MISSING}
+
+
+def compile_projection(headers, fields=RECORD_FIELDS):
+    """Build a function turning a raw row tuple into a CountsheetRecord"""
+    indexes = list(column_indexes(headers, fields).values())
+    if None not in indexes:
+        pick = itemgetter(*indexes)
+        return lambda row: CountsheetRecord(pick(row))
+    return lambda row: CountsheetRecord(
+        [MISSING if idx is None else row[idx] for idx in indexes])
+
+
+def is_text_countsheet(path):
+    return path.lower().endswith(TEXT_EXTENSIONS)
+
+
+def countsheet_stem(path):
+    """File name without its extension(s): 'cs.csv.gz' -> 'cs'"""
+    name = os.path.basename(path)
+    if name.lower().endswith('.gz'):
+        name = name[:-3]
+    return os.path.splitext(name)[0]
+
+
+def open_sheet(path, columns=None):
+    """Open the first sheet of a countsheet (or a CSV/TSV export) for streaming.
+
+    `columns` names the columns the caller reads; a backend may leave the
+    others as None.
+    """
+    if is_text_countsheet(path):
+        return CsvSheet(path)
+    if XLSX_READER == 'native':
+        return NativeXlsxSheet(path, columns)
+    return XlsxSheet(path)
+
+
+def is_valid_quantity(val):
+    """A quantity cell counts when it holds anything other than blank or zero"""
+    if val is None:
+        return False
+    if isinstance(val, str):
+        return val.strip() not in _EMPTY_QUANTITIES
+    try:
+        return float(val) != 0.0
+    except Exception:
+        return True
+
+
+def column_indexes(headers, names):
+    """Map each name to its column index (last occurrence wins, like dict(zip()))"""
+    positions = {h: idx for idx, h in enumerate(headers)}
+    return {name: positions.get(name) for name in names}
+
+
+def compile_row_filter(headers, columns=QUANTITY_COLUMNS):
+    """Build a predicate on raw row tuples that keeps rows with any quantity.
+
+    Column positions are resolved once here instead of per row.
+    """
+    indexes = tuple(idx for idx in column_indexes(headers, columns).values()
+                    if idx is not None)
+    valid = is_valid_quantity
+
+    def row_filter(row):
+        for idx in indexes:
+            if valid(row[idx]):
+                return True
+        return False
+
+    return row_filter
+
+
+def open_countsheet(path):
+    """open_sheet for reading CountsheetRecords with countsheet_records"""
+    return open_sheet(path, RECORD_FIELDS)
+
+
+def countsheet_records(sheet):
+    """Yield a CountsheetRecord for every row with a quantity of an open countsheet.
+
+    Rows are filtered on the raw tuple before any record is built.
+    """
+    keep = compile_row_filter(sheet.headers)
+    project = compile_projection(sheet.headers)
+    for row in sheet.rows():
+        if keep(row):
+            yield project(row)
+
+
+def iter_countsheet(path):
+    """Yield a CountsheetRecord for every countsheet row with a quantity"""
+    with open_countsheet(path) as sheet:
+        yield from countsheet_records(sheet)
@@ -0,0 +1,88 @@
+"""
+In-memory cache of parsed report templates.
+
+The template workbook is parsed once and kept as a pickled snapshot;
+every job gets its own workbook by unpickling the snapshot, which is
+several times cheaper than parsing the xlsx again. The cached entry is
+reloaded when the template file's size or modification time changes.
+"""
+import copyreg
+import os
+import pickle
+import threading
+
+import openpyxl
+from openpyxl.utils.bound_dictionary import BoundDictionary
+from openpyxl.worksheet.dimensions import DimensionHolder
+
+
+def _restore_bound_dictionary(cls, default_factory, attributes, items):
+    restored = cls.__new__(cls)
+    restored.default_factory = default_factory
+    restored.__dict__.update(attributes)
+    restored.update(items)
+    return restored
+
+
+def _reduce_bound_dictionary(d):
+    # defaultdict's own pickling loses the instance attributes and passes
+    # the factory where BoundDictionary expects `reference`, which breaks
+    # row and column dimensions (DimensionHolder) in the copy
+    return _restore_bound_dictionary, (type(d), d.default_factory, vars(d), dict(d))
+
+
+for _cls in (BoundDictionary, DimensionHolder):
+    copyreg.pickle(_cls, _reduce_bound_dictionary)
+
+
+class TemplateCache:
+    """Parsed templates by path; prepare(wb) derives per-template data once"""
+
+    def __init__(self, prepare=None):
+        self.prepare = prepare
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, template_file):
+        path = os.path.abspath(template_file)
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry['stamp'] != stamp:
+                wb = openpyxl.load_workbook(path)
+                prepared = self.prepare(wb) if self.prepare else None
+                # Snapshot after prepare(): cells it touched are part of the
+                # workbook the old load-per-job code saved
+                entry = {
+                    'stamp': stamp,
+                    'snapshot': pickle.dumps(wb, pickle.HIGHEST_PROTOCOL),
+                    'workbook': wb,
+                    'prepared': prepared,
+                }
+                self._entries[path] = entry
+            return entry
+
+    def preload(self, template_file):
+        """Parse the template now so the first job does not have to"""
+        self._entry(template_file)
+
+    def checkout(self, template_file):
+        """A fresh copy of the template workbook and its prepared data.
+
+        The workbook is the caller's to modify; the prepared data is shared.
+        """
+        entry = self._entry(template_file)
+        return pickle.loads(entry['snapshot']), entry['prepared']
+
+    def peek(self, template_file):
+        """The cached template workbook itself and its prepared data.
+
+        Nothing is copied, so the workbook is shared and must only be read.
+        """
+        entry = self._entry(template_file)
+        return entry['workbook'], entry['prepared']
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
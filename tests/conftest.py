@@ -0,0 +1,52 @@
+"""
+Shared fixtures: synthetic inputs from benchmarks/synthetic.py.
+
+Every test session builds its own template, countsheets and master in a
+temporary folder, and keeps the master index cache there too.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import openpyxl  # noqa: E402
+import sheet_readers  # noqa: E402
+import synthetic  # noqa: E402
+import xlsx_writer  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def restore_backends(monkeypatch):
+    """Undo set_xlsx_reader / set_xlsx_writer calls made by a test"""
+    monkeypatch.setattr(sheet_readers, 'XLSX_READER', sheet_readers.XLSX_READER)
+    monkeypatch.setattr(xlsx_writer, 'XLSX_WRITER', xlsx_writer.XLSX_WRITER)
+    monkeypatch.setenv('TNBT_XLSX_READER', sheet_readers.XLSX_READER)
+    monkeypatch.setenv('TNBT_XLSX_WRITER', xlsx_writer.XLSX_WRITER)
+
+
+@pytest.fixture(scope='session')
+def inputs(tmp_path_factory):
+    """Paths of a template, a master, and countsheets of one and of four
+    distributors and without data rows"""
+    folder = tmp_path_factory.mktemp('inputs')
+    paths = {name: str(folder / name) for name in
+             ('template.xlsx', 'master.xlsx', 'countsheet.xlsx', 'multi.xlsx', 'empty.xlsx')}
+    synthetic.build_template(paths['template.xlsx'])
+    synthetic.build_master(paths['master.xlsx'], distributors=4)
+    synthetic.build_countsheet(paths['countsheet.xlsx'], 300)
+    synthetic.build_countsheet(paths['multi.xlsx'], 400, distributors=4, seed=1)
+    synthetic.build_countsheet(paths['empty.xlsx'], 0)
+    paths['cache'] = str(folder / 'cache')
+
+    # The round trip reloads the workbook it saved, where the footer merge
+    # (which insert_rows does not move) now covers data rows; this copy of
+    # the template has no merge below the data for comparing against it
+    wb = openpyxl.load_workbook(paths['template.xlsx'])
+    wb['Artical level format'].unmerge_cells('A9:D9')
+    paths['plain_template.xlsx'] = str(folder / 'plain_template.xlsx')
+    wb.save(paths['plain_template.xlsx'])
+    return paths
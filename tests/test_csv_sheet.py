@@ -0,0 +1,42 @@
+"""CSV/TSV countsheets: sizing and value conversion"""
+import gzip
+import shutil
+
+import pytest
+
+import synthetic
+from sheet_readers import SNIFF_BYTES, CsvSheet, _text_to_number
+
+
+@pytest.mark.parametrize('rows', [0, 5, 300, 20000])
+@pytest.mark.parametrize('compressed', [False, True])
+def test_estimated_rows(tmp_path, rows, compressed):
+    path = str(tmp_path / 'countsheet.csv')
+    synthetic.build_countsheet_text(path, rows)
+    if compressed:
+        with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        path += '.gz'
+    with CsvSheet(path) as sheet:
+        estimated = sheet.estimated_rows
+        actual = sum(1 for _ in sheet.rows())
+    assert actual == rows
+    if rows * 100 < SNIFF_BYTES:
+        assert estimated == rows  # the whole file was sniffed
+    else:
+        assert estimated == pytest.approx(rows, rel=0.05)
+
+
+@pytest.mark.parametrize('text, number', [
+    ('12', 12), (' 12.5 ', 12.5), ('-3', -3),
+    ('1,234', 1234.0), ('1,234,567.25', 1234567.25),           # Western grouping
+    ('1,23,456', 123456.0), ('-12,34,56,789.5', -123456789.5),  # Indian grouping
+])
+def test_numbers_with_thousands_separators(text, number):
+    assert _text_to_number(text) == number
+
+
+@pytest.mark.parametrize('text', ['12,5', '1,2,3', '1,2345', '12,34', ',123', 'nan', 'N/A'])
+def test_other_commas_stay_text(text):
+    # A decimal comma or a list is not silently read as a different number
+    assert _text_to_number(text) == text
@@ -0,0 +1,29 @@
+"""Master store connections are opened per process, never inherited"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import master_store
+from master_store import MasterStore, load_index
+
+
+def _store_id(path):
+    return id(load_index(path).store)
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(),
+                    reason="workers only inherit the parent's store when forked")
+def test_forked_worker_opens_its_own_store(inputs, tmp_path, monkeypatch):
+    monkeypatch.setattr(master_store, '_stores', {})
+    monkeypatch.setattr(master_store, '_indexes', {})
+    path = str(tmp_path / 'master.sqlite')
+    with MasterStore(path) as store:
+        store.import_master(inputs['master.xlsx'])
+    parent = load_index(path).store
+    assert load_index(path).store is parent
+
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('fork')) as pool:
+        worker = pool.submit(_store_id, path).result()
+    assert worker != id(parent)
+    parent.close()
@@ -0,0 +1,42 @@
+"""The report engine's entry points: process_audit_report and the command line"""
+import pytest
+
+import report_engine
+import sheet_readers
+import xlsx_writer
+
+
+@pytest.mark.parametrize('writer, stream_threshold', [('openpyxl', None),
+                                                      ('openpyxl', 1),
+                                                      ('native', None)])
+def test_countsheet_is_opened_once(inputs, tmp_path, monkeypatch, writer, stream_threshold):
+    opened = []
+    open_sheet = sheet_readers.open_sheet
+
+    def counting_open_sheet(path, columns=None):
+        opened.append(path)
+        return open_sheet(path, columns)
+    monkeypatch.setattr(sheet_readers, 'open_sheet', counting_open_sheet)
+    xlsx_writer.set_xlsx_writer(writer)
+
+    summary = report_engine.process_audit_report(
+        inputs['countsheet.xlsx'], inputs['template.xlsx'], inputs['master.xlsx'],
+        str(tmp_path / 'report.xlsx'), cache_dir=inputs['cache'],
+        stream_threshold=stream_threshold)
+    assert summary['rows'] > 0
+    assert opened == [inputs['countsheet.xlsx']]
+
+
+def test_single_report_into_new_folder(inputs, tmp_path):
+    output = tmp_path / 'cycle' / 'march' / 'report.xlsx'
+    assert report_engine.main([inputs['countsheet.xlsx'], '--master', inputs['master.xlsx'],
+                               '-t', inputs['template.xlsx'], '-o', str(output),
+                               '--cache-dir', inputs['cache']]) == 0
+    assert output.exists()
+
+
+def test_batch_reports_the_workers_it_uses(inputs, tmp_path, capsys):
+    assert report_engine.main([inputs['multi.xlsx'], '--split', '--master', inputs['master.xlsx'],
+                               '-t', inputs['template.xlsx'], '-o', str(tmp_path),
+                               '--cache-dir', inputs['cache'], '--workers', '64']) == 0
+    assert "Generating 4 reports with 4 worker processes" in capsys.readouterr().out
@@ -0,0 +1,41 @@
+"""--split writes one report per distributor code, however the codes are spelt"""
+import os
+
+import openpyxl
+
+import synthetic
+from report_engine import distributor_file_names, plan_distributor_jobs, run_job
+
+
+def test_distributor_file_names_are_distinct():
+    codes = ['A/1', 'A 1', 'A_1', '', '#', 'D001', 'd001', 'X.y-2']
+    names = distributor_file_names(codes)
+    assert len({name.lower() for name in names.values()}) == len(codes)
+    assert names['A_1'] == 'A_1' and names['X.y-2'] == 'X.y-2'
+    assert names['A/1'].startswith('A_1_') and names['#'].startswith('blank_')
+    assert names == distributor_file_names(reversed(codes))
+    # a code spelt like another's hashed name is hashed in turn
+    clash = distributor_file_names(['A/1', names['A/1']])
+    assert clash['A/1'] != clash[names['A/1']]
+
+
+def test_split_reports_do_not_overwrite_each_other(inputs, tmp_path):
+    countsheet = str(tmp_path / 'consolidated.xlsx')
+    codes = ('A/1', 'A 1', 'A_1')
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Countsheet')
+    ws.append(synthetic.COUNTSHEET_HEADERS)
+    for i, row in enumerate(synthetic.countsheet_rows(30)):
+        ws.append([codes[i % len(codes)], *row[1:]])
+    wb.save(countsheet)
+
+    jobs = plan_distributor_jobs(countsheet, inputs['template.xlsx'], inputs['master.xlsx'],
+                                 str(tmp_path / 'reports'), cache_dir=inputs['cache'])
+    assert sorted(job['distributor'] for job in jobs) == sorted(codes)
+    assert len({job['output'] for job in jobs}) == len(codes)
+    os.makedirs(tmp_path / 'reports')
+    for job in jobs:
+        result = run_job(job)
+        assert result['status'] == 'ok', result['error']
+    assert len(os.listdir(tmp_path / 'reports')) == len(codes)
+
@@ -0,0 +1,53 @@
+"""The watch-folder daemon keeps one report per countsheet version"""
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+
+import synthetic
+from watcher import STATUS_SUFFIX, FolderWatcher
+
+
+def wait_for(predicate, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.1)
+
+
+def test_corrected_countsheet_gets_its_own_report(inputs, tmp_path):
+    inbox, outbox = tmp_path / 'inbox', tmp_path / 'outbox'
+    inbox.mkdir()
+    watcher = FolderWatcher(str(inbox), str(outbox),
+                            {'master': inputs['master.xlsx'], 'template': inputs['template.xlsx'],
+                             'cache_dir': inputs['cache']},
+                            workers=1, settle_seconds=0.2, poll=True, poll_interval=0.1)
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stop,))
+    thread.start()
+
+    def statuses():
+        return sorted(glob.glob(str(outbox / ('*' + STATUS_SUFFIX))))
+    try:
+        shutil.copy(inputs['countsheet.xlsx'], inbox / 'cycle.xlsx')
+        wait_for(lambda: len(statuses()) == 1)
+        synthetic.build_countsheet(str(inbox / 'cycle.xlsx'), 50, seed=7)  # corrected version
+        wait_for(lambda: len(statuses()) == 2)
+        shutil.copy(inputs['countsheet.xlsx'], inbox / 'cycle.xlsx')  # the first one again
+        wait_for(lambda: not os.path.exists(inbox / 'cycle.xlsx'))
+    finally:
+        stop.set()
+        thread.join()
+
+    records = []
+    for path in statuses():
+        with open(path, encoding='utf-8') as f:
+            records.append(json.load(f))
+    assert sorted(r['status'] for r in records) == ['ok', 'ok']
+    assert len({r['output'] for r in records}) == 2
+    assert len({r['rows'] for r in records}) == 2
+    for record in records:
+        assert os.path.exists(record['output'])
+        assert record['sha256'][:12] in os.path.basename(record['output'])
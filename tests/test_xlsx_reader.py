@@ -0,0 +1,140 @@
+"""
+The native xlsx reader must return exactly what openpyxl's read-only mode does.
+
+Every workbook is read with XlsxSheet and NativeXlsxSheet, and the
+headers, rows, row estimate and iter_countsheet records are compared.
+Besides the synthetic countsheet and master, two small workbooks cover
+what report inputs rarely contain: 1904 dates, duration formats, rich
+text, booleans, errors, gaps between rows, a non-first active sheet, and
+a hand-written sheet with no dimension record, no cell references, inline
+strings and ISO dates.
+"""
+import datetime
+import zipfile
+
+import openpyxl
+import pytest
+from openpyxl.cell.rich_text import CellRichText, TextBlock
+from openpyxl.cell.text import InlineFont
+from openpyxl.utils.datetime import CALENDAR_MAC_1904
+
+import sheet_readers
+from sheet_readers import NativeXlsxSheet, XlsxSheet, iter_countsheet
+
+
+def build_edge_workbook(path):
+    """Values openpyxl converts on read: dates, durations, rich text, ..."""
+    wb = openpyxl.Workbook()
+    wb.epoch = CALENDAR_MAC_1904
+    wb.active.title = 'Notes'
+    wb.active['A1'] = 'not the active sheet'
+    ws = wb.create_sheet('Data')
+    wb.active = 1
+    ws.append(['Name', 'When', 'Time', 'Took', 'Flag', 'Amount', 'Formula', 'Rich'])
+    ws.append(['plain', datetime.datetime(2024, 3, 15), datetime.time(13, 30),
+               datetime.timedelta(hours=30, minutes=5), True, 12.5, '=1+1',
+               CellRichText('bold ', TextBlock(InlineFont(b=True), 'part'))])
+    ws.append(['  spaced  ', datetime.date(1999, 12, 31), None, None, False, 1e20, None, '#N/A'])
+    ws.append([])
+    ws.cell(row=7, column=3, value='after a gap')
+    ws.cell(row=8, column=9, value='past the headers')
+    ws.cell(row=9, column=1, value=-0.0)
+    ws.cell(row=9, column=2, value=45000.75).number_format = 'dd/mm/yyyy hh:mm'
+    ws.cell(row=9, column=6, value=123456789012)
+    wb.save(path)
+
+
+_RAW_PARTS = {
+    '[Content_Types].xml':
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/data.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/strings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+        '</Types>',
+    '_rels/.rels':
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>',
+    'xl/_rels/workbook.xml.rels':
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId7" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="/xl/worksheets/data.xml"/>'
+        '<Relationship Id="rId8" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="strings.xml"/>'
+        '</Relationships>',
+    'xl/workbook.xml':
+        '<x:workbook xmlns:x="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<x:sheets><x:sheet name="Raw" sheetId="1" r:id="rId7"/></x:sheets></x:workbook>',
+    'xl/strings.xml':
+        '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<si><t>Code</t></si><si><t xml:space="preserve"> Name </t></si>'
+        '<si><r><t>Ri</t></r><r><rPr><b/></rPr><t>ch</t></r><rPh sb="0" eb="1"><t>xx</t></rPh></si>'
+        '<si><t>a_x005F_x000D_b</t></si><si><t/></si></sst>',
+    'xl/worksheets/data.xml':
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        '<row><c t="s"><v>0</v></c><c t="s"><v>1</v></c><c t="inlineStr"><is><t>Inline</t></is></c></row>'
+        '<row><c><v>1001</v></c><c t="s"><v>2</v></c><c t="inlineStr"><is><r><t>in</t></r><r><t>line</t></r></is></c></row>'
+        '<row r="5"><c r="B5" t="s"><v>3</v></c><c r="A5" t="d"><v>2024-01-31T00:00:00</v></c></row>'
+        '<row><c t="e"><v>#DIV/0!</v></c><c t="str"><v>text</v></c><c t="b"><v>1</v></c><c t="s"><v>4</v></c></row>'
+        '<row r="7"/>'
+        '<row r="8"><c r="D8"><v>2.5E-3</v></c><c r="E8"><f>A1</f></c></row>'
+        '</sheetData></worksheet>',
+}
+
+
+def build_raw_workbook(path):
+    """Hand-written parts: no dimension, missing r attributes, inline strings"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+        for name, xml in _RAW_PARTS.items():
+            z.writestr(name, xml)
+
+
+@pytest.fixture(scope='module')
+def workbooks(inputs, tmp_path_factory):
+    folder = tmp_path_factory.mktemp('reader')
+    paths = {'edge': str(folder / 'edge_cases.xlsx'), 'raw': str(folder / 'raw_parts.xlsx'),
+             'countsheet': inputs['countsheet.xlsx'], 'master': inputs['master.xlsx']}
+    build_edge_workbook(paths['edge'])
+    build_raw_workbook(paths['raw'])
+    return paths
+
+
+def read_sheet(cls, path):
+    with cls(path) as sheet:
+        return sheet.headers, list(sheet.rows()), sheet.estimated_rows
+
+
+def read_records(path, reader):
+    sheet_readers.set_xlsx_reader(reader)
+    return list(iter_countsheet(path))
+
+
+@pytest.mark.parametrize('name', ['edge', 'raw', 'countsheet', 'master'])
+def test_sheet_matches_openpyxl(workbooks, name):
+    expected = read_sheet(XlsxSheet, workbooks[name])
+    headers, rows, estimated_rows = read_sheet(NativeXlsxSheet, workbooks[name])
+    assert headers == expected[0]
+    assert rows == expected[1]
+    assert estimated_rows == expected[2]
+
+
+@pytest.mark.parametrize('name', ['edge', 'raw', 'countsheet'])
+def test_records_match_openpyxl(workbooks, name):
+    assert read_records(workbooks[name], 'native') == read_records(workbooks[name], 'openpyxl')
+
+
+def test_dates(workbooks):
+    _, rows, _ = read_sheet(NativeXlsxSheet, workbooks['edge'])
+    assert rows[0][1] == datetime.datetime(2024, 3, 15)  # 1904 date system
+    assert rows[0][2] == datetime.time(13, 30)
+    assert rows[0][3] == datetime.timedelta(hours=30, minutes=5)
+    _, rows, _ = read_sheet(NativeXlsxSheet, workbooks['raw'])
+    assert rows[3][0] == datetime.datetime(2024, 1, 31)  # t="d" ISO date in row 5
+
+
+def test_shared_strings(workbooks):
+    headers, rows, _ = read_sheet(NativeXlsxSheet, workbooks['raw'])
+    assert headers[:2] == ['Code', ' Name ']  # xml:space="preserve" is kept
+    assert rows[0][1] == 'Rich'  # runs joined, phonetic text dropped
+    assert rows[0][2] == 'inline'
@@ -0,0 +1,66 @@
+"""
+The native report writer must write what openpyxl's streaming writer does.
+
+The same countsheet is turned into a report with both writers and the
+workbooks are compared cell by cell (values and styles) and by merged
+ranges. Three templates are used: the synthetic one, the same saved with
+a shared string table, and one with merges, a row height, conditional
+formatting and a print area below the total row. Native output is also
+checked with shared strings and for an empty countsheet.
+"""
+import functools
+
+import openpyxl
+import pytest
+from openpyxl.formatting.rule import CellIsRule
+from openpyxl.styles import PatternFill
+
+import report_engine
+import xlsx_writer
+from workbooks import workbook_differences
+
+
+@pytest.fixture(scope='module')
+def templates(inputs, tmp_path_factory):
+    folder = tmp_path_factory.mktemp('writer')
+    paths = {'synthetic': inputs['template.xlsx'],
+             'shared': str(folder / 'template_shared.xlsx'),
+             'rich': str(folder / 'template_rich.xlsx')}
+
+    # openpyxl saves its strings to xl/sharedStrings.xml, unlike the synthetic builder
+    openpyxl.load_workbook(paths['synthetic']).save(paths['shared'])
+
+    wb = openpyxl.load_workbook(paths['synthetic'])
+    ws = wb['Artical level format']
+    total = report_engine.find_total_row(ws)
+    ws.merge_cells(f'A{total + 2}:D{total + 3}')
+    ws[f'A{total + 2}'] = 'Prepared by'
+    ws.row_dimensions[total + 2].height = 30
+    ws.conditional_formatting.add(f'E{total}:H{total}', CellIsRule(
+        operator='greaterThan', formula=['0'], fill=PatternFill('solid', fgColor='FFFF00')))
+    ws.print_area = f'A1:AA{total + 3}'
+    wb.save(paths['rich'])
+    return paths
+
+
+def run_report(inputs, countsheet, template, output, writer):
+    xlsx_writer.set_xlsx_writer(writer)
+    report_engine.process_audit_report(inputs[countsheet], template, inputs['master.xlsx'],
+                                       output, cache_dir=inputs['cache'], stream_threshold=0)
+
+
+@pytest.mark.parametrize('template', ['synthetic', 'shared', 'rich'])
+@pytest.mark.parametrize('countsheet,strings', [('countsheet.xlsx', 'inline'),
+                                                ('countsheet.xlsx', 'shared'),
+                                                ('empty.xlsx', 'inline')])
+def test_native_matches_openpyxl(inputs, templates, tmp_path, monkeypatch,
+                                 template, countsheet, strings):
+    expected, actual = str(tmp_path / 'expected.xlsx'), str(tmp_path / 'actual.xlsx')
+    run_report(inputs, countsheet, templates[template], expected, 'openpyxl')
+    # report_engine always writes inline strings; swap the class for shared ones
+    monkeypatch.setattr(report_engine, 'ReportXmlWriter',
+                        functools.partial(xlsx_writer.ReportXmlWriter, strings=strings))
+    run_report(inputs, countsheet, templates[template], actual, 'native')
+    assert report_engine._use_xml_writer(templates[template])  # no fallback to openpyxl
+
+    assert workbook_differences(expected, actual) == []
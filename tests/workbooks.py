@@ -0,0 +1,48 @@
+"""Cell by cell comparison of two workbooks, for the report parity tests"""
+from copy import copy
+
+import openpyxl
+import pytest
+
+STYLE_ATTRIBUTES = ('font', 'fill', 'border', 'alignment', 'number_format', 'protection')
+
+
+def _same_value(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        return isinstance(a, (int, float)) and isinstance(b, (int, float)) and \
+            a == pytest.approx(b)
+    return a == b
+
+
+def workbook_differences(path_a, path_b, styles=True, replace_b=None):
+    """List of 'sheet!cell: a != b' lines where the two workbooks differ.
+
+    replace_b maps old to new text, replaced in b's strings before comparing.
+    """
+    wb_a = openpyxl.load_workbook(path_a)
+    wb_b = openpyxl.load_workbook(path_b)
+    diffs = []
+    if wb_a.sheetnames != wb_b.sheetnames:
+        return [f"sheets: {wb_a.sheetnames} != {wb_b.sheetnames}"]
+    for ws_a, ws_b in zip(wb_a.worksheets, wb_b.worksheets):
+        if sorted(map(str, ws_a.merged_cells.ranges)) != sorted(map(str, ws_b.merged_cells.ranges)):
+            diffs.append(f"{ws_a.title}: merged cells {ws_a.merged_cells.ranges} != "
+                         f"{ws_b.merged_cells.ranges}")
+        rows = max(ws_a.max_row, ws_b.max_row)
+        cols = max(ws_a.max_column, ws_b.max_column)
+        for row in range(1, rows + 1):
+            for col in range(1, cols + 1):
+                a, b = ws_a.cell(row, col), ws_b.cell(row, col)
+                b_value = b.value
+                if replace_b and isinstance(b_value, str):
+                    for old, new in replace_b.items():
+                        b_value = b_value.replace(old, new)
+                if not _same_value(a.value, b_value):
+                    diffs.append(f"{ws_a.title}!{a.coordinate}: {a.value!r} != {b_value!r}")
+                if styles:
+                    for attr in STYLE_ATTRIBUTES:
+                        # copy() unwraps openpyxl's style proxies, which do not compare
+                        if copy(getattr(a, attr)) != copy(getattr(b, attr)):
+                            diffs.append(f"{ws_a.title}!{a.coordinate} {attr} differs")
+    return diffs
+
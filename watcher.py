@@ -0,0 +1,348 @@
+"""
+Watch-folder daemon: generate a report for every countsheet dropped into
+an inbox folder.
+
+A file is picked up once its size and modification time have not changed
+for `settle_seconds`, so half-copied files are left alone. Files whose
+content (SHA-256) was already reported are not processed again. Reports
+run on a process pool with at most `workers` jobs in flight; the rest wait
+in the inbox. For every input a status record <name>_<hash>.status.json
+is written to the outbox next to its report <name>_<hash>_report.xlsx
+(<hash> is the start of the input's SHA-256, so a corrected countsheet
+dropped in under the same name does not replace the earlier report), and
+the input is then moved to
+the archive folder (done or duplicate) or the error folder (failed).
+Inputs are only moved once their report is finished, so a daemon that is
+stopped picks up the same files again on its next start.
+
+Changes are noticed through inotify on Linux; elsewhere, or with
+poll=True (network shares, where inotify does not see other machines'
+writes), the inbox is rescanned every `poll_interval` seconds.
+"""
+import ctypes
+import ctypes.util
+import datetime
+import glob
+import json
+import os
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import report_engine
+from master_index import file_sha256
+from sheet_readers import countsheet_stem
+
+
+# Seconds a file's size and mtime must stay the same before it is picked up
+SETTLE_SECONDS = 2.0
+
+# Inbox rescan interval for the polling watcher
+POLL_INTERVAL = 1.0
+
+# With inotify, the inbox is still rescanned this often when nothing happens
+IDLE_RESCAN_SECONDS = 30.0
+
+STATUS_SUFFIX = '.status.json'
+
+# Hex digits of an input's SHA-256 in its report and status file names
+NAME_HASH_LENGTH = 12
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+INBOX_EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class InotifyNotifier:
+    """Wakes up as soon as anything in the folder changes (Linux only)"""
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), INBOX_EVENTS) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, f"cannot watch {folder}")
+
+    def wait(self, timeout):
+        """Block until the folder changes or timeout seconds pass"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            # The events themselves are not needed: the caller rescans the folder
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingNotifier:
+    """Rescans on a fixed interval"""
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+
+    def close(self):
+        pass
+
+
+def make_notifier(folder, poll=False, poll_interval=POLL_INTERVAL):
+    if not poll and sys.platform.startswith('linux'):
+        try:
+            return InotifyNotifier(folder)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}); polling every {poll_interval}s instead")
+    return PollingNotifier(poll_interval)
+
+
+def _ignore_sigint():
+    # Ctrl+C stops the daemon; the pool's workers should not die mid-report
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _now():
+    return datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _write_json(path, data):
+    """Write atomically so a reader never sees a partial status record"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+def _move(path, folder, sha):
+    """Move path into folder, keeping an existing file of the same name"""
+    os.makedirs(folder, exist_ok=True)
+    name = os.path.basename(path)
+    target = os.path.join(folder, name)
+    if os.path.exists(target):
+        stem, ext = os.path.splitext(name)
+        target = os.path.join(folder, f"{stem}.{sha[:12]}{ext}")
+    shutil.move(path, target)
+    return target
+
+
+def output_stem(path, sha):
+    """Name of an input's report and status record, without suffix"""
+    return f"{countsheet_stem(path)}_{sha[:NAME_HASH_LENGTH]}"
+
+
+class FolderWatcher:
+    """Turns countsheets arriving in `inbox` into reports in `outbox`.
+
+    job_options are copied into every job (master, template, cache_dir,
+    stream_threshold, ...), as main() does for batch runs. With
+    metrics_file set, every job's timing spans are appended to it.
+    """
+
+    def __init__(self, inbox, outbox, job_options, archive_dir=None, error_dir=None,
+                 workers=None, settle_seconds=SETTLE_SECONDS, poll=False,
+                 poll_interval=POLL_INTERVAL, extensions=report_engine.COUNTSHEET_EXTENSIONS,
+                 metrics_file=None):
+        self.inbox = os.path.abspath(inbox)
+        self.outbox = os.path.abspath(outbox)
+        self.archive_dir = os.path.abspath(archive_dir or os.path.join(inbox, 'archive'))
+        self.error_dir = os.path.abspath(error_dir or os.path.join(inbox, 'errors'))
+        self.job_options = job_options
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.settle_seconds = settle_seconds
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.extensions = extensions
+        self.metrics_file = metrics_file
+
+        self.candidates = {}  # path -> ((size, mtime_ns), monotonic time first seen so)
+        self.running = {}     # future -> (path, stamp, sha256, job)
+        self.seen = {}        # sha256 -> status record of the report made from it
+        self.done = 0
+        self._load_seen()
+
+    def _load_seen(self):
+        """Remember the content hashes of inputs reported in earlier runs"""
+        for path in glob.glob(os.path.join(self.outbox, '*' + STATUS_SUFFIX)):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if record.get('status') in ('ok', 'duplicate') and record.get('output'):
+                self.seen.setdefault(record['sha256'], record)
+
+    def run(self, stop=None):
+        """Process the inbox until stop (a threading.Event) is set or Ctrl+C.
+
+        On stop the running reports are finished first; on Ctrl+C they are
+        abandoned and their inputs stay in the inbox.
+        """
+        stop = stop or threading.Event()
+        for folder in (self.outbox, self.archive_dir, self.error_dir):
+            os.makedirs(folder, exist_ok=True)
+        notifier = make_notifier(self.inbox, self.poll, self.poll_interval)
+        print(f"Watching {self.inbox} ({notifier.__class__.__name__}, "
+              f"{self.workers} workers); reports go to {self.outbox}")
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_sigint)
+        try:
+            while not stop.is_set():
+                self.scan()
+                self.submit_ready(pool)
+                self.collect(wait(self.running, timeout=0).done)
+                notifier.wait(self._wait_time(notifier))
+            # Asked to stop: let the running reports finish and file them
+            self.collect(wait(self.running).done)
+            pool.shutdown()
+        except KeyboardInterrupt:
+            print(f"Stopping; {len(self.running)} unfinished report(s) stay in the inbox")
+            pool.shutdown(wait=False, cancel_futures=True)
+        finally:
+            notifier.close()
+
+    def _wait_time(self, notifier):
+        if self.candidates or self.running:
+            return min(self.poll_interval, self.settle_seconds)
+        if isinstance(notifier, InotifyNotifier):
+            return IDLE_RESCAN_SECONDS
+        return self.poll_interval
+
+    def scan(self):
+        """Track the size/mtime of inbox files and when they last changed"""
+        busy = {path for path, _, _, _ in self.running.values()}
+        now = time.monotonic()
+        present = set()
+        with os.scandir(self.inbox) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(('~$', '.')) or not name.lower().endswith(self.extensions):
+                    continue
+                if entry.path in busy or not entry.is_file():
+                    continue
+                st = entry.stat()
+                stamp = (st.st_size, st.st_mtime_ns)
+                present.add(entry.path)
+                known = self.candidates.get(entry.path)
+                if known is None or known[0] != stamp:
+                    self.candidates[entry.path] = (stamp, now)
+        for path in list(self.candidates):
+            if path not in present:
+                del self.candidates[path]
+
+    def submit_ready(self, pool):
+        """Start jobs for settled files while the pool has free slots"""
+        now = time.monotonic()
+        in_flight = {sha for _, _, sha, _ in self.running.values()}
+        for path, (stamp, since) in sorted(self.candidates.items(), key=lambda c: (c[1][1], c[0])):
+            if len(self.running) >= self.workers:
+                break
+            if now - since < self.settle_seconds or stamp[0] == 0:
+                continue
+            try:
+                sha = file_sha256(path)
+                st = os.stat(path)
+            except OSError:
+                continue  # removed or locked; the next scan decides
+            if (st.st_size, st.st_mtime_ns) != stamp:
+                self.candidates[path] = ((st.st_size, st.st_mtime_ns), now)
+                continue
+            if sha in in_flight:
+                continue  # decided once the identical file's report is done
+            del self.candidates[path]
+
+            if sha in self.seen:
+                self.file_duplicate(path, sha)
+                continue
+            job = dict(self.job_options, countsheet=path,
+                       output=os.path.join(self.outbox, f"{output_stem(path, sha)}_report.xlsx"))
+            if self.metrics_file:
+                job['metrics'] = True
+            self.running[pool.submit(report_engine.run_job, job)] = (path, stamp, sha, job)
+            in_flight.add(sha)
+            print(f"{_now()} Started {os.path.basename(path)}")
+
+    def collect(self, finished):
+        """Write status records for finished jobs and move their inputs"""
+        for future in finished:
+            path, stamp, sha, job = self.running.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                # Worker process died (e.g. out of memory)
+                result = report_engine.failed_result(job, f"worker crashed: {e}")
+            self.done += 1
+            total = self.done + len(self.running) + len(self.candidates)
+            print(f"{_now()} {report_engine.format_job_status(self.done, total, result)}")
+            if result['status'] != 'ok':
+                for line in result['log'].splitlines():
+                    print(f"    {line}")
+            if self.metrics_file:
+                report_engine.write_batch_metrics(self.metrics_file, [result])
+
+            record = {
+                'input': os.path.basename(path),
+                'sha256': sha,
+                'status': result['status'],
+                'output': result['output'] if result['status'] == 'ok' else None,
+                'rows': result['rows'],
+                'matched': result['matched'],
+                'fuzzy_match': result['fuzzy_match'],
+                'error': result['error'],
+                'seconds': round(result['seconds'], 3),
+                'finished': _now(),
+                'moved_to': None,
+                'log': result['log'],
+            }
+            try:
+                st = os.stat(path)
+                replaced = (st.st_size, st.st_mtime_ns) != stamp
+            except OSError:
+                replaced = None
+            if replaced is False:
+                folder = self.archive_dir if result['status'] == 'ok' else self.error_dir
+                record['moved_to'] = _move(path, folder, sha)
+            elif replaced:
+                # A new version was dropped in meanwhile: leave it for the next scan
+                print(f"    {record['input']} changed while it was processed; it will be rerun")
+            if result['status'] == 'ok':
+                self.seen[sha] = record
+            self.write_status(path, record)
+
+    def file_duplicate(self, path, sha):
+        """Archive an input whose content was already reported"""
+        earlier = self.seen[sha]
+        record = {
+            'input': os.path.basename(path),
+            'sha256': sha,
+            'status': 'duplicate',
+            'output': earlier['output'],
+            'duplicate_of': earlier.get('duplicate_of') or earlier['input'],
+            'finished': _now(),
+            'moved_to': _move(path, self.archive_dir, sha),
+        }
+        print(f"{_now()} Skipped {record['input']}: same content as {record['duplicate_of']}")
+        if not os.path.exists(self.status_path(path, sha)):
+            # (the same file dropped in again keeps its original record)
+            self.write_status(path, record)
+
+    def status_path(self, path, sha):
+        return os.path.join(self.outbox, output_stem(path, sha) + STATUS_SUFFIX)
+
+    def write_status(self, path, record):
+        _write_json(self.status_path(path, record['sha256']), record)
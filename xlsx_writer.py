@@ -0,0 +1,627 @@
+"""
+Report writer that copies the template package and streams the data rows
+as sheet XML.
+
+openpyxl's writer serializes the whole object model on save, which for
+big reports is the slowest step of the run. This writer treats the
+template .xlsx as a package to copy: every part (styles, theme, the
+"Sign Format." sheet's layout, print settings, defined names, merged
+cells, drawings) goes into the report as it is in the template, with
+these changes only:
+
+- "Artical level format": rows 1-4 and the Total row onwards are kept as
+  the template has them, moved down below the data and with the report's
+  values put in. The data rows in between are written as XML as they
+  arrive, each column with the style id of template row 5.
+- "Sign Format.": the cells the report fills are replaced in place.
+- styles.xml: a date number format is added for a row 5 style that gets
+  dates but does not have one (openpyxl does the same on assignment).
+- workbook.xml: Excel is told to recalculate on load, and print areas of
+  the article sheet are extended to the moved Total row.
+- calcChain.xml is dropped, as its cell list no longer fits.
+
+Strings are written inline by default, so memory does not grow with the
+report; strings='shared' appends them to the shared string table instead,
+which gives smaller files when the same texts repeat. Values are encoded
+the way openpyxl would store them.
+
+Templates the writer cannot follow (rows without row numbers, prefixed
+XML) raise UnsupportedTemplate, and the caller can use openpyxl instead.
+"""
+import os
+import posixpath
+import re
+import threading
+import zipfile
+from decimal import Decimal
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from openpyxl.cell.cell import ERROR_CODES, ILLEGAL_CHARACTERS_RE, TIME_FORMATS
+from openpyxl.styles.numbers import BUILTIN_FORMATS_REVERSE, builtin_format_code, is_date_format
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH, to_excel
+from openpyxl.utils.exceptions import IllegalCharacterError
+
+
+# Report writer backend: 'openpyxl' (object model) or 'native' (ReportXmlWriter)
+XLSX_WRITERS = ('openpyxl', 'native')
+XLSX_WRITER = os.environ.get('TNBT_XLSX_WRITER', 'openpyxl').lower()
+
+ARTICLE_SHEET = 'Artical level format'
+SIGN_SHEET = 'Sign Format.'
+FIRST_DATA_ROW = 5
+DATA_COLUMNS = 27
+
+# Data rows joined into one write to the zip stream
+WRITE_BLOCK_ROWS = 1000
+
+SHEET_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+SHARED_STRINGS_TYPE = REL_NS + '/sharedStrings'
+SHARED_STRINGS_CONTENT_TYPE = \
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml'
+
+_SHEET_DATA_RE = re.compile(r'<sheetData\b[^>]*?(/?)>')
+_ROW_RE = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_CELL_RE = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+_ROW_TAG_RE = re.compile(r'<row\b[^>]*?(/?)>')
+_CELL_REF_RE = re.compile(r'(<c\b[^>]*?\sr=")([A-Z]+)(\d+)(")')
+_REF_ATTR_RE = re.compile(r'(\s(?:ref|sqref)=")([^"]*)(")')
+_CELL_COORD_RE = re.compile(r'(\$?[A-Z]{1,3}\$?)(\d+)')
+_DIMENSION_RE = re.compile(r'<dimension\b[^>]*/>')
+_MERGE_CELL_RE = re.compile(r'<mergeCell\b[^>]*\sref="([^"]*)"[^>]*/>')
+_MERGE_CELLS_RE = re.compile(r'<mergeCells\b[^>]*>(.*?)</mergeCells>', re.S)
+_ROW_BREAKS_RE = re.compile(r'<rowBreaks\b[^>]*>.*?</rowBreaks>', re.S)
+_BREAK_ID_RE = re.compile(r'(<brk\b[^>]*?\sid=")(\d+)(")')
+_COUNT_RE = re.compile(r'(\scount=")(\d+)(")')
+_QUOTE = {'"': '&quot;'}
+
+
+class UnsupportedTemplate(ValueError):
+    """The template's XML is not in a shape this writer can copy safely"""
+
+
+def set_xlsx_writer(name):
+    """Choose the report writer backend for this and child processes"""
+    global XLSX_WRITER
+    name = name.lower()
+    if name not in XLSX_WRITERS:
+        raise ValueError(f"unknown xlsx writer {name!r}; expected one of {XLSX_WRITERS}")
+    XLSX_WRITER = name
+    os.environ['TNBT_XLSX_WRITER'] = name
+
+
+def _attr(tag, name):
+    m = re.search(rf'\s{name}="([^"]*)"', tag)
+    return m.group(1) if m else None
+
+
+def _column_number(letters, _cache={}):
+    number = _cache.get(letters)
+    if number is None:
+        number = 0
+        for ch in letters:
+            number = number * 26 + ord(ch) - 64
+        _cache[letters] = number
+    return number
+
+
+def _shift_refs(text, first_row, offset):
+    """Move the row numbers >= first_row in cell references by offset"""
+    def shift(m):
+        row = int(m.group(2))
+        return f"{m.group(1)}{row + offset if row >= first_row else row}"
+    return _CELL_COORD_RE.sub(shift, text)
+
+
+def _split_sheet(xml):
+    """(head, {row number: row xml}, tail) of a worksheet part"""
+    m = _SHEET_DATA_RE.search(xml)
+    if m is None:
+        raise UnsupportedTemplate("worksheet has no <sheetData> (prefixed XML?)")
+    if m.group(1):
+        return xml[:m.start()] + '<sheetData>', {}, '</sheetData>' + xml[m.end():]
+    end = xml.index('</sheetData>', m.end())
+    rows = {}
+    for row in _ROW_RE.findall(xml, m.end(), end):
+        number = _attr(_ROW_TAG_RE.match(row).group(0), 'r')
+        if number is None:
+            raise UnsupportedTemplate("worksheet rows without row numbers")
+        rows[int(number)] = row
+    return xml[:m.end()], rows, xml[end:]
+
+
+def _row_cells(row):
+    """The row's start tag and its cells as {column: cell xml}"""
+    m = _ROW_TAG_RE.match(row)
+    tag = m.group(0)
+    if m.group(1):
+        tag = tag[:-2].rstrip() + '>'
+    cells = {}
+    for cell in _CELL_RE.findall(row, m.end()):
+        ref = _attr(cell[:cell.index('>')], 'r')
+        if ref is None:
+            raise UnsupportedTemplate("cells without cell references")
+        cells[_column_number(ref.rstrip('0123456789'))] = cell
+    return tag, cells
+
+
+def _move_row(row, first_row, offset):
+    """Renumber a row (its cells and shared formula ranges) by offset"""
+    row = re.sub(r'^(<row\b[^>]*?\sr=")(\d+)(")',
+                 lambda m: f"{m.group(1)}{int(m.group(2)) + offset}{m.group(3)}", row)
+    row = _CELL_REF_RE.sub(
+        lambda m: f"{m.group(1)}{m.group(2)}{int(m.group(3)) + offset}{m.group(4)}", row)
+    return _REF_ATTR_RE.sub(
+        lambda m: m.group(1) + _shift_refs(m.group(2), first_row, offset) + m.group(3), row)
+
+
+def _xml_text(text):
+    text = escape(text)
+    if text != text.strip():
+        return f'<t xml:space="preserve">{text}</t>'
+    return f'<t>{text}</t>'
+
+
+class StyleTable:
+    """Number formats of the template's cell styles, plus styles added for dates"""
+
+    def __init__(self, xml):
+        self.xml = xml
+        root = ElementTree.fromstring(xml)
+        ns = {'m': SHEET_MAIN_NS}
+        self.custom = {int(fmt.get('numFmtId')): fmt.get('formatCode')
+                       for fmt in root.iterfind('m:numFmts/m:numFmt', ns)}
+        self.formats = [int(xf.get('numFmtId', 0)) for xf in root.iterfind('m:cellXfs/m:xf', ns)]
+        section = re.search(r'<cellXfs\b[^>]*>(.*?)</cellXfs>', xml, re.S)
+        self.xfs = re.findall(r'<xf\b[^>]*?(?:/>|>.*?</xf>)', section.group(1), re.S) \
+            if section else []
+        if len(self.xfs) != len(self.formats):
+            raise UnsupportedTemplate("styles.xml cell formats could not be read")
+        self.new_formats = {}  # format code -> numFmtId, for formats added here
+        self.new_xfs = []
+        self._variants = {}    # (style id, format code) -> style id
+
+    def format_code(self, style):
+        fmt_id = self.formats[style] if style < len(self.formats) else 0
+        return self.custom[fmt_id] if fmt_id in self.custom else builtin_format_code(fmt_id)
+
+    def date_style(self, style, value_type):
+        """Style id to store a date/time of value_type with, based on style"""
+        if is_date_format(self.format_code(style)):
+            return style
+        code = TIME_FORMATS[value_type] if value_type in TIME_FORMATS else \
+            next(fmt for base, fmt in TIME_FORMATS.items() if issubclass(value_type, base))
+        key = (style, code)
+        variant = self._variants.get(key)
+        if variant is None:
+            fmt_id = BUILTIN_FORMATS_REVERSE.get(code)
+            if fmt_id is None:
+                fmt_id = self.new_formats.get(code)
+            if fmt_id is None:
+                fmt_id = max([163] + list(self.custom) + list(self.new_formats.values())) + 1
+                self.new_formats[code] = fmt_id
+            xf = self.xfs[style] if style < len(self.xfs) else '<xf numFmtId="0"/>'
+            xf = re.sub(r'\snumFmtId="\d+"', '', xf, count=1)
+            xf = re.sub(r'\sapplyNumberFormat="[^"]*"', '', xf, count=1)
+            xf = xf.replace('<xf', f'<xf numFmtId="{fmt_id}" applyNumberFormat="1"', 1)
+            variant = self._variants[key] = len(self.xfs) + len(self.new_xfs)
+            self.new_xfs.append(xf)
+        return variant
+
+    def patched(self):
+        """styles.xml with the added formats and styles, or None if unchanged"""
+        if not self.new_xfs:
+            return None
+        xml = self.xml
+        fmts = ''.join(f'<numFmt numFmtId="{fmt_id}" formatCode="{escape(code, _QUOTE)}"/>'
+                       for code, fmt_id in self.new_formats.items())
+        if fmts:
+            xml = _append_children(xml, 'numFmts', fmts, len(self.new_formats))
+        return _append_children(xml, 'cellXfs', ''.join(self.new_xfs), len(self.new_xfs))
+
+
+def _append_children(xml, tag, children, added):
+    """Append children to the first <tag> element, creating it first in the root if missing"""
+    match = re.search(rf'<{tag}\b([^>]*?)(/?)>', xml)
+    if match is None:
+        start = re.search(r'<styleSheet\b[^>]*>', xml).end()
+        return xml[:start] + f'<{tag} count="{added}">{children}</{tag}>' + xml[start:]
+    open_tag = _add_count(f'<{tag}{match.group(1)}>', added)
+    if match.group(2):
+        return xml[:match.start()] + open_tag + children + f'</{tag}>' + xml[match.end():]
+    end = xml.index(f'</{tag}>', match.end())
+    return xml[:match.start()] + open_tag + xml[match.end():end] + children + xml[end:]
+
+
+def _add_count(tag, added):
+    if _COUNT_RE.search(tag):
+        return _COUNT_RE.sub(lambda m: f"{m.group(1)}{int(m.group(2)) + added}{m.group(3)}",
+                             tag, count=1)
+    return tag
+
+
+class XmlTemplate:
+    """A template workbook read as XML parts, ready to be copied per report.
+
+    total_label_row is the template row with the 'Total' label, as found by
+    report_engine.read_template_layout.
+    """
+
+    def __init__(self, path, total_label_row):
+        self.path = path
+        self.total_label_row = total_label_row
+        with zipfile.ZipFile(path) as z:
+            self.infos = z.infolist()
+            self.parts = {info.filename: z.read(info) for info in self.infos}
+
+        office = 'xl/workbook.xml'
+        if '_rels/.rels' in self.parts:
+            for rel in self._xml_root('_rels/.rels'):
+                if rel.get('Type', '').endswith('/officeDocument'):
+                    office = rel.get('Target').lstrip('/')
+        self.workbook_part = office
+        folder = posixpath.dirname(office)
+        self.workbook_rels_part = posixpath.join(folder, '_rels',
+                                                 posixpath.basename(office) + '.rels')
+        targets = {}
+        for rel in self._xml_root(self.workbook_rels_part):
+            target = rel.get('Target')
+            if rel.get('TargetMode') == 'External':
+                continue
+            target = target[1:] if target.startswith('/') else \
+                posixpath.normpath(posixpath.join(folder, target))
+            targets[rel.get('Id')] = (rel.get('Type', '').rsplit('/', 1)[-1], target)
+        self.part_types = {target: kind for kind, target in targets.values()}
+
+        book = self._xml_root(office)
+        pr = book.find(f'{{{SHEET_MAIN_NS}}}workbookPr')
+        date1904 = pr is not None and pr.get('date1904', '').lower() in ('1', 'true')
+        self.epoch = MAC_EPOCH if date1904 else WINDOWS_EPOCH
+        self.sheets = {}  # name -> (position, part)
+        for position, sheet in enumerate(book.iterfind(
+                f'{{{SHEET_MAIN_NS}}}sheets/{{{SHEET_MAIN_NS}}}sheet')):
+            rid = sheet.get(f'{{{REL_NS}}}id')
+            if rid in targets:
+                self.sheets[sheet.get('name')] = (position, targets[rid][1])
+        for name in (ARTICLE_SHEET, SIGN_SHEET):
+            if name not in self.sheets:
+                raise UnsupportedTemplate(f"template has no {name!r} sheet")
+
+        self.article = _split_sheet(self.text(self.sheets[ARTICLE_SHEET][1]))
+        self.sign = _split_sheet(self.text(self.sheets[SIGN_SHEET][1]))
+        _, cells = _row_cells(self.article[1].get(FIRST_DATA_ROW, f'<row r="{FIRST_DATA_ROW}"/>'))
+        self.row_styles = [int(_attr(cells[col][:cells[col].index('>')], 's') or 0)
+                           if col in cells else 0 for col in range(1, DATA_COLUMNS + 1)]
+
+        self.styles_part = next((t for t, kind in self.part_types.items() if kind == 'styles'), None)
+        self.strings_part = next((t for t, kind in self.part_types.items()
+                                  if kind == 'sharedStrings'), None)
+        self.calc_chain_part = next((t for t, kind in self.part_types.items()
+                                     if kind == 'calcChain'), None)
+        self.string_count = 0
+        if self.strings_part in self.parts:
+            self.string_count = len(self._xml_root(self.strings_part).findall(
+                f'{{{SHEET_MAIN_NS}}}si'))
+
+    def text(self, part):
+        return self.parts[part].decode('utf-8')
+
+    def _xml_root(self, part):
+        return ElementTree.fromstring(self.parts[part])
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def load_template(template_file, total_label_row):
+    """XmlTemplate for template_file, parsed once per process like TEMPLATES"""
+    path = os.path.abspath(template_file)
+    st = os.stat(path)
+    key = (st.st_size, st.st_mtime_ns, total_label_row)
+    with _templates_lock:
+        entry = _templates.get(path)
+        if entry is None or entry[0] != key:
+            entry = _templates[path] = (key, XmlTemplate(path, total_label_row))
+        return entry[1]
+
+
+class ReportXmlWriter:
+    """Writes one report from an XmlTemplate.
+
+        with ReportXmlWriter(template, 'report.xlsx') as writer:
+            writer.begin({(2, 2): serial_no})
+            for values in data:
+                writer.write_row(values)
+            writer.finish(total_row_values, sign_format_values)
+
+    Value dicts are keyed by (template row, column). A report that fails
+    part way is deleted rather than left half written.
+    """
+
+    def __init__(self, template, output_file, strings='inline'):
+        if strings not in ('inline', 'shared'):
+            raise ValueError(f"strings must be 'inline' or 'shared', not {strings!r}")
+        self.template = template
+        self.output_file = output_file
+        self.shared = strings == 'shared'
+        self.styles = StyleTable(template.text(template.styles_part)) \
+            if template.styles_part in template.parts else None
+        self.strings = {}  # text -> shared string index, for strings added here
+        self.string_refs = 0
+        self.rows = 0
+        self._buffer = []
+        self._letters = [get_column_letter(col) for col in range(1, DATA_COLUMNS + 1)]
+        self._style_attrs = [f' s="{style}"' if style else '' for style in template.row_styles]
+        self._zip = zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        self._sheet = None
+        self._written = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if self._sheet is not None:
+            self._sheet.close()
+        self._zip.close()
+        if exc_type is not None:
+            try:
+                os.remove(self.output_file)
+            except OSError:
+                pass
+
+    # --- cells ---
+
+    def cell(self, ref, style, value):
+        """XML for one cell holding value, stored as openpyxl would"""
+        style_attr = f' s="{style}"' if style else ''
+        if value is None:
+            return f'<c r="{ref}"{style_attr}/>'
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        if isinstance(value, str):
+            value = value[:32767]
+            if ILLEGAL_CHARACTERS_RE.search(value):
+                raise IllegalCharacterError(f"{value} cannot be used in worksheets.")
+            if len(value) > 1 and value.startswith('='):
+                return f'<c r="{ref}"{style_attr}><f>{escape(value[1:])}</f><v></v></c>'
+            if value in ERROR_CODES:
+                return f'<c r="{ref}"{style_attr} t="e"><v>{value}</v></c>'
+            if value == '':
+                return f'<c r="{ref}"{style_attr} t="inlineStr"/>' if not self.shared \
+                    else f'<c r="{ref}"{style_attr} t="s"/>'
+            if self.shared:
+                index = self.strings.get(value)
+                if index is None:
+                    index = self.strings[value] = self.template.string_count + len(self.strings)
+                self.string_refs += 1
+                return f'<c r="{ref}"{style_attr} t="s"><v>{index}</v></c>'
+            return f'<c r="{ref}"{style_attr} t="inlineStr"><is>{_xml_text(value)}</is></c>'
+        if isinstance(value, bool):
+            return f'<c r="{ref}"{style_attr} t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float, Decimal)):
+            if value != value or value in (float('inf'), float('-inf')):
+                return f'<c r="{ref}"{style_attr} t="n"><v></v></c>'
+            return f'<c r="{ref}"{style_attr} t="n"><v>{"%.16g" % value}</v></c>'
+        if isinstance(value, tuple(TIME_FORMATS)):
+            if getattr(value, 'tzinfo', None) is not None:
+                raise TypeError("Excel does not support timezones in datetimes. "
+                                "The tzinfo in the datetime/time object must be set to None.")
+            if self.styles is not None:
+                style = self.styles.date_style(style or 0, type(value))
+                style_attr = f' s="{style}"' if style else ''
+            number = to_excel(value, self.template.epoch)
+            return f'<c r="{ref}"{style_attr} t="n"><v>{"%.16g" % number}</v></c>'
+        raise ValueError(f"Cannot convert {value!r} to Excel")
+
+    def _set_cells(self, row, row_number, values):
+        """Row xml with the given {column: value} cells replaced or added, None if empty"""
+        tag, cells = _row_cells(row or f'<row r="{row_number}"/>')
+        for col, value in values.items():
+            old = cells.get(col)
+            style = int(_attr(old[:old.index('>')], 's') or 0) if old else 0
+            if value is None and not style:
+                cells.pop(col, None)  # like openpyxl, an empty unstyled cell is not written
+                continue
+            cells[col] = self.cell(f"{get_column_letter(col)}{row_number}", style, value)
+        if row is None and not cells:
+            return None
+        return tag + ''.join(cells[col] for col in sorted(cells)) + '</row>'
+
+    def _patch_rows(self, rows, values):
+        """Template rows {number: xml} with values {(row, column): value} put in"""
+        by_row = {}
+        for (row, col), value in values.items():
+            by_row.setdefault(row, {})[col] = value
+        rows = dict(rows)
+        for number, row_values in by_row.items():
+            row = self._set_cells(rows.get(number), number, row_values)
+            if row is not None:
+                rows[number] = row
+        return rows
+
+    # --- the article sheet ---
+
+    def begin(self, header_values=None):
+        """Start the package and write the article sheet down to the data rows"""
+        template = self.template
+        self._write_part('[Content_Types].xml', self._content_types())
+        head, rows, _ = template.article
+        rows = self._patch_rows({n: row for n, row in rows.items() if n < FIRST_DATA_ROW},
+                                header_values or {})
+        # The dimension is only known at the end; readers work without it
+        head = _DIMENSION_RE.sub('', head, count=1)
+        self._sheet = self._zip.open(self._zip_info(template.sheets[ARTICLE_SHEET][1]), 'w',
+                                     force_zip64=True)
+        self._sheet.write((head + ''.join(rows[n] for n in sorted(rows))).encode('utf-8'))
+
+    def write_row(self, values):
+        """Append the next data row (the 27 values of data_row_values)"""
+        number = FIRST_DATA_ROW + self.rows
+        cells = []
+        for col, value in enumerate(values):
+            ref = f"{self._letters[col]}{number}"
+            if value is None:
+                cells.append(f'<c r="{ref}"{self._style_attrs[col]}/>')
+            else:
+                cells.append(self.cell(ref, self.template.row_styles[col], value))
+        self._buffer.append(f'<row r="{number}">{"".join(cells)}</row>')
+        self.rows += 1
+        if len(self._buffer) >= WRITE_BLOCK_ROWS:
+            self._flush()
+
+    def _flush(self):
+        self._sheet.write(''.join(self._buffer).encode('utf-8'))
+        self._buffer.clear()
+
+    def finish(self, total_values=None, sign_values=None):
+        """Write the Total row onwards, the Sign Format sheet and the other parts"""
+        template = self.template
+        total = template.total_label_row
+        offset = self.offset
+        _, rows, tail = template.article
+        rows = self._patch_rows({n: row for n, row in rows.items() if n >= total},
+                                total_values or {})
+        self._buffer.extend(_move_row(rows[n], total, offset) for n in sorted(rows))
+        self._flush()
+        self._sheet.write(self._article_tail(tail).encode('utf-8'))
+        self._sheet.close()
+        self._sheet = None
+        self._written.add(template.sheets[ARTICLE_SHEET][1])
+
+        head, rows, tail = template.sign
+        rows = self._patch_rows(rows, sign_values or {})
+        sign_part = template.sheets[SIGN_SHEET][1]
+        self._write_part(sign_part, head + ''.join(rows[n] for n in sorted(rows)) + tail)
+
+        # Styles and strings last: the sheets above may have added to them
+        for info in template.infos:
+            name = info.filename
+            if name in self._written or name == template.calc_chain_part:
+                continue
+            if name == template.workbook_part:
+                self._write_part(name, self._workbook())
+            elif name == template.workbook_rels_part:
+                self._write_part(name, self._workbook_rels())
+            elif name in (template.styles_part, template.strings_part):
+                continue
+            else:
+                self._write_part(name, template.parts[name])
+        if self.styles is not None:
+            self._write_part(template.styles_part, self.styles.patched() or
+                             template.parts[template.styles_part])
+        if template.strings_part in template.parts or self.shared:
+            self._write_part(self._strings_part(), self._shared_strings())
+
+    @property
+    def offset(self):
+        """How far the Total row and the rows below it move down"""
+        return FIRST_DATA_ROW + self.rows - self.template.total_label_row
+
+    def _article_tail(self, tail):
+        total, offset = self.template.total_label_row, self.offset
+
+        def merge_cells(m):
+            kept = []
+            for merged in _MERGE_CELL_RE.finditer(m.group(1)):
+                first = int(_CELL_COORD_RE.search(merged.group(1)).group(2))
+                # Merged ranges in the template's own data rows go with those rows
+                if FIRST_DATA_ROW <= first < total:
+                    continue
+                kept.append(_shift_refs(merged.group(0), total, offset))
+            if not kept:
+                return ''
+            return f'<mergeCells count="{len(kept)}">{"".join(kept)}</mergeCells>'
+
+        tail = _MERGE_CELLS_RE.sub(merge_cells, tail)
+        tail = _ROW_BREAKS_RE.sub(lambda m: _BREAK_ID_RE.sub(
+            lambda b: f"{b.group(1)}{int(b.group(2)) + (offset if int(b.group(2)) >= total else 0)}"
+                      f"{b.group(3)}", m.group(0)), tail)
+        # Conditional formats, validations, hyperlinks, filters, ...
+        return re.sub(r'(<(?!mergeCell\b)\w+\b[^>]*?\s(?:ref|sqref)=")([^"]*)(")',
+                      lambda m: m.group(1) + _shift_refs(m.group(2), total, offset) + m.group(3),
+                      tail)
+
+    # --- package parts ---
+
+    def _zip_info(self, name):
+        info = zipfile.ZipInfo(name, date_time=next(
+            (i.date_time for i in self.template.infos if i.filename == name), (1980, 1, 1, 0, 0, 0)))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        return info
+
+    def _write_part(self, name, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._zip.writestr(self._zip_info(name), data)
+        self._written.add(name)
+
+    def _strings_part(self):
+        return self.template.strings_part or 'xl/sharedStrings.xml'
+
+    def _content_types(self):
+        xml = self.template.text('[Content_Types].xml')
+        if self.template.calc_chain_part:
+            xml = re.sub(rf'<Override\b[^>]*PartName="/{re.escape(self.template.calc_chain_part)}"'
+                         r'[^>]*/>', '', xml)
+        if self.shared and self.template.strings_part is None:
+            xml = xml.replace('</Types>', f'<Override PartName="/{self._strings_part()}" '
+                                          f'ContentType="{SHARED_STRINGS_CONTENT_TYPE}"/></Types>')
+        return xml
+
+    def _workbook_rels(self):
+        xml = self.template.text(self.template.workbook_rels_part)
+        if self.template.calc_chain_part:
+            xml = re.sub(r'<Relationship\b[^>]*Type="[^"]*/calcChain"[^>]*/>', '', xml)
+        if self.shared and self.template.strings_part is None:
+            ids = {int(n) for n in re.findall(r'\sId="rId(\d+)"', xml)}
+            rid = f"rId{max(ids | {0}) + 1}"
+            target = posixpath.relpath(self._strings_part(),
+                                       posixpath.dirname(self.template.workbook_part) or '.')
+            xml = xml.replace('</Relationships>', f'<Relationship Id="{rid}" '
+                                                  f'Type="{SHARED_STRINGS_TYPE}" '
+                                                  f'Target="{target}"/></Relationships>')
+        return xml
+
+    def _workbook(self):
+        """workbook.xml recalculating on load, with article print areas moved"""
+        xml = self.template.text(self.template.workbook_part)
+        sheet_ref = re.compile(rf"('{re.escape(ARTICLE_SHEET)}'!)([^,]*)")
+        total, offset = self.template.total_label_row, self.offset
+
+        def defined_name(m):
+            text = sheet_ref.sub(
+                lambda r: r.group(1) + _shift_refs(r.group(2), total, offset), m.group(2))
+            return f"{m.group(1)}{text}</definedName>"
+
+        xml = re.sub(r'(<definedName\b[^>]*>)(.*?)</definedName>', defined_name, xml, flags=re.S)
+        calc = re.search(r'<calcPr\b[^>]*?/?>', xml)
+        if calc:
+            tag = re.sub(r'\sfullCalcOnLoad="[^"]*"', '', calc.group(0))
+            tag = tag.replace('<calcPr', '<calcPr fullCalcOnLoad="1"', 1)
+            return xml[:calc.start()] + tag + xml[calc.end():]
+        anchor = re.search(r'</definedNames>|<definedNames\b[^>]*/>|</sheets>', xml)
+        return xml[:anchor.end()] + '<calcPr calcId="124519" fullCalcOnLoad="1"/>' + xml[anchor.end():]
+
+    def _shared_strings(self):
+        added = ''.join(f'<si>{_xml_text(text)}</si>' for text in self.strings)
+        part = self.template.strings_part
+        if part not in self.template.parts:
+            count = len(self.strings)
+            return (f'<sst xmlns="{SHEET_MAIN_NS}" count="{self.string_refs}" '
+                    f'uniqueCount="{count}">{added}</sst>')
+        xml = self.template.text(part)
+        if not added:
+            return xml
+        if re.search(r'<sst\b[^>]*/>', xml):
+            xml = re.sub(r'<sst\b([^>]*?)\s*/>', r'<sst\1></sst>', xml, count=1)
+
+        def counts(m):
+            tag = re.sub(r'\suniqueCount="(\d+)"',
+                         lambda c: f' uniqueCount="{int(c.group(1)) + len(self.strings)}"', m.group(0))
+            return _add_count(tag, self.string_refs)
+
+        xml = re.sub(r'<sst\b[^>]*>', counts, xml, count=1)
+        return xml.replace('</sst>', added + '</sst>', 1)